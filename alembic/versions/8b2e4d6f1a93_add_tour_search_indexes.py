@@ -0,0 +1,25 @@
+"""add tour search indexes
+
+Revision ID: 8b2e4d6f1a93
+Revises: 3f1c9a2b7d10
+Create Date: 2026-10-18 14:05:12.204117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6f1a93'
+down_revision = '3f1c9a2b7d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_tours_start_time_id', 'tours', ['start_time', 'id'])
+    op.create_index('ix_tours_price_id', 'tours', ['price', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_tours_price_id', table_name='tours')
+    op.drop_index('ix_tours_start_time_id', table_name='tours')
@@ -0,0 +1,29 @@
+"""widen tour search indexes
+
+Revision ID: a7c3e9d05b42
+Revises: e5b93c7d2a18
+Create Date: 2026-10-18 23:12:40.318245
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9d05b42'
+down_revision = 'e5b93c7d2a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_tours_search_start_time', 'tours', ['start_time', 'id', 'end_time', 'price', 'person_count'])
+    op.create_index('ix_tours_search_price', 'tours', ['price', 'id', 'start_time', 'end_time', 'person_count'])
+    op.drop_index('ix_tours_price_id', table_name='tours')
+    op.drop_index('ix_tours_start_time_id', table_name='tours')
+
+
+def downgrade():
+    op.create_index('ix_tours_start_time_id', 'tours', ['start_time', 'id'])
+    op.create_index('ix_tours_price_id', 'tours', ['price', 'id'])
+    op.drop_index('ix_tours_search_price', table_name='tours')
+    op.drop_index('ix_tours_search_start_time', table_name='tours')
@@ -0,0 +1,30 @@
+"""add tours booked count
+
+Revision ID: c4a7e2f91b36
+Revises: 8b2e4d6f1a93
+Create Date: 2026-10-18 16:21:47.530218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a7e2f91b36'
+down_revision = '8b2e4d6f1a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tours', sa.Column('booked_count', sa.Integer(), nullable=False, server_default='0'))
+    op.execute(
+        'UPDATE tours SET booked_count = ('
+        'SELECT COUNT(*) FROM voucher_customers '
+        'JOIN vouchers ON vouchers.id = voucher_customers.voucher_id '
+        'WHERE vouchers.tour_id = tours.id)'
+    )
+
+
+def downgrade():
+    op.drop_column('tours', 'booked_count')
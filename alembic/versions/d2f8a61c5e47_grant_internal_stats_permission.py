@@ -0,0 +1,60 @@
+"""grant internal stats permission
+
+Revision ID: d2f8a61c5e47
+Revises: c4a7e2f91b36
+Create Date: 2026-10-18 18:42:03.118529
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f8a61c5e47'
+down_revision = 'c4a7e2f91b36'
+branch_labels = None
+depends_on = None
+
+METHOD = 'GET_INTERNAL_STATS'
+
+
+def _bump_permission_matrix(connection):
+    # Running workers reload their permission matrix when this counter moves.
+    result = connection.execute(
+        sa.text("UPDATE table_versions SET version = version + 1 WHERE name = 'permission_roles'"))
+    if result.rowcount == 0:
+        connection.execute(sa.text("INSERT INTO table_versions (name, version) VALUES ('permission_roles', 1)"))
+
+
+def upgrade():
+    connection = op.get_bind()
+    permission_id = connection.execute(
+        sa.text('SELECT id FROM permissions WHERE method = :method'), {'method': METHOD}).scalar()
+    if permission_id is None:
+        connection.execute(sa.text('INSERT INTO permissions (method) VALUES (:method)'), {'method': METHOD})
+        permission_id = connection.execute(
+            sa.text('SELECT id FROM permissions WHERE method = :method'), {'method': METHOD}).scalar()
+
+    # Admins are the role named admin and any role that already holds every other permission.
+    connection.execute(sa.text(
+        'INSERT INTO permission_roles (role_id, permission_id) '
+        'SELECT roles.id, :permission_id FROM roles '
+        'WHERE (roles.name = \'admin\' OR ('
+        'SELECT COUNT(*) FROM permission_roles WHERE permission_roles.role_id = roles.id'
+        ') = (SELECT COUNT(*) FROM permissions WHERE permissions.id != :permission_id)) '
+        'AND NOT EXISTS (SELECT 1 FROM permission_roles '
+        'WHERE permission_roles.role_id = roles.id AND permission_roles.permission_id = :permission_id)'
+    ), {'permission_id': permission_id})
+    _bump_permission_matrix(connection)
+
+
+def downgrade():
+    connection = op.get_bind()
+    permission_id = connection.execute(
+        sa.text('SELECT id FROM permissions WHERE method = :method'), {'method': METHOD}).scalar()
+    if permission_id is None:
+        return
+    connection.execute(sa.text('DELETE FROM permission_roles WHERE permission_id = :permission_id'),
+                       {'permission_id': permission_id})
+    connection.execute(sa.text('DELETE FROM permissions WHERE id = :permission_id'), {'permission_id': permission_id})
+    _bump_permission_matrix(connection)
@@ -0,0 +1,32 @@
+"""create credential_revocations
+
+Revision ID: e5b93c7d2a18
+Revises: d2f8a61c5e47
+Create Date: 2026-10-18 21:34:52.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b93c7d2a18'
+down_revision = 'd2f8a61c5e47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'credential_revocations',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('customer_id', sa.Integer(), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_credential_revocations_revoked_at', 'credential_revocations', ['revoked_at'])
+
+
+def downgrade():
+    op.drop_index('ix_credential_revocations_revoked_at', table_name='credential_revocations')
+    op.drop_table('credential_revocations')
@@ -0,0 +1,48 @@
+from config import db
+
+
+def load_association_ids(parent_column, child_column, parent_ids):
+    ids_by_parent = {parent_id: [] for parent_id in parent_ids}
+    if not ids_by_parent:
+        return ids_by_parent
+
+    rows = db.session.query(parent_column, child_column) \
+        .filter(parent_column.in_(ids_by_parent)) \
+        .order_by(parent_column, child_column)
+    for parent_id, child_id in rows:
+        ids_by_parent[parent_id].append(child_id)
+    return ids_by_parent
+
+
+def attach_association_ids(dtos, field, parent_column, child_column):
+    # One IN query for the whole page instead of one query per row.
+    ids_by_parent = load_association_ids(parent_column, child_column, [dto['id'] for dto in dtos])
+    for dto in dtos:
+        dto[field] = ids_by_parent[dto['id']]
+    return dtos
+
+
+def insert_association_ids(model, parent_column, child_column, parent_id, child_ids):
+    if child_ids:
+        db.session.execute(model.__table__.insert().values([
+            {parent_column.key: parent_id, child_column.key: child_id} for child_id in sorted(child_ids)
+        ]))
+
+
+def replace_association_ids(model, parent_column, child_column, parent_id, child_ids):
+    # Diffs the stored links against child_ids and applies it with at most one DELETE ... IN and one
+    # multi-row INSERT, leaving the commit to the caller so the whole write stays in one transaction.
+    child_ids = set(child_ids)
+    existing_ids = {child_id for (child_id,) in db.session.query(child_column).filter(parent_column == parent_id)}
+
+    removed_ids = existing_ids - child_ids
+    if removed_ids:
+        db.session.query(model) \
+            .filter(parent_column == parent_id) \
+            .filter(child_column.in_(removed_ids)) \
+            .delete(synchronize_session=False)
+
+    new_ids = child_ids - existing_ids
+    insert_association_ids(model, parent_column, child_column, parent_id, new_ids)
+
+    return removed_ids, new_ids
@@ -1,72 +1,240 @@
 import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from datetime import datetime, timedelta
 
 from flask import request, jsonify
 from flask_bcrypt import check_password_hash
 
-from config import db
-from model import Customer, Permission
+from cache import TTLCache
+from config import app, db
+from instrumentation import timing
+from model import CredentialRevocation, Customer, Permission, PermissionRoles
+from versions import get_version, table_versions
+
+PERMISSION_MATRIX_VERSION = 'permission_roles'
+
+# Every permission method passed to @auth, collected at import time (used to seed admin roles).
+api_permissions = set()
+
+
+class CredentialCache:
+    # Entries are keyed on an HMAC of the Basic token so plaintext credentials never sit in memory. Writers that
+    # change a customer's credentials record a CredentialRevocation in their transaction; when another worker sees
+    # the credential_revocations counter move, it drops the cached credentials of just those customers.
+    def __init__(self, max_size, ttl_seconds, revocation_lag_seconds):
+        self._secret = os.urandom(32)
+        self._entries = TTLCache(max_size, ttl_seconds)
+        self.revocation_lag_seconds = revocation_lag_seconds
+        self.revocations_version = None
+        self._revocations_synced_at = None
+        self._sync_lock = threading.Lock()
+
+    def _digest(self, token):
+        return hmac.new(self._secret, token.encode('utf8'), hashlib.sha256).digest()
+
+    def sync_revocations(self):
+        # Returns the revocations version the cache is now in sync with. Revocations are read by time rather than
+        # id, since ids are handed out at insert but a later id can commit first: rows from revocation_lag_seconds
+        # before the previous sync are read again, which at worst drops an entry cached after its revocation.
+        version = table_versions.get((CredentialRevocation.__tablename__,))[0]
+        if version == self.revocations_version:
+            return version
+        with self._sync_lock:
+            if version != self.revocations_version:
+                synced_at = datetime.utcnow()
+                if self._revocations_synced_at is not None:
+                    since = self._revocations_synced_at - timedelta(seconds=self.revocation_lag_seconds)
+                    customer_ids = {customer_id for (customer_id,) in db.session.query(CredentialRevocation.customer_id)
+                                    .filter(CredentialRevocation.revoked_at >= since)}
+                    if customer_ids:
+                        self._entries.invalidate(lambda entry: entry[0] in customer_ids)
+                self._revocations_synced_at = synced_at
+                self.revocations_version = version
+        return version
+
+    def get(self, token):
+        return self._entries.get(self._digest(token))
+
+    def put(self, token, customer_id, role_id, revocations_version):
+        # A revocation synced since the customer row was read may have been for this customer, so the possibly stale
+        # credentials are not cached; the next request verifies them again.
+        if revocations_version == self.revocations_version:
+            self._entries.set(self._digest(token), (customer_id, role_id))
+
+    def invalidate_customer(self, customer_id):
+        return self._entries.invalidate(lambda entry: entry[0] == customer_id)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return self._entries.stats()
+
+
+class PermissionMatrix:
+    # role_id -> frozenset of permission methods, kept in sync with the PERMISSION_MATRIX_VERSION counter.
+    def __init__(self, check_interval_seconds):
+        self.check_interval_seconds = check_interval_seconds
+        self.version = None
+        self._methods_by_role = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_methods(role_ids=None):
+        query = db.session.query(PermissionRoles.role_id, Permission.method) \
+            .join(Permission, Permission.id == PermissionRoles.permission_id)
+        if role_ids is not None:
+            query = query.filter(PermissionRoles.role_id.in_(role_ids))
+
+        methods_by_role = {}
+        for role_id, method in query:
+            methods_by_role.setdefault(role_id, set()).add(method)
+        return {role_id: frozenset(methods) for role_id, methods in methods_by_role.items()}
+
+    def load(self):
+        with self._lock:
+            version = get_version(PERMISSION_MATRIX_VERSION)
+            self._methods_by_role = self._load_methods()
+            self.version = version
+            self._checked_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if self._methods_by_role is None:
+            self.load()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval_seconds:
+            return
+        self._checked_at = now
+        if get_version(PERMISSION_MATRIX_VERSION) != self.version:
+            self.load()
+
+    def has_permission(self, role_id, method):
+        self._ensure_fresh()
+        return method in self._methods_by_role.get(role_id, ())
+
+    def refresh_roles(self, role_ids, version):
+        # Called after a committed write that bumped the version to `version`. Anything but the next
+        # consecutive version means another worker wrote in between, so a full reload is required. None means
+        # nothing was committed.
+        if version is None:
+            return
+        if self._methods_by_role is None or self.version is None or version != self.version + 1:
+            self.load()
+            return
+        role_ids = set(role_ids)
+        with self._lock:
+            methods_by_role = {role_id: methods for role_id, methods in self._methods_by_role.items()
+                               if role_id not in role_ids}
+            methods_by_role.update(self._load_methods(role_ids))
+            self._methods_by_role = methods_by_role
+            self.version = version
+
+    def refresh_permission(self, permission_id, version):
+        if version is None:
+            return
+        role_ids = [permission_role.role_id for permission_role in
+                    db.session.query(PermissionRoles.role_id).filter_by(permission_id=permission_id)]
+        self.refresh_roles(role_ids, version)
+
+
+credential_cache = CredentialCache(app.config['AUTH_CACHE_MAX_SIZE'], app.config['AUTH_CACHE_TTL_SECONDS'],
+                                   app.config['CREDENTIAL_REVOCATION_LAG_SECONDS'])
+permission_matrix = PermissionMatrix(app.config['PERMISSION_MATRIX_CHECK_INTERVAL_SECONDS'])
+
+
+def revoke_credentials(customer_id):
+    # Called in the transaction that changes the customer, so the revocation commits or rolls back with it. Rows
+    # older than the TTL plus the lag can no longer match a cached entry and are pruned on the way.
+    now = datetime.utcnow()
+    retention = timedelta(seconds=credential_cache.revocation_lag_seconds + app.config['AUTH_CACHE_TTL_SECONDS'])
+    db.session.query(CredentialRevocation).filter(CredentialRevocation.revoked_at < now - retention) \
+        .delete(synchronize_session=False)
+    db.session.add(CredentialRevocation(customer_id=customer_id, revoked_at=now))
+
+
+def check_auth(api_permission):
+    headers = request.headers
+    auth_header = headers.get('Authorization')
+    if auth_header is None:
+        res = jsonify({'message': 'Missing Authorization header!'})
+        res.status_code = 401
+        return res
+
+    basic_auth_token_parts = auth_header.split(' ')
+
+    if len(basic_auth_token_parts) != 2 or basic_auth_token_parts[0] != 'Basic':
+        res = jsonify({'message': 'Invalid Basic Auth token!'})
+        res.status_code = 401
+        return res
+
+    encoded_credentials = basic_auth_token_parts[1]
+    # Synced before the customer row is read, so put() can tell whether a revocation arrived in between.
+    revocations_version = credential_cache.sync_revocations()
+    cached_credentials = credential_cache.get(encoded_credentials)
+    if cached_credentials is not None:
+        role_id = cached_credentials[1]
+    else:
+        try:
+            decoded = str(base64.b64decode(encoded_credentials), 'utf8')
+        except Exception:
+            res = jsonify({'message': 'Failed decode base64 payload of Basic Auth token!'})
+            res.status_code = 401
+            return res
+
+        decoded_token_parts = decoded.split(':')
+        if len(decoded_token_parts) != 2:
+            res = jsonify({'message': 'Invalid Basic Auth token payload!'})
+            res.status_code = 401
+            return res
+
+        username = decoded_token_parts[0]
+        password = decoded_token_parts[1]
+
+        customer = db.session.query(Customer.id, Customer.password_hash, Customer.role_id) \
+            .filter_by(username=username).first()
+        if customer is None:
+            res = jsonify({'message': 'Invalid username!'})
+            res.status_code = 401
+            return res
+
+        # bcrypt releases the GIL while it hashes, so a cold login holds up only its own request thread.
+        with timing('auth_bcrypt'):
+            is_valid_password = check_password_hash(customer.password_hash, password)
+        if not is_valid_password:
+            res = jsonify({'message': 'Invalid password!'})
+            res.status_code = 401
+            return res
+
+        role_id = customer.role_id
+        credential_cache.put(encoded_credentials, customer.id, role_id, revocations_version)
+
+    with timing('auth_permission'):
+        have_permission = permission_matrix.has_permission(role_id, api_permission)
+
+    if not have_permission:
+        res = jsonify({'message': 'Customer is not authorized to call this API!'})
+        res.status_code = 403
+        return res
+
+    return None
 
 
 def auth(api_permission):
+    api_permissions.add(api_permission)
+
     def create_auth_handler(api_method_func):
         def process_auth(*args, **kwargs):
-            headers = request.headers
-            auth_header = headers.get('Authorization')
-            if auth_header is None:
-                res = jsonify({'message': 'Missing Authorization header!'})
-                res.status_code = 401
-                return res
-
-            basic_auth_token_parts = auth_header.split(' ')
-
-            if len(basic_auth_token_parts) != 2 or basic_auth_token_parts[0] != 'Basic':
-                res = jsonify({'message': 'Invalid Basic Auth token!'})
-                res.status_code = 401
-                return res
-
-            try:
-                encoded_credentials = basic_auth_token_parts[1]
-                decoded = str(base64.b64decode(encoded_credentials), 'utf8')
-            except Exception:
-                res = jsonify({'message': 'Failed decode base64 payload of Basic Auth token!'})
-                res.status_code = 401
-                return res
-
-            decoded_token_parts = decoded.split(':')
-            if len(decoded_token_parts) != 2:
-                res = jsonify({'message': 'Invalid Basic Auth token payload!'})
-                res.status_code = 401
-                return res
-            
-            username = decoded_token_parts[0]
-            password = decoded_token_parts[1]
-            Permission.method = api_permission
-
-            customer = db.session.query(Customer.password_hash, Customer.role_id).filter_by(username=username).first()
-            if customer is None:
-                res = jsonify({'message': 'Invalid username!'})
-                res.status_code = 401
-                return res
+            with timing('auth'):
+                error_response = check_auth(api_permission)
+            if error_response is not None:
+                return error_response
 
-            is_valid_password = check_password_hash(customer.password_hash, password)
-            if not is_valid_password:
-                res = jsonify({'message': 'Invalid password!'})
-                res.status_code = 401
-                return res
-
-            have_permission = db.session.execute(
-                'SELECT EXISTS(SELECT 1 '
-                'FROM permission_roles pr JOIN permissions p ON(p.id = pr.permission_id) '
-                'WHERE pr.role_id = :role_id AND p.method = :method)', {
-                    'role_id': customer.role_id,
-                    'method': api_permission
-                }).fetchall()[0][0]
-
-            if not have_permission:
-                res = jsonify({'message': 'Customer is not authorized to call this API!'})
-                res.status_code = 403
-                return res
-            
             return api_method_func(*args, **kwargs)
 
         return process_auth
@@ -0,0 +1,134 @@
+from flask import request
+from sqlalchemy.exc import IntegrityError
+
+from config import app, db
+
+
+class InvalidBatch(Exception):
+    pass
+
+
+class BatchAssociation:
+    def __init__(self, field, model, parent_column, child_column, target_column):
+        self.field = field
+        self.model = model
+        self.parent_column = parent_column
+        self.child_column = child_column
+        self.target_column = target_column
+
+
+def get_batch_items(max_size=None):
+    items = request.json
+    max_size = max_size or app.config['BATCH_MAX_SIZE']
+    if not isinstance(items, list) or not items or len(items) > max_size:
+        raise InvalidBatch(f'Batch must be a non-empty JSON array of at most {max_size} items!')
+    return items
+
+
+def _created(index, id):
+    return {'index': index, 'status': 201, 'id': id}
+
+
+def _failed(index, status, message):
+    return {'index': index, 'status': status, 'message': message}
+
+
+def _existing_values(column, values):
+    if not values:
+        return set()
+    return {value for (value,) in db.session.query(column).filter(column.in_(values))}
+
+
+def _is_generated(column):
+    return column.primary_key and column.autoincrement in (True, 'auto') and not column.foreign_keys
+
+
+def create_batch(model, items, build_row, unique_fields=(), foreign_keys=(), associations=(), reserve=None):
+    table = model.__table__
+    id_key = model.__mapper__.primary_key[0].key
+    required_keys = [column.key for column in table.columns
+                     if not column.nullable and column.default is None and not _is_generated(column)]
+
+    results = [None] * len(items)
+    rows = {}
+    links = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = _failed(index, 400, 'Batch item must be a JSON object!')
+            continue
+        try:
+            row = build_row(item)
+            item_links = {}
+            for association in associations:
+                item_links[association.field] = {int(child_id) for child_id in item.get(association.field) or ()}
+        except (AttributeError, TypeError, ValueError) as e:
+            results[index] = _failed(index, 400, f'Invalid batch item: {e}')
+            continue
+        missing_keys = [key for key in required_keys if row.get(key) is None]
+        if missing_keys:
+            results[index] = _failed(index, 400, f'Missing required fields: {", ".join(missing_keys)}!')
+            continue
+        rows[index] = row
+        links[index] = item_links
+
+    # Every check below is one IN query for the whole batch rather than one lookup per item.
+    for column, message in unique_fields:
+        existing_values = _existing_values(column, {row[column.key] for row in rows.values()})
+        seen_values = set()
+        for index, row in list(rows.items()):
+            value = row[column.key]
+            if value in existing_values or value in seen_values:
+                results[index] = _failed(index, 409, message)
+                del rows[index]
+            else:
+                seen_values.add(value)
+
+    for key, target_column in foreign_keys:
+        existing_ids = _existing_values(target_column, {row[key] for row in rows.values() if row.get(key) is not None})
+        for index, row in list(rows.items()):
+            if row.get(key) is not None and row[key] not in existing_ids:
+                results[index] = _failed(index, 409, 'There is no such father row!!')
+                del rows[index]
+
+    for association in associations:
+        existing_ids = _existing_values(association.target_column, set().union(
+            *(links[index][association.field] for index in rows)))
+        for index in list(rows):
+            if not links[index][association.field] <= existing_ids:
+                results[index] = _failed(index, 409, 'There is no such father row!!')
+                del rows[index]
+
+    if not rows:
+        return results
+
+    try:
+        if reserve is not None:
+            # Runs in the insert transaction, so the reservations of a batch that is rolled back are undone too.
+            for index in list(rows):
+                message = reserve(rows[index], links[index])
+                if message:
+                    results[index] = _failed(index, 409, message)
+                    del rows[index]
+            if not rows:
+                db.session.rollback()
+                return results
+        # MySQL cannot hand back generated ids from a multi-row INSERT, so the rows are inserted in one flush
+        # and the link rows, whose keys are then known, go out as a single executemany.
+        db.session.bulk_insert_mappings(model, list(rows.values()), return_defaults=True)
+        for association in associations:
+            link_rows = [
+                {association.parent_column.key: row[id_key], association.child_column.key: child_id}
+                for index, row in rows.items() for child_id in sorted(links[index][association.field])
+            ]
+            if link_rows:
+                db.session.execute(association.model.__table__.insert(), link_rows)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        for index in rows:
+            results[index] = _failed(index, 409, 'Batch was rolled back because of a conflicting concurrent write!')
+        return results
+
+    for index, row in rows.items():
+        results[index] = _created(index, row[id_key])
+    return results
@@ -3,13 +3,24 @@ from flask_restx import Namespace, Resource
 from werkzeug.exceptions import NotFound
 
 from api.auth import auth
+from api.batch import create_batch, get_batch_items, InvalidBatch
+from api.conditional import conditional
+from api.geo import city_index, CITY_INDEX_VERSION, InvalidGeoParams, get_point, get_radius_km, get_k, get_limit, \
+    find_nearby, find_nearest, dump_located
+from api.pagination import paginate, page_response, InvalidPageParams
+from api.projection import get_fields, load_fields, InvalidFields
+from api.reference_cache import create_reference_cache
+from api.response_cache import cached_response
 from config import api, db
-from model import City
-from schema import city_model, city_schema, cities_schema
+from model import City, Country
+from schema import city_model, city_schema, cities_schema, batch_result_model
+from versions import committed_version, mark_written
 
 ns = Namespace('cities', description='CRUD operations for City essence')
 api.add_namespace(ns)
 
+city_cache = create_reference_cache(City, city_schema)
+
 
 @ns.route('/post')
 class CreateCity(Resource):
@@ -31,7 +42,10 @@ class CreateCity(Resource):
         )
         try:
             db.session.add(city)
+            db.session.flush()
+            mark_written(CITY_INDEX_VERSION)
             db.session.commit()
+            city_index.refresh([city.id], committed_version(CITY_INDEX_VERSION))
         except Exception as e:
             orig = e.orig
             if orig:
@@ -53,34 +67,149 @@ class CreateCity(Resource):
         return res
 
 
+def build_city_row(json):
+    return {
+        'city_name': json.get('city_name'),
+        'country_id': json.get('country_id'),
+        'city_latitude': json.get('city_latitude'),
+        'city_longitude': json.get('city_longitude'),
+        'details': json.get('details')
+    }
+
+
+@ns.route('/batch')
+class CreateCities(Resource):
+    @ns.expect([city_model])
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully processed batch of Cities', model=[batch_result_model])
+    @ns.response(400, description='Invalid batch!')
+    @ns.response(401, description='Customer is not authenticated!', model=city_model)
+    @ns.response(403, description='Customer is not authorized!', model=city_model)
+    @auth("CREATE_CITY")
+    def post(self):
+        try:
+            items = get_batch_items()
+        except InvalidBatch as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        results = create_batch(
+            City, items, build_city_row,
+            foreign_keys=[('country_id', Country.id)]
+        )
+        # Ids are only reported as created when the batch committed; a rolled back batch has nothing to refresh.
+        created_ids = [result['id'] for result in results if result['status'] == 201]
+        if created_ids:
+            city_index.refresh(created_ids, committed_version(CITY_INDEX_VERSION))
+
+        return jsonify(results)
+
+
 @ns.route('/<int:id>/get')
 class GetCity(Resource):
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get City', model=city_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid fields!')
     @ns.response(404, description='City not found!')
     @ns.response(401, description='Customer is not authenticated!', model=city_model)
     @ns.response(403, description='Customer is not authorized!', model=city_model)
     @auth("GET_CITY_BY_ID")
+    @conditional(City)
     def get(self, id):
         try:
-            city = City.query.get_or_404(id)
-        except NotFound:
+            fields = get_fields(city_schema)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        city_dto = city_cache.get(id)
+        if city_dto is None:
             res = jsonify({'message': 'City not found!'})
             res.status_code = 404
             return res
 
-        return jsonify(city_schema.dump(city))
+        return jsonify(city_schema.project(fields).dump(city_dto))
 
 
 @ns.route('/get')
 class GetCitys(Resource):
+    @ns.param(name='limit', description='Maximum number of items in the page', _in='query', type='integer')
+    @ns.param(name='after', description='Cursor returned as next_cursor by the previous page', _in='query', type='integer')
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get list of Cities', model=city_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid page parameters or fields!')
     @ns.response(401, description='Customer is not authenticated!', model=city_model)
     @ns.response(403, description='Customer is not authorized!', model=city_model)
     @auth("GET_CITIES_LIST")
+    @conditional(City)
+    @cached_response(City)
     def get(self):
-        return jsonify(cities_schema.dump(City.query.all()))
+        try:
+            fields = get_fields(cities_schema)
+            cities, next_cursor = paginate(City.query.options(*load_fields(City, fields)), City.id)
+        except (InvalidPageParams, InvalidFields) as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return page_response(cities_schema.project(fields).dump(cities), next_cursor)
+
+
+@ns.route('/nearby')
+class GetNearbyCities(Resource):
+    @ns.param(name='lat', description='Latitude of the point', _in='query', type='number', required=True)
+    @ns.param(name='lon', description='Longitude of the point', _in='query', type='number', required=True)
+    @ns.param(name='radius_km', description='Search radius in kilometres', _in='query', type='number', required=True)
+    @ns.param(name='limit', description='Maximum number of items (default 100, at most 1000)', _in='query',
+              type='integer')
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully get Cities within the radius, nearest first', model=city_model)
+    @ns.response(400, description='Invalid location parameters!')
+    @ns.response(401, description='Customer is not authenticated!', model=city_model)
+    @ns.response(403, description='Customer is not authorized!', model=city_model)
+    @auth("GET_CITIES_LIST")
+    def get(self):
+        try:
+            latitude, longitude = get_point()
+            radius_km = get_radius_km()
+            limit = get_limit()
+        except InvalidGeoParams as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        located = find_nearby(City, City.id, latitude, longitude, radius_km, limit)
+        return jsonify({'items': dump_located(cities_schema, located)})
+
+
+@ns.route('/nearest')
+class GetNearestCities(Resource):
+    @ns.param(name='lat', description='Latitude of the point', _in='query', type='number', required=True)
+    @ns.param(name='lon', description='Longitude of the point', _in='query', type='number', required=True)
+    @ns.param(name='k', description='Number of Cities to return (default 10)', _in='query', type='integer')
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully get the k nearest Cities, nearest first', model=city_model)
+    @ns.response(400, description='Invalid location parameters!')
+    @ns.response(401, description='Customer is not authenticated!', model=city_model)
+    @ns.response(403, description='Customer is not authorized!', model=city_model)
+    @auth("GET_CITIES_LIST")
+    def get(self):
+        try:
+            latitude, longitude = get_point()
+            k = get_k()
+        except InvalidGeoParams as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        located = find_nearest(City, City.id, latitude, longitude, k)
+        return jsonify({'items': dump_located(cities_schema, located)})
 
 
 @ns.route('/<int:id>/update')
@@ -103,11 +232,14 @@ class UpdateCity(Resource):
             return res
         try:
             city.city_name = json.get('city_name')
-            city.country_id = json.get('country_id'),
+            city.country_id = json.get('country_id')
             city.city_latitude = json.get('city_latitude')
             city.city_longitude = json.get('city_longitude')
             city.details = json.get('details')
+            mark_written(CITY_INDEX_VERSION)
             db.session.commit()
+            city_cache.invalidate(id)
+            city_index.refresh([id], committed_version(CITY_INDEX_VERSION))
         except Exception as e:
             orig = e.orig
             if orig:
@@ -144,7 +276,10 @@ class DeleteCity(Resource):
             return res
         try:
             db.session.delete(city)
+            mark_written(CITY_INDEX_VERSION)
             db.session.commit()
+            city_cache.invalidate(id)
+            city_index.refresh([id], committed_version(CITY_INDEX_VERSION))
         except Exception as e:
             orig = e.orig
             if orig:
@@ -0,0 +1,38 @@
+from functools import wraps
+
+from flask import Response, request
+
+from api.streaming import is_stream_requested
+from versions import table_versions
+
+
+def make_etag(tables):
+    etag = '-'.join(str(version) for version in table_versions.get(tables))
+    # The NDJSON stream is a different representation of the same URL.
+    return f'{etag}-ndjson' if is_stream_requested() else etag
+
+
+def conditional(*models):
+    # Weak ETag made of the version counters of the tables a GET reads (versions.py bumps them on every committed
+    # write), so a matching If-None-Match is answered with 304 before the handler runs a query or the serializer.
+    # The versions are read before the handler, so a write landing in between can only make the ETag older than
+    # the body, never newer.
+    tables = tuple(model.__tablename__ for model in models)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            etag = make_etag(tables)
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+                response.set_etag(etag, weak=True)
+                return response
+
+            response = func(*args, **kwargs)
+            if response.status_code == 200:
+                response.set_etag(etag, weak=True)
+            return response
+
+        return wrapper
+
+    return decorator
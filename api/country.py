@@ -3,13 +3,21 @@ from flask_restx import Namespace, Resource
 from werkzeug.exceptions import NotFound
 
 from api.auth import auth
+from api.batch import create_batch, get_batch_items, InvalidBatch
+from api.conditional import conditional
+from api.pagination import paginate, page_response, InvalidPageParams
+from api.projection import get_fields, load_fields, InvalidFields
+from api.reference_cache import create_reference_cache
+from api.response_cache import cached_response
 from config import api, db
 from model import Country
-from schema import country_model, country_schema, countries_schema
+from schema import country_model, country_schema, countries_schema, batch_result_model
 
 ns = Namespace('countries', description='CRUD operations for Country essence')
 api.add_namespace(ns)
 
+country_cache = create_reference_cache(Country, country_schema)
+
 
 @ns.route('/post')
 class CreateCountry(Resource):
@@ -46,34 +54,91 @@ class CreateCountry(Resource):
         return res
 
 
+def build_country_row(json):
+    return {
+        'country_name': json.get('country_name'),
+        'official_language': json.get('official_language'),
+        'population': json.get('population'),
+        'details': json.get('details')
+    }
+
+
+@ns.route('/batch')
+class CreateCountries(Resource):
+    @ns.expect([country_model])
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully processed batch of Countries', model=[batch_result_model])
+    @ns.response(400, description='Invalid batch!')
+    @ns.response(401, description='Customer is not authenticated!', model=country_model)
+    @ns.response(403, description='Customer is not authorized!', model=country_model)
+    @auth("CREATE_COUNTRY")
+    def post(self):
+        try:
+            items = get_batch_items()
+        except InvalidBatch as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return jsonify(create_batch(
+            Country, items, build_country_row,
+            unique_fields=[(Country.country_name, 'There is already the country with this name!')]
+        ))
+
+
 @ns.route('/<int:id>/get')
 class GetCountry(Resource):
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get Country', model=country_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid fields!')
     @ns.response(404, description='Country not found!')
     @ns.response(401, description='Customer is not authenticated!', model=country_model)
     @ns.response(403, description='Customer is not authorized!', model=country_model)
     @auth("GET_COUNTRY_BY_ID")
+    @conditional(Country)
     def get(self, id):
         try:
-            country = Country.query.get_or_404(id)
-        except NotFound:
+            fields = get_fields(country_schema)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        country_dto = country_cache.get(id)
+        if country_dto is None:
             res = jsonify({'message': 'Country not found!'})
             res.status_code = 404
             return res
 
-        return jsonify(country_schema.dump(country))
+        return jsonify(country_schema.project(fields).dump(country_dto))
 
 
 @ns.route('/get')
 class GetCustomers(Resource):
+    @ns.param(name='limit', description='Maximum number of items in the page', _in='query', type='integer')
+    @ns.param(name='after', description='Cursor returned as next_cursor by the previous page', _in='query', type='integer')
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get list of Countries', model=country_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid page parameters or fields!')
     @ns.response(401, description='Customer is not authenticated!', model=country_model)
     @ns.response(403, description='Customer is not authorized!', model=country_model)
     @auth("GET_COUNTRIES_LIST")
+    @conditional(Country)
+    @cached_response(Country)
     def get(self):
-        return jsonify(countries_schema.dump(Country.query.all()))
+        try:
+            fields = get_fields(countries_schema)
+            countries, next_cursor = paginate(Country.query.options(*load_fields(Country, fields)), Country.id)
+        except (InvalidPageParams, InvalidFields) as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return page_response(countries_schema.project(fields).dump(countries), next_cursor)
 
 
 @ns.route('/<int:id>/update')
@@ -100,6 +165,7 @@ class UpdateCountry(Resource):
             country.population = json.get('population')
             country.details = json.get('details')
             db.session.commit()
+            country_cache.invalidate(id)
         except Exception as e:
             orig = e.orig
             if orig:
@@ -131,6 +197,7 @@ class DeleteCountry(Resource):
         try:
             db.session.delete(country)
             db.session.commit()
+            country_cache.invalidate(id)
         except Exception as e:
             orig = e.orig
             if orig:
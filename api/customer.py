@@ -5,11 +5,17 @@ from flask import Response, request, jsonify
 from flask_restx import Namespace, Resource
 from werkzeug.exceptions import NotFound
 
-from api.auth import auth
-from config import api, db
-from model import Customer
+from api.auth import auth, credential_cache, revoke_credentials
+from api.batch import create_batch, get_batch_items, InvalidBatch
+from api.conditional import conditional
+from api.pagination import paginate, page_response, InvalidPageParams
+from api.projection import get_fields, load_fields, InvalidFields
+from api.streaming import is_stream_requested, stream_response
+from config import api, app, db
+from model import Customer, Role
+from passwords import hash_passwords
 from schema import customer_schema, customer_model, customer_schema_get, customers_schema_get, \
-    customer_model_get
+    customer_model_get, batch_result_model
 
 ns = Namespace('customers', description='CRUD operations for Customer essence')
 api.add_namespace(ns)
@@ -68,34 +74,122 @@ class CreateCustomer(Resource):
         return res
 
 
+def hash_batch_passwords(items):
+    # Every password of the batch is hashed up front on a process pool, one work factor per item but spread over the
+    # cores, and the items are passed on carrying the hash. A missing or non-string password is left out, so the
+    # item fails as missing a required field.
+    passwords = [item.get('password_hash') if isinstance(item, dict) else None for item in items]
+    password_hashes = iter(hash_passwords([password for password in passwords if isinstance(password, str)]))
+    return [{**item, 'password_hash': next(password_hashes) if isinstance(password, str) else None}
+            if isinstance(item, dict) else item for item, password in zip(items, passwords)]
+
+
+def build_customer_row(json):
+    return {
+        'username': json.get('username'),
+        'first_name': json.get('first_name'),
+        'middle_name': json.get('middle_name'),
+        'last_name': json.get('last_name'),
+        'phone': json.get('phone'),
+        'date_of_birthday': datetime.strptime(json.get('date_of_birthday'), "%Y-%m-%d"),
+        'gender': json.get('gender'),
+        'is_covid_vaccinated': json.get('is_covid_vaccinated'),
+        'is_blocked': json.get('is_blocked'),
+        'password_hash': json.get('password_hash'),
+        'role_id': json.get('role_id')
+    }
+
+
+@ns.route('/batch')
+class CreateCustomers(Resource):
+    @ns.expect([customer_model])
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully processed batch of Customers', model=[batch_result_model])
+    @ns.response(400, description='Invalid batch!')
+    @ns.response(401, description='Customer is not authenticated!', model=customer_model)
+    @ns.response(403, description='Customer is not authorized!', model=customer_model)
+    @auth("CREATE_CUSTOMER")
+    def post(self):
+        try:
+            # Far below BATCH_MAX_SIZE: each item costs a bcrypt hash at the full work factor.
+            items = get_batch_items(app.config['CUSTOMER_BATCH_MAX_SIZE'])
+        except InvalidBatch as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return jsonify(create_batch(
+            Customer, hash_batch_passwords(items), build_customer_row,
+            unique_fields=[(Customer.username, 'There is already the customer with this username!')],
+            foreign_keys=[('role_id', Role.id)]
+        ))
+
+
 @ns.route('/<int:id>/get')
 class GetCustomer(Resource):
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get Customer', model=customer_model_get)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid fields!')
     @ns.response(404, description='Customer not found!')
     @ns.response(401, description='Customer is not authenticated!', model=customer_model)
     @ns.response(403, description='Customer is not authorized!', model=customer_model)
     @auth("GET_CUSTOMER_BY_ID")
+    @conditional(Customer)
     def get(self, id):
         try:
-            customer = Customer.query.get_or_404(id)
+            fields = get_fields(customer_schema_get)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        try:
+            customer = Customer.query.options(*load_fields(Customer, fields)).get_or_404(id)
         except NotFound:
             res = jsonify({'message': 'Customer not found!'})
             res.status_code = 404
             return res
 
-        return jsonify(customer_schema_get.dump(customer))
+        return jsonify(customer_schema_get.project(fields).dump(customer))
 
 
 @ns.route('/get')
 class GetCustomers(Resource):
+    @ns.param(name='limit', description='Maximum number of items in the page', _in='query', type='integer')
+    @ns.param(name='after', description='Cursor returned as next_cursor by the previous page', _in='query', type='integer')
+    @ns.param(name='stream', description='Set to 1 to stream every row as NDJSON (same as Accept: application/x-ndjson)',
+              _in='query', type='integer')
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get list of Customers', model=customer_model_get)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid page parameters or fields!')
     @ns.response(401, description='Customer is not authenticated!', model=customer_model)
     @ns.response(403, description='Customer is not authorized!', model=customer_model)
     @auth("GET_CUSTOMERS_LIST")
+    @conditional(Customer)
     def get(self):
-        return jsonify(customers_schema_get .dump(Customer.query.all()))
+        try:
+            fields = get_fields(customers_schema_get)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        query = Customer.query.options(*load_fields(Customer, fields))
+        if is_stream_requested():
+            return stream_response(query.order_by(Customer.id), customer_schema_get.project(fields))
+
+        try:
+            customers, next_cursor = paginate(query, Customer.id)
+        except InvalidPageParams as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return page_response(customers_schema_get.project(fields).dump(customers), next_cursor)
 
 
 @ns.route('/<int:id>/update')
@@ -103,6 +197,7 @@ class UpdateCustomer(Resource):
     @ns.expect(customer_model)
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully updated Customer', model=customer_model)
+    @ns.response(400, description='Missing password_hash!')
     @ns.response(404, description='Customer not found!')
     @ns.response(401, description='Customer is not authenticated!', model=customer_model)
     @ns.response(403, description='Customer is not authorized!', model=customer_model)
@@ -117,6 +212,12 @@ class UpdateCustomer(Resource):
             res.status_code = 404
             return res
 
+        password = json.get('password_hash')
+        if not isinstance(password, str) or not password:
+            res = jsonify({'message': 'Missing password_hash!'})
+            res.status_code = 400
+            return res
+
         try:
             customer.username = json.get('username')
             customer.first_name = json.get('first_name')
@@ -127,9 +228,11 @@ class UpdateCustomer(Resource):
             customer.gender = json.get('gender')
             customer.is_covid_vaccinated = json.get('is_covid_vaccinated')
             customer.is_blocked = json.get('is_blocked')
-            customer.password_hash = json.get('password_hash'),
+            customer.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
             customer.role_id = json.get('role_id')
+            revoke_credentials(id)
             db.session.commit()
+            credential_cache.invalidate_customer(id)
 
         except Exception as e:
             orig = e.orig
@@ -168,7 +271,9 @@ class DeleteCustomer(Resource):
             return res
         try:
             db.session.delete(customer)
+            revoke_credentials(id)
             db.session.commit()
+            credential_cache.invalidate_customer(id)
         except Exception as e:
             orig = e.orig
             if orig:
@@ -3,9 +3,13 @@ from flask_restx import Namespace, Resource
 from werkzeug.exceptions import NotFound
 
 from api.auth import auth
+from api.batch import create_batch, get_batch_items, InvalidBatch
+from api.conditional import conditional
+from api.pagination import paginate, page_response, InvalidPageParams
+from api.projection import get_fields, load_fields, InvalidFields
 from config import api, db
-from model import CustomerAddresses
-from schema import customer_addresses_model, customer_addresses_schema, customer_addressess_schema
+from model import CustomerAddresses, City, Customer
+from schema import customer_addresses_model, customer_addresses_schema, customer_addressess_schema, batch_result_model
 
 ns = Namespace('customer_addresses', description='CRUD operations for Customer addresses essence')
 api.add_namespace(ns)
@@ -54,34 +58,95 @@ class CreateCustomerAddresses(Resource):
         return res
 
 
+def build_customer_addresses_row(json):
+    return {
+        'id': json.get('customer_id'),
+        'city_id': json.get('city_id'),
+        'zip_code': json.get('zip_code'),
+        'street': json.get('street'),
+        'house_number': json.get('house_number'),
+        'apartment_number': json.get('apartment_number')
+    }
+
+
+@ns.route('/batch')
+class CreateCustomerAddressesBatch(Resource):
+    @ns.expect([customer_addresses_model])
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully processed batch of Customer addresses', model=[batch_result_model])
+    @ns.response(400, description='Invalid batch!')
+    @ns.response(401, description='Customer is not authenticated!', model=customer_addresses_model)
+    @ns.response(403, description='Customer is not authorized!', model=customer_addresses_model)
+    @auth("CREATE_CUSTOMER_ADDRESSE")
+    def post(self):
+        try:
+            items = get_batch_items()
+        except InvalidBatch as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return jsonify(create_batch(
+            CustomerAddresses, items, build_customer_addresses_row,
+            unique_fields=[(CustomerAddresses.id, 'There is already address for this customer!!')],
+            foreign_keys=[('id', Customer.id), ('city_id', City.id)]
+        ))
+
+
 @ns.route('/<int:id>/get')
 class GetCustomerAddresses(Resource):
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get Customer addresses', model=customer_addresses_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid fields!')
     @ns.response(404, description='Customer addresses not found!')
     @ns.response(401, description='Customer is not authenticated!', model=customer_addresses_model)
     @ns.response(403, description='Customer is not authorized!', model=customer_addresses_model)
     @auth("GET_CUSTOMER_ADDRESSE_BY_ID")
+    @conditional(CustomerAddresses)
     def get(self, id):
         try:
-            customer_addresses = CustomerAddresses.query.get_or_404(id)
+            fields = get_fields(customer_addresses_schema)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        try:
+            customer_addresses = CustomerAddresses.query.options(*load_fields(CustomerAddresses, fields)).get_or_404(id)
         except NotFound:
             res = jsonify({'message': 'Customer addresses not found!'})
             res.status_code = 404
             return res
 
-        return jsonify(customer_addresses_schema.dump(customer_addresses))
+        return jsonify(customer_addresses_schema.project(fields).dump(customer_addresses))
 
 
 @ns.route('/get')
 class GetCustomerAddressess(Resource):
+    @ns.param(name='limit', description='Maximum number of items in the page', _in='query', type='integer')
+    @ns.param(name='after', description='Cursor returned as next_cursor by the previous page', _in='query', type='integer')
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get list of Customer addressess', model=customer_addresses_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid page parameters or fields!')
     @ns.response(401, description='Customer is not authenticated!', model=customer_addresses_model)
     @ns.response(403, description='Customer is not authorized!', model=customer_addresses_model)
     @auth("GET_CUSTOMER_ADDRESSES_LIST")
+    @conditional(CustomerAddresses)
     def get(self):
-        return jsonify(customer_addressess_schema.dump(CustomerAddresses.query.all()))
+        try:
+            fields = get_fields(customer_addressess_schema)
+            customer_addresses, next_cursor = paginate(
+                CustomerAddresses.query.options(*load_fields(CustomerAddresses, fields)), CustomerAddresses.id)
+        except (InvalidPageParams, InvalidFields) as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return page_response(customer_addressess_schema.project(fields).dump(customer_addresses), next_cursor)
 
 
 @ns.route('/<int:id>/update')
@@ -0,0 +1,200 @@
+import heapq
+from itertools import islice, takewhile
+from math import asin, cos, floor, pi, radians, sin, sqrt
+
+from flask import request
+
+from config import app, db
+from model import City
+from versions import VersionedIndex
+
+CITY_INDEX_VERSION = 'cities'
+EARTH_RADIUS_KM = 6371.0088
+MAX_RADIUS_KM = pi * EARTH_RADIUS_KM
+MAX_CITY_BATCH_SIZE = 1000
+
+
+class InvalidGeoParams(Exception):
+    pass
+
+
+def to_unit_vector(latitude, longitude):
+    latitude, longitude = radians(latitude), radians(longitude)
+    return cos(latitude) * cos(longitude), cos(latitude) * sin(longitude), sin(latitude)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, chord / 2))
+
+
+def km_to_chord(distance_km):
+    return 2 * sin(min(pi, distance_km / EARTH_RADIUS_KM) / 2)
+
+
+def chord_length(a, b):
+    return sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2)
+
+
+class CityGridIndex(VersionedIndex):
+    # Cities bucketed by their unit vector on a uniform 3D grid. Great-circle distance grows monotonically with the
+    # straight-line chord, and a point is at least (d - 1) * cell_size away from any cell d cells from its own, so
+    # radius and nearest queries only visit the cells that can hold a match - with no polar or antimeridian cases.
+    def __init__(self, cell_km, check_interval_seconds):
+        super().__init__(CITY_INDEX_VERSION, check_interval_seconds)
+        self.cell_size = km_to_chord(cell_km)
+        self._cells = {}
+        self._cities = {}
+
+    def _cell_of(self, vector):
+        return tuple(int(floor(coordinate / self.cell_size)) for coordinate in vector)
+
+    def _add(self, city_id, latitude, longitude):
+        vector = to_unit_vector(latitude, longitude)
+        cell = self._cell_of(vector)
+        self._cells.setdefault(cell, {})[city_id] = vector
+        self._cities[city_id] = cell
+
+    def _remove(self, city_id):
+        cell = self._cities.pop(city_id, None)
+        if cell is not None:
+            del self._cells[cell][city_id]
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def _rebuild(self):
+        self._cells = {}
+        self._cities = {}
+        for city_id, latitude, longitude in db.session.query(City.id, City.city_latitude, City.city_longitude):
+            self._add(city_id, latitude, longitude)
+
+    def _apply(self, city_ids):
+        rows = db.session.query(City.id, City.city_latitude, City.city_longitude).filter(City.id.in_(city_ids)).all()
+        for city_id in city_ids:
+            self._remove(city_id)
+        for city_id, latitude, longitude in rows:
+            self._add(city_id, latitude, longitude)
+
+    def _shell(self, center, ring):
+        # Occupied cells exactly `ring` steps (Chebyshev) from center.
+        x, y, z = center
+        cells = []
+        for dx in range(-ring, ring + 1):
+            for dy in range(-ring, ring + 1):
+                for dz in range(-ring, ring + 1) if max(abs(dx), abs(dy)) == ring else (-ring, ring):
+                    if (x + dx, y + dy, z + dz) in self._cells:
+                        cells.append((x + dx, y + dy, z + dz))
+        return cells
+
+    def iter_nearest(self, latitude, longitude):
+        # Yields (distance_km, city_id) in distance order, widening one ring of cells at a time: after rings 0..r
+        # every unvisited city is at least r * cell_size away, so closer candidates can be yielded safely. Once a
+        # ring's cube outgrows the number of occupied cells, the remaining cells are taken in one pass instead.
+        self.ensure_fresh()
+        point = to_unit_vector(latitude, longitude)
+        center = self._cell_of(point)
+        candidates = []
+        ring = 0
+        while True:
+            with self._lock:
+                is_last_ring = (2 * ring + 1) ** 3 >= len(self._cells)
+                if is_last_ring:
+                    cells = [cell for cell in self._cells if max(abs(a - b) for a, b in zip(cell, center)) >= ring]
+                else:
+                    cells = self._shell(center, ring)
+                for cell in cells:
+                    for city_id, vector in self._cells[cell].items():
+                        heapq.heappush(candidates, (chord_length(point, vector), city_id))
+            if is_last_ring:
+                break
+            bound = ring * self.cell_size
+            while candidates and candidates[0][0] <= bound:
+                chord, city_id = heapq.heappop(candidates)
+                yield chord_to_km(chord), city_id
+            ring += 1
+        while candidates:
+            chord, city_id = heapq.heappop(candidates)
+            yield chord_to_km(chord), city_id
+
+    def nearest(self, latitude, longitude, k):
+        return list(islice(self.iter_nearest(latitude, longitude), k))
+
+
+city_index = CityGridIndex(app.config['GEO_INDEX_CELL_KM'], app.config['GEO_INDEX_CHECK_INTERVAL_SECONDS'])
+
+
+def get_point():
+    try:
+        latitude = float(request.args['lat'])
+        longitude = float(request.args['lon'])
+    except (KeyError, ValueError):
+        raise InvalidGeoParams('lat and lon are required numbers!')
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise InvalidGeoParams('lat must be between -90 and 90 and lon between -180 and 180!')
+    return latitude, longitude
+
+
+def get_radius_km():
+    try:
+        radius_km = float(request.args['radius_km'])
+    except (KeyError, ValueError):
+        raise InvalidGeoParams('radius_km is a required number!')
+    if not 0 <= radius_km <= MAX_RADIUS_KM:
+        raise InvalidGeoParams(f'radius_km must be between 0 and {MAX_RADIUS_KM:.0f}!')
+    return radius_km
+
+
+def get_count(name, default):
+    max_count = app.config['PAGE_MAX_LIMIT']
+    try:
+        count = int(request.args.get(name, default))
+    except ValueError:
+        raise InvalidGeoParams(f'{name} must be an integer!')
+    if count < 1 or count > max_count:
+        raise InvalidGeoParams(f'{name} must be between 1 and {max_count}!')
+    return count
+
+
+def get_k():
+    return get_count('k', 10)
+
+
+def get_limit():
+    return get_count('limit', app.config['PAGE_DEFAULT_LIMIT'])
+
+
+def load_nearest(model, city_column, nearest_cities, limit):
+    # [(row, distance_km)] for at most `limit` rows of model, ordered by distance then id. Every row in a city shares
+    # its distance, so consuming cities in distance order until `limit` rows are found is exact. Cities are looked up
+    # in batches doubling up to MAX_CITY_BATCH_SIZE, reading only (id, city) pairs, and just the rows that made the
+    # cut are loaded in full.
+    located_ids = []
+    batch_size = min(limit, MAX_CITY_BATCH_SIZE)
+    while len(located_ids) < limit:
+        city_distances = {city_id: distance for distance, city_id in islice(nearest_cities, batch_size)}
+        if not city_distances:
+            break
+        pairs = db.session.query(model.id, city_column).filter(city_column.in_(list(city_distances)))
+        located_ids.extend(sorted((city_distances[city_id], row_id) for row_id, city_id in pairs))
+        batch_size = min(batch_size * 2, MAX_CITY_BATCH_SIZE)
+    located_ids = located_ids[:limit]
+    if not located_ids:
+        return []
+    rows = {row.id: row for row in model.query.filter(model.id.in_([row_id for _, row_id in located_ids]))}
+    return [(rows[row_id], distance) for distance, row_id in located_ids if row_id in rows]
+
+
+def find_nearby(model, city_column, latitude, longitude, radius_km, limit):
+    nearest_cities = city_index.iter_nearest(latitude, longitude)
+    return load_nearest(model, city_column, takewhile(lambda distance_city: distance_city[0] <= radius_km,
+                                                      nearest_cities), limit)
+
+
+def find_nearest(model, city_column, latitude, longitude, k):
+    return load_nearest(model, city_column, city_index.iter_nearest(latitude, longitude), k)
+
+
+def dump_located(schema, located):
+    dtos = schema.dump([row for row, _ in located])
+    for dto, (_, distance_km) in zip(dtos, located):
+        dto['distance_km'] = round(distance_km, 3)
+    return dtos
@@ -3,13 +3,23 @@ from flask_restx import Namespace, Resource
 from werkzeug.exceptions import NotFound
 
 from api.auth import auth
+from api.batch import create_batch, get_batch_items, InvalidBatch
+from api.conditional import conditional
+from api.geo import InvalidGeoParams, get_point, get_radius_km, get_k, get_limit, find_nearby, find_nearest, \
+    dump_located
+from api.pagination import paginate, page_response, InvalidPageParams
+from api.projection import get_fields, load_fields, InvalidFields
+from api.reference_cache import create_reference_cache
+from api.response_cache import cached_response
 from config import api, db
-from model import Hotel
-from schema import hotel_model, hotel_schema, hotels_schema
+from model import Hotel, City
+from schema import hotel_model, hotel_schema, hotels_schema, batch_result_model
 
 ns = Namespace('hotels', description='CRUD operations for Hotel addresses essence')
 api.add_namespace(ns)
 
+hotel_cache = create_reference_cache(Hotel, hotel_schema)
+
 
 @ns.route('/post')
 class CreateHotel(Resource):
@@ -54,34 +64,143 @@ class CreateHotel(Resource):
         return res
 
 
+def build_hotel_row(json):
+    return {
+        'name': json.get('name'),
+        'hotel_class': json.get('hotel_class'),
+        'city_id': json.get('city_id'),
+        'is_animals_allowed': json.get('is_animals_allowed'),
+        'details': json.get('details')
+    }
+
+
+@ns.route('/batch')
+class CreateHotels(Resource):
+    @ns.expect([hotel_model])
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully processed batch of Hotels', model=[batch_result_model])
+    @ns.response(400, description='Invalid batch!')
+    @ns.response(401, description='Customer is not authenticated!', model=hotel_model)
+    @ns.response(403, description='Customer is not authorized!', model=hotel_model)
+    @auth("CREATE_HOTEL")
+    def post(self):
+        try:
+            items = get_batch_items()
+        except InvalidBatch as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return jsonify(create_batch(
+            Hotel, items, build_hotel_row,
+            foreign_keys=[('city_id', City.id)]
+        ))
+
+
 @ns.route('/<int:id>/get')
 class GetHotel(Resource):
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get Hotel', model=hotel_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid fields!')
     @ns.response(404, description='Hotel not found!')
     @ns.response(401, description='Customer is not authenticated!', model=hotel_model)
     @ns.response(403, description='Customer is not authorized!', model=hotel_model)
     @auth("GET_HOTEL_BY_ID")
+    @conditional(Hotel)
     def get(self, id):
         try:
-            hotel = Hotel.query.get_or_404(id)
-        except NotFound:
+            fields = get_fields(hotel_schema)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        hotel_dto = hotel_cache.get(id)
+        if hotel_dto is None:
             res = jsonify({'message': 'Hotel not found!'})
             res.status_code = 404
             return res
 
-        return jsonify(hotel_schema.dump(hotel))
+        return jsonify(hotel_schema.project(fields).dump(hotel_dto))
 
 
 @ns.route('/get')
 class GetHotels(Resource):
+    @ns.param(name='limit', description='Maximum number of items in the page', _in='query', type='integer')
+    @ns.param(name='after', description='Cursor returned as next_cursor by the previous page', _in='query', type='integer')
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get list of Hotels', model=hotel_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid page parameters or fields!')
     @ns.response(401, description='Customer is not authenticated!', model=hotel_model)
     @ns.response(403, description='Customer is not authorized!', model=hotel_model)
     @auth("GET_HOTELS_LIST")
+    @conditional(Hotel)
+    @cached_response(Hotel)
     def get(self):
-        return jsonify(hotels_schema.dump(Hotel.query.all()))
+        try:
+            fields = get_fields(hotels_schema)
+            hotels, next_cursor = paginate(Hotel.query.options(*load_fields(Hotel, fields)), Hotel.id)
+        except (InvalidPageParams, InvalidFields) as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return page_response(hotels_schema.project(fields).dump(hotels), next_cursor)
+
+
+@ns.route('/nearby')
+class GetNearbyHotels(Resource):
+    @ns.param(name='lat', description='Latitude of the point', _in='query', type='number', required=True)
+    @ns.param(name='lon', description='Longitude of the point', _in='query', type='number', required=True)
+    @ns.param(name='radius_km', description='Search radius in kilometres', _in='query', type='number', required=True)
+    @ns.param(name='limit', description='Maximum number of items (default 100, at most 1000)', _in='query',
+              type='integer')
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully get Hotels in Cities within the radius, nearest first', model=hotel_model)
+    @ns.response(400, description='Invalid location parameters!')
+    @ns.response(401, description='Customer is not authenticated!', model=hotel_model)
+    @ns.response(403, description='Customer is not authorized!', model=hotel_model)
+    @auth("GET_HOTELS_LIST")
+    def get(self):
+        try:
+            latitude, longitude = get_point()
+            radius_km = get_radius_km()
+            limit = get_limit()
+        except InvalidGeoParams as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        located = find_nearby(Hotel, Hotel.city_id, latitude, longitude, radius_km, limit)
+        return jsonify({'items': dump_located(hotels_schema, located)})
+
+
+@ns.route('/nearest')
+class GetNearestHotels(Resource):
+    @ns.param(name='lat', description='Latitude of the point', _in='query', type='number', required=True)
+    @ns.param(name='lon', description='Longitude of the point', _in='query', type='number', required=True)
+    @ns.param(name='k', description='Number of Hotels to return (default 10)', _in='query', type='integer')
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully get the k nearest Hotels by City location, nearest first', model=hotel_model)
+    @ns.response(400, description='Invalid location parameters!')
+    @ns.response(401, description='Customer is not authenticated!', model=hotel_model)
+    @ns.response(403, description='Customer is not authorized!', model=hotel_model)
+    @auth("GET_HOTELS_LIST")
+    def get(self):
+        try:
+            latitude, longitude = get_point()
+            k = get_k()
+        except InvalidGeoParams as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        located = find_nearest(Hotel, Hotel.city_id, latitude, longitude, k)
+        return jsonify({'items': dump_located(hotels_schema, located)})
 
 
 @ns.route('/<int:id>/update')
@@ -109,6 +228,7 @@ class UpdateHotel(Resource):
             hotel.is_animals_allowed = json.get('is_animals_allowed')
             hotel.details = json.get('details')
             db.session.commit()
+            hotel_cache.invalidate(id)
         except Exception as e:
             orig = e.orig
             if orig:
@@ -146,4 +266,5 @@ class DeleteHotel(Resource):
             return res
         db.session.delete(hotel)
         db.session.commit()
+        hotel_cache.invalidate(id)
         return Response(status=204)
@@ -0,0 +1,136 @@
+from flask import jsonify
+from flask_restx import Namespace, Resource
+
+from api.auth import auth, credential_cache
+from api.reference_cache import reference_caches
+from api.response_cache import response_cache
+from api.transactions import retry_stats
+from config import api, app, db
+from db_pool import pool_stats
+from instrumentation import route_timings
+from metrics import render_metrics, request_metrics
+
+ns = Namespace('internal', description='Internal runtime statistics for capacity tuning')
+api.add_namespace(ns)
+
+
+def collect_db_pool_metrics():
+    stats = pool_stats(db.engine)
+    if 'size' in stats:
+        yield 'db_pool_size', 'gauge', 'Configured connection pool size.', [((), stats['size'])]
+        yield 'db_pool_checked_out', 'gauge', 'Connections currently checked out.', [((), stats['checked_out'])]
+        yield 'db_pool_checked_in', 'gauge', 'Idle connections in the pool.', [((), stats['checked_in'])]
+        yield 'db_pool_overflow', 'gauge', 'Overflow connections currently open.', [((), stats['overflow'])]
+    if 'checkouts' in stats:
+        yield 'db_pool_checkouts_total', 'counter', 'Successful connection checkouts.', [((), stats['checkouts'])]
+        yield 'db_pool_timeouts_total', 'counter', 'Connection checkouts that timed out.', [((), stats['timeouts'])]
+        yield 'db_pool_wait_seconds_total', 'counter', 'Total time spent waiting for a connection.', \
+            [((), stats['wait_total_ms'] / 1000)]
+
+
+def collect_auth_cache_metrics():
+    stats = credential_cache.stats()
+    yield 'auth_cache_size', 'gauge', 'Verified credentials currently cached.', [((), stats['size'])]
+    yield 'auth_cache_hits_total', 'counter', 'Credential cache hits.', [((), stats['hits'])]
+    yield 'auth_cache_misses_total', 'counter', 'Credential cache misses.', [((), stats['misses'])]
+    yield 'auth_cache_evictions_total', 'counter', 'Credential cache evictions.', [((), stats['evictions'])]
+    yield 'auth_cache_hit_ratio', 'gauge', 'Credential cache hit ratio since start.', [((), stats['hit_ratio'])]
+
+
+def collect_reference_cache_metrics():
+    stats = [cache.stats() for cache in reference_caches]
+
+    def samples(key):
+        return [((('cache', cache_stats['name']),), cache_stats[key]) for cache_stats in stats]
+
+    yield 'reference_cache_size', 'gauge', 'Rows currently cached per reference table.', samples('size')
+    yield 'reference_cache_bytes', 'gauge', 'Encoded size of the rows cached per reference table.', samples('bytes')
+    yield 'reference_cache_hits_total', 'counter', 'Reference cache hits served from this worker.', samples('hits')
+    yield 'reference_cache_store_hits_total', 'counter', 'Reference cache misses served by the shared store.', \
+        samples('store_hits')
+    yield 'reference_cache_misses_total', 'counter', 'Reference cache misses loaded from the database.', samples('misses')
+    yield 'reference_cache_evictions_total', 'counter', 'Reference cache evictions.', samples('evictions')
+    yield 'reference_cache_hit_ratio', 'gauge', 'Reference cache hit ratio since start.', samples('hit_ratio')
+
+
+def collect_response_cache_metrics():
+    stats = response_cache.stats()
+    yield 'response_cache_size', 'gauge', 'Encoded list responses currently cached.', [((), stats['size'])]
+    yield 'response_cache_bytes', 'gauge', 'Total size of the cached response bodies.', [((), stats['bytes'])]
+    yield 'response_cache_hits_total', 'counter', 'Response cache hits.', [((), stats['hits'])]
+    yield 'response_cache_misses_total', 'counter', 'Response cache misses.', [((), stats['misses'])]
+    yield 'response_cache_evictions_total', 'counter', 'Response cache evictions.', [((), stats['evictions'])]
+    yield 'response_cache_hit_ratio', 'gauge', 'Response cache hit ratio since start.', [((), stats['hit_ratio'])]
+
+
+def collect_transaction_retry_metrics():
+    stats = retry_stats.stats()
+    yield 'db_transaction_retries_total', 'counter', 'Transactions replayed after a deadlock or lock wait timeout.', \
+        [((), stats['retries'])]
+    yield 'db_transaction_retries_exhausted_total', 'counter', 'Transactions that failed after their last retry.', \
+        [((), stats['exhausted'])]
+
+
+request_metrics.register_collector(collect_db_pool_metrics)
+request_metrics.register_collector(collect_auth_cache_metrics)
+request_metrics.register_collector(collect_reference_cache_metrics)
+request_metrics.register_collector(collect_response_cache_metrics)
+request_metrics.register_collector(collect_transaction_retry_metrics)
+# At the root where Prometheus expects it, but behind the same permission as the statistics below: scrape it with
+# basic_auth credentials of a role holding GET_INTERNAL_STATS.
+app.add_url_rule('/metrics', 'metrics', auth("GET_INTERNAL_STATS")(render_metrics))
+
+
+@ns.route('/auth-cache')
+class GetAuthCacheStats(Resource):
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully get verified-credential cache statistics')
+    @ns.response(401, description='Customer is not authenticated!')
+    @ns.response(403, description='Customer is not authorized!')
+    @auth("GET_INTERNAL_STATS")
+    def get(self):
+        return jsonify(credential_cache.stats())
+
+
+@ns.route('/reference-caches')
+class GetReferenceCacheStats(Resource):
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully get hit ratio and memory of the reference data caches')
+    @ns.response(401, description='Customer is not authenticated!')
+    @ns.response(403, description='Customer is not authorized!')
+    @auth("GET_INTERNAL_STATS")
+    def get(self):
+        return jsonify([cache.stats() for cache in reference_caches])
+
+
+@ns.route('/response-cache')
+class GetResponseCacheStats(Resource):
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully get hit ratio and memory of the encoded list response cache')
+    @ns.response(401, description='Customer is not authenticated!')
+    @ns.response(403, description='Customer is not authorized!')
+    @auth("GET_INTERNAL_STATS")
+    def get(self):
+        return jsonify(response_cache.stats())
+
+
+@ns.route('/db-pool')
+class GetDbPoolStats(Resource):
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully get database connection pool statistics')
+    @ns.response(401, description='Customer is not authenticated!')
+    @ns.response(403, description='Customer is not authorized!')
+    @auth("GET_INTERNAL_STATS")
+    def get(self):
+        return jsonify(pool_stats(db.engine))
+
+
+@ns.route('/timings')
+class GetRouteTimings(Resource):
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully get per-route timing histograms (empty unless REQUEST_TIMING_ENABLED=1)')
+    @ns.response(401, description='Customer is not authenticated!')
+    @ns.response(403, description='Customer is not authorized!')
+    @auth("GET_INTERNAL_STATS")
+    def get(self):
+        return jsonify(route_timings.to_dict())
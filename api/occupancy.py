@@ -0,0 +1,66 @@
+from config import db
+from model import Tour
+
+
+class TourFullyBooked(Exception):
+    pass
+
+
+class NoSuchTour(Exception):
+    pass
+
+
+def lock_tours(tour_ids):
+    # SELECT ... FOR UPDATE in id order, before any voucher row is written. Inserting a voucher only takes a shared
+    # lock on its tour for the foreign key check, and two bookings that both hold it and then need the exclusive
+    # lock for the seat UPDATE deadlock each other; locking the tour first makes bookings of a tour queue instead.
+    tour_ids = sorted({tour_id for tour_id in tour_ids if isinstance(tour_id, int)})
+    if tour_ids:
+        db.session.query(Tour.id).filter(Tour.id.in_(tour_ids)).order_by(Tour.id).with_for_update().all()
+
+
+def reserve_seats(tour_id, seats):
+    # A conditional UPDATE, so capacity is checked against the locked row itself: the WHERE clause turns away any
+    # booking that would take booked_count past person_count.
+    if not seats:
+        return
+    updated = db.session.query(Tour) \
+        .filter(Tour.id == tour_id) \
+        .filter(Tour.booked_count + seats <= Tour.person_count) \
+        .update({Tour.booked_count: Tour.booked_count + seats}, synchronize_session=False)
+    if not updated:
+        # Only looked up on the rare refusal, to tell a missing tour apart from a full one.
+        if db.session.query(Tour.id).filter(Tour.id == tour_id).first() is None:
+            raise NoSuchTour('There is no such father row!!')
+        raise TourFullyBooked('There are not enough free seats on this tour!')
+
+
+def release_seats(tour_id, seats):
+    if not seats:
+        return
+    db.session.query(Tour) \
+        .filter(Tour.id == tour_id) \
+        .update({Tour.booked_count: Tour.booked_count - seats}, synchronize_session=False)
+
+
+def move_seats(old_tour_id, old_seats, new_tour_id, new_seats):
+    if old_tour_id == new_tour_id:
+        if new_seats > old_seats:
+            reserve_seats(new_tour_id, new_seats - old_seats)
+        else:
+            release_seats(old_tour_id, old_seats - new_seats)
+        return
+    release_seats(old_tour_id, old_seats)
+    reserve_seats(new_tour_id, new_seats)
+
+
+def check_capacity(tour_id):
+    # Flushes the caller's pending tour update first, so the row is locked against concurrent bookings while the
+    # new person_count is compared with the seats already booked.
+    db.session.flush()
+    overbooked = db.session.query(Tour.id) \
+        .filter(Tour.id == tour_id) \
+        .filter(Tour.booked_count > Tour.person_count) \
+        .first()
+    if overbooked:
+        raise TourFullyBooked('Tour already has more booked seats than this person count!')
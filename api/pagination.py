@@ -0,0 +1,98 @@
+import base64
+import json
+from datetime import date
+
+from flask import request, jsonify
+from sqlalchemy import and_, or_
+
+from config import app
+
+
+# JSON types a cursor value may have per python type of the sort column, where it is not that type itself.
+CURSOR_VALUE_TYPES = {float: (int, float)}
+
+
+class InvalidPageParams(Exception):
+    pass
+
+
+def get_page_limit():
+    try:
+        limit = int(request.args.get('limit', app.config['PAGE_DEFAULT_LIMIT']))
+    except ValueError:
+        raise InvalidPageParams('Page limit and after cursor must be integers!')
+
+    max_limit = app.config['PAGE_MAX_LIMIT']
+    if limit < 1 or limit > max_limit:
+        raise InvalidPageParams(f'Page limit must be between 1 and {max_limit}!')
+    return limit
+
+
+def paginate(query, id_column):
+    limit = get_page_limit()
+    try:
+        after = int(request.args.get('after', 0))
+    except ValueError:
+        raise InvalidPageParams('Page limit and after cursor must be integers!')
+
+    # Keyset page: seek past the cursor on the primary key index, fetching one extra row to detect the next page.
+    rows = query.filter(id_column > after).order_by(id_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = getattr(rows[-1], id_column.key)
+    return rows, next_cursor
+
+
+def encode_cursor(value, id):
+    if isinstance(value, date):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, id]).encode('utf8')).decode('ascii')
+
+
+def is_cursor_scalar(value, python_type):
+    # The cursor is client input, so its value must have the JSON type of the sort column before it is compared
+    # with it; bool is an int subclass but never a valid key.
+    if isinstance(value, bool):
+        return python_type is bool
+    return isinstance(value, CURSOR_VALUE_TYPES.get(python_type, python_type))
+
+
+def decode_cursor(cursor, sort_column):
+    try:
+        value, id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        python_type = sort_column.type.python_type
+        if python_type is date:
+            value = date.fromisoformat(value)
+        elif not is_cursor_scalar(value, python_type):
+            raise ValueError(value)
+        if not is_cursor_scalar(id, int):
+            raise ValueError(id)
+        return value, id
+    except (ValueError, TypeError):
+        raise InvalidPageParams('Invalid after cursor!')
+
+
+def paginate_sorted(query, sort_column, id_column, descending=False):
+    # Keyset page over (sort_column, id): the opaque cursor carries both values of the last row, so pages stay
+    # stable for non-unique sort keys and the seek is an index range scan on a (sort_column, id) index.
+    limit = get_page_limit()
+    after = request.args.get('after')
+    if after is not None:
+        value, last_id = decode_cursor(after, sort_column)
+        if descending:
+            query = query.filter(or_(sort_column < value, and_(sort_column == value, id_column < last_id)))
+        else:
+            query = query.filter(or_(sort_column > value, and_(sort_column == value, id_column > last_id)))
+
+    order = (sort_column.desc(), id_column.desc()) if descending else (sort_column, id_column)
+    rows = query.order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], sort_column.key), getattr(rows[-1], id_column.key))
+    return rows, next_cursor
+
+
+def page_response(items, next_cursor):
+    return jsonify({'items': items, 'next_cursor': next_cursor})
@@ -2,10 +2,15 @@ from flask import Response, request, jsonify
 from flask_restx import Namespace, Resource
 from werkzeug.exceptions import NotFound
 
-from api.auth import auth
+from api.auth import auth, permission_matrix, PERMISSION_MATRIX_VERSION
+from api.batch import create_batch, get_batch_items, InvalidBatch
+from api.conditional import conditional
+from api.pagination import paginate, page_response, InvalidPageParams
+from api.projection import get_fields, load_fields, InvalidFields
 from config import api, db
 from model import Permission
-from schema import permission_model, permission_schema, permissions_schema
+from schema import permission_model, permission_schema, permissions_schema, batch_result_model
+from versions import committed_version, mark_written
 
 ns = Namespace('permissions', description='CRUD operations for Permission essence')
 api.add_namespace(ns)
@@ -49,34 +54,85 @@ class CreatePermission(Resource):
         return res
 
 
+def build_permission_row(json):
+    return {
+        'method': json.get('method')
+    }
+
+
+@ns.route('/batch')
+class CreatePermissions(Resource):
+    @ns.expect([permission_model])
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully processed batch of Permissions', model=[batch_result_model])
+    @ns.response(400, description='Invalid batch!')
+    @ns.response(401, description='Customer is not authenticated!', model=permission_model)
+    @ns.response(403, description='Customer is not authorized!', model=permission_model)
+    @auth("CREATE_PERMISSION")
+    def post(self):
+        try:
+            items = get_batch_items()
+        except InvalidBatch as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return jsonify(create_batch(Permission, items, build_permission_row))
+
+
 @ns.route('/<int:id>/get')
 class GetPermission(Resource):
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get Permission', model=permission_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid fields!')
     @ns.response(404, description='Permission not found!')
     @ns.response(401, description='Customer is not authenticated!', model=permission_model)
     @ns.response(403, description='Customer is not authorized!', model=permission_model)
     @auth("GET_PERMISSION_BY_ID")
+    @conditional(Permission)
     def get(self, id):
         try:
-            permission = Permission.query.get_or_404(id)
+            fields = get_fields(permission_schema)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        try:
+            permission = Permission.query.options(*load_fields(Permission, fields)).get_or_404(id)
         except NotFound:
             res = jsonify({'message': 'Permission not found!'})
             res.status_code = 404
             return res
 
-        return jsonify(permission_schema.dump(permission))
+        return jsonify(permission_schema.project(fields).dump(permission))
 
 
 @ns.route('/get')
 class GetPermissions(Resource):
+    @ns.param(name='limit', description='Maximum number of items in the page', _in='query', type='integer')
+    @ns.param(name='after', description='Cursor returned as next_cursor by the previous page', _in='query', type='integer')
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get list of Permissions', model=permission_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid page parameters or fields!')
     @ns.response(401, description='Customer is not authenticated!', model=permission_model)
     @ns.response(403, description='Customer is not authorized!', model=permission_model)
     @auth("GET_PERMISSIONS_LIST")
+    @conditional(Permission)
     def get(self):
-        return jsonify(permissions_schema.dump(Permission.query.all()))
+        try:
+            fields = get_fields(permissions_schema)
+            permissions, next_cursor = paginate(Permission.query.options(*load_fields(Permission, fields)), Permission.id)
+        except (InvalidPageParams, InvalidFields) as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return page_response(permissions_schema.project(fields).dump(permissions), next_cursor)
 
 
 @ns.route('/<int:id>/update')
@@ -99,7 +155,9 @@ class UpdatePermission(Resource):
             return res
         try:
             permission.method = json.get('method')
+            mark_written(PERMISSION_MATRIX_VERSION)
             db.session.commit()
+            permission_matrix.refresh_permission(id, committed_version(PERMISSION_MATRIX_VERSION))
         except Exception as e:
             orig = e.orig
             if orig:
@@ -136,7 +194,9 @@ class DeletePermission(Resource):
             return res
         try:
             db.session.delete(permission)
+            mark_written(PERMISSION_MATRIX_VERSION)
             db.session.commit()
+            permission_matrix.refresh_permission(id, committed_version(PERMISSION_MATRIX_VERSION))
         except Exception as e:
             orig = e.orig
             if orig:
@@ -0,0 +1,42 @@
+from flask import request
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only
+
+
+class InvalidFields(Exception):
+    pass
+
+
+def get_fields(schema):
+    # ?fields=name,price as a tuple of schema field names in Meta.fields order, always including id so rows stay
+    # identifiable and association ids can be attached; None without the parameter, meaning every field.
+    value = request.args.get('fields')
+    if value is None:
+        return None
+
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    if not requested or not requested <= set(schema.opts.fields):
+        raise InvalidFields(f'Fields must be a comma-separated list of {", ".join(schema.opts.fields)}!')
+    requested.add('id')
+    return tuple(name for name in schema.opts.fields if name in requested)
+
+
+def is_requested(fields, name):
+    return fields is None or name in fields
+
+
+def load_fields(model, fields, *columns):
+    # Query options loading only the columns behind `fields` (plus the primary key and any `columns` the caller
+    # reads itself, e.g. a sort key for the cursor); properties name their columns in model.property_columns and
+    # fields that are not columns at all, like association ids, load nothing.
+    if fields is None:
+        return []
+
+    column_names = set(inspect(model).column_attrs.keys())
+    property_columns = getattr(model, 'property_columns', {})
+    names = {column.key for column in columns}
+    for name in fields:
+        if name in column_names:
+            names.add(name)
+        names.update(property_columns.get(name, ()))
+    return [load_only(*sorted(names))]
@@ -0,0 +1,26 @@
+from cache import ReadThroughCache, create_store
+from config import app
+from versions import table_versions
+
+# Shared by every reference cache: unset keeps the caches per worker, local:// is the in-process stand-in and a
+# redis:// URL lets workers fill each other's misses.
+reference_store = create_store(app.config['REFERENCE_CACHE_STORE_URL'], app.config['REFERENCE_CACHE_MAX_SIZE'],
+                               app.config['REFERENCE_CACHE_STORE_TTL_SECONDS'])
+reference_caches = []
+
+
+def create_reference_cache(model, schema):
+    # id -> dumped row of a read-mostly table, kept coherent across workers by the table's version counter.
+    table = model.__tablename__
+
+    def load(id):
+        instance = model.query.get(id)
+        return None if instance is None else schema.dump(instance)
+
+    def get_version():
+        return table_versions.get((table,))[0]
+
+    cache = ReadThroughCache(table, load, get_version, app.config['REFERENCE_CACHE_MAX_SIZE'],
+                             app.config['REFERENCE_CACHE_MAX_BYTES'], reference_store)
+    reference_caches.append(cache)
+    return cache
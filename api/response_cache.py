@@ -0,0 +1,46 @@
+from functools import wraps
+
+from flask import Response, request
+
+from api.conditional import make_etag
+from cache import ResponseCache
+from compression import choose_encoding, compress_response
+from config import app
+
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_MAX_SIZE'], app.config['RESPONSE_CACHE_MAX_BYTES'])
+
+
+def cached_response(*models):
+    # Keeps the encoded body of successful responses per path and query string, stamped with the same table
+    # versions as the ETag, so a hit skips the query, the serializer and the JSON encoder and a committed write
+    # to any of the tables retires every entry built from it. Bodies are stored as sent, compressed with the
+    # encoding negotiated for the request, so each encoding is compressed once per version. Goes under @auth and
+    # @conditional.
+    tables = tuple(model.__tablename__ for model in models)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            encoding = choose_encoding()
+            key = (request.path, tuple(sorted(request.args.items(multi=True))), encoding)
+            stamp = make_etag(tables)
+            cached = response_cache.get(key, stamp)
+            if cached is not None:
+                body, mimetype, content_encoding = cached
+                response = Response(body, mimetype=mimetype)
+                response.vary.add('Accept-Encoding')
+                if content_encoding is not None:
+                    response.headers['Content-Encoding'] = content_encoding
+                return response
+
+            response = func(*args, **kwargs)
+            if response.status_code == 200 and not response.is_streamed:
+                compress_response(response, encoding)
+                body = response.get_data()
+                response_cache.set(key, stamp, (body, response.mimetype, response.headers.get('Content-Encoding')),
+                                   len(body))
+            return response
+
+        return wrapper
+
+    return decorator
@@ -4,10 +4,16 @@ from flask import Response, request, jsonify
 from flask_restx import Namespace, Resource
 from werkzeug.exceptions import NotFound
 
-from api.auth import auth
+from api.associations import attach_association_ids, insert_association_ids, replace_association_ids
+from api.auth import auth, permission_matrix, PERMISSION_MATRIX_VERSION
+from api.batch import create_batch, get_batch_items, InvalidBatch, BatchAssociation
+from api.conditional import conditional
+from api.pagination import paginate, page_response, InvalidPageParams
+from api.projection import get_fields, load_fields, is_requested, InvalidFields
 from config import api, db
-from model import Role, PermissionRoles
-from schema import role_model, role_schema, roles_schema
+from model import Role, PermissionRoles, Permission
+from schema import role_model, role_schema, roles_schema, batch_result_model
+from versions import committed_version, mark_written
 
 from sqlalchemy import delete
 
@@ -25,6 +31,7 @@ class CreateRole(Resource):
     @auth("CREATE_ROLE")
     def post(self):
         json = request.json
+        permission_ids = json.get('permission_ids')
 
         try:
             role = Role(
@@ -32,9 +39,15 @@ class CreateRole(Resource):
 
             )
             db.session.add(role)
+            db.session.flush()
+            if permission_ids:
+                insert_association_ids(PermissionRoles, PermissionRoles.role_id, PermissionRoles.permission_id,
+                                       role.id, set(permission_ids))
+                mark_written(PERMISSION_MATRIX_VERSION)
             db.session.commit()
 
         except Exception as e:
+            db.session.rollback()
             orig = e.orig
             if orig:
                 args = orig.args
@@ -44,37 +57,20 @@ class CreateRole(Resource):
                         res = jsonify({'message': 'There is already the role with this name!'})
                         res.status_code = 409
                         return res
+                    if 'Duplicate entry' in error_message:
+                        res = jsonify({'message': 'There is already address for this customer!!'})
+                        res.status_code = 409
+                        return res
+                if len(args) >= 2 and args[0] == 1452:
+                    error_message = args[1]
+                    if 'Cannot add or update a child row' in error_message:
+                        res = jsonify({'message': 'There is no such father row!!'})
+                        res.status_code = 409
+                        return res
             raise e
 
-        role_id = role.id
-        permission_ids = json.get('permission_ids')
-
         if permission_ids:
-            for permission_id in set(permission_ids):
-                permission_role = PermissionRoles(
-                    role_id=role_id,
-                    permission_id=permission_id
-                )
-                db.session.add(permission_role)
-            try:
-                db.session.commit()
-            except Exception as e:
-                orig = e.orig
-                if orig:
-                    args = orig.args
-                    if len(args) >= 2 and args[0] == 1062:
-                        error_message = args[1]
-                        if 'Duplicate entry' in error_message:
-                            res = jsonify({'message': 'There is already address for this customer!!'})
-                            res.status_code = 409
-                            return res
-                    if len(args) >= 2 and args[0] == 1452:
-                        error_message = args[1]
-                        if 'Cannot add or update a child row' in error_message:
-                            res = jsonify({'message': 'There is no such father row!!'})
-                            res.status_code = 409
-                            return res
-                raise e
+            permission_matrix.refresh_roles([role.id], committed_version(PERMISSION_MATRIX_VERSION))
 
         role.permission_ids = permission_ids
 
@@ -83,40 +79,105 @@ class CreateRole(Resource):
         return res
 
 
+def build_role_row(json):
+    return {
+        'name': json.get('name')
+    }
+
+
+@ns.route('/batch')
+class CreateRoles(Resource):
+    @ns.expect([role_model])
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully processed batch of Roles', model=[batch_result_model])
+    @ns.response(400, description='Invalid batch!')
+    @ns.response(401, description='Customer is not authenticated!', model=role_model)
+    @ns.response(403, description='Customer is not authorized!', model=role_model)
+    @auth("CREATE_ROLE")
+    def post(self):
+        try:
+            items = get_batch_items()
+        except InvalidBatch as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        results = create_batch(
+            Role, items, build_role_row,
+            unique_fields=[(Role.name, 'There is already the role with this name!')],
+            associations=[BatchAssociation('permission_ids', PermissionRoles, PermissionRoles.role_id,
+                                           PermissionRoles.permission_id, Permission.id)]
+        )
+        # Ids are only reported as created when the batch committed; a rolled back batch has nothing to refresh.
+        created_ids = [result['id'] for result in results if result['status'] == 201]
+        if created_ids:
+            permission_matrix.refresh_roles(created_ids, committed_version(PERMISSION_MATRIX_VERSION))
+
+        return jsonify(results)
+
+
 @ns.route('/<int:id>/get')
 class GetRole(Resource):
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get Role', model=role_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid fields!')
     @ns.response(404, description='Role not found!')
     @ns.response(401, description='Customer is not authenticated!', model=role_model)
     @ns.response(403, description='Customer is not authorized!', model=role_model)
     @auth("GET_ROLE_BY_ID")
+    @conditional(Role, PermissionRoles)
     def get(self, id):
         try:
-            role = Role.query.get_or_404(id)
+            fields = get_fields(role_schema)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        try:
+            role = Role.query.options(*load_fields(Role, fields)).get_or_404(id)
         except NotFound:
             res = jsonify({'message': 'Role not found!'})
             res.status_code = 404
             return res
 
-        permission_roles = PermissionRoles.query.filter_by(role_id=id).all()
-        permission_ids = [permission_role.permission_id for permission_role in permission_roles]
-
-        role_dto = role_schema.dump(role)
-        role_dto['permission_ids'] = permission_ids
+        role_dto = role_schema.project(fields).dump(role)
+        if is_requested(fields, 'permission_ids'):
+            permission_roles = PermissionRoles.query.filter_by(role_id=id).all()
+            role_dto['permission_ids'] = [permission_role.permission_id for permission_role in permission_roles]
 
         return jsonify(role_dto)
 
 
 @ns.route('/get')
 class GetRoles(Resource):
+    @ns.param(name='limit', description='Maximum number of items in the page', _in='query', type='integer')
+    @ns.param(name='after', description='Cursor returned as next_cursor by the previous page', _in='query', type='integer')
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get list of Roles', model=role_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid page parameters or fields!')
     @ns.response(401, description='Customer is not authenticated!', model=role_model)
     @ns.response(403, description='Customer is not authorized!', model=role_model)
     @auth("GET_ROLES_LIST")
+    @conditional(Role, PermissionRoles)
     def get(self):
-        return jsonify(roles_schema.dump(Role.query.all()))
+        try:
+            fields = get_fields(roles_schema)
+            roles, next_cursor = paginate(Role.query.options(*load_fields(Role, fields)), Role.id)
+        except (InvalidPageParams, InvalidFields) as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        role_dtos = roles_schema.project(fields).dump(roles)
+        if is_requested(fields, 'permission_ids'):
+            attach_association_ids(role_dtos, 'permission_ids', PermissionRoles.role_id, PermissionRoles.permission_id)
+
+        return page_response(role_dtos, next_cursor)
 
 
 @ns.route('/<int:id>/update')
@@ -139,8 +200,15 @@ class UpdateRole(Resource):
             return res
         try:
             role.name = json.get('name')
+            removed_permissions_ids, new_permissions_ids = replace_association_ids(
+                PermissionRoles, PermissionRoles.role_id, PermissionRoles.permission_id,
+                id, json.get('permission_ids') or ())
+            is_permissions_changed = bool(removed_permissions_ids or new_permissions_ids)
+            if is_permissions_changed:
+                mark_written(PERMISSION_MATRIX_VERSION)
             db.session.commit()
         except Exception as e:
+            db.session.rollback()
             orig = e.orig
             if orig:
                 args = orig.args
@@ -150,30 +218,6 @@ class UpdateRole(Resource):
                         res = jsonify({'message': 'There is already the role with this name!'})
                         res.status_code = 409
                         return res
-            raise e
-        input_permissions_ids = set(json.get('permission_ids'))
-
-        permission_roles = PermissionRoles.query.filter_by(role_id=id).all()
-        existing_permissions_ids = {permission_role.permission_id for permission_role in permission_roles}
-
-        removed_permissions_ids = existing_permissions_ids - input_permissions_ids
-        if removed_permissions_ids:
-            # deleted_attractions = TourAttraction.query.filter_by(
-            #    tour_id=id and TourAttraction.tourist_attractions_id.in_(removed_attractions_ids)).delete()
-            # deleted_attractions = TourAttraction.delete().where(
-            #     TourAttraction.tour_id == id and TourAttraction.tourist_attractions_id.in_(removed_attractions_ids))
-            db.session.query(PermissionRoles).filter(
-                PermissionRoles.role_id == id).filter(PermissionRoles.permission_id.in_(
-                removed_permissions_ids)).delete()
-        # db.session.delete(deleted_attractions)
-        try:
-            db.session.commit()
-        except Exception as e:
-            orig = e.orig
-            if orig:
-                args = orig.args
-                if len(args) >= 2 and args[0] == 1062:
-                    error_message = args[1]
                     if 'Duplicate entry' in error_message:
                         res = jsonify({'message': 'There is already address for this customer!!'})
                         res.status_code = 409
@@ -186,33 +230,8 @@ class UpdateRole(Resource):
                         return res
             raise e
 
-        new_permissions_ids = input_permissions_ids - existing_permissions_ids
-        if new_permissions_ids:
-            for permission_id in new_permissions_ids:
-                permission_role = PermissionRoles(
-                    role_id=id,
-                    permission_id=permission_id
-                )
-                db.session.add(permission_role)
-            try:
-                db.session.commit()
-            except Exception as e:
-                orig = e.orig
-                if orig:
-                    args = orig.args
-                    if len(args) >= 2 and args[0] == 1062:
-                        error_message = args[1]
-                        if 'Duplicate entry' in error_message:
-                            res = jsonify({'message': 'There is already address for this customer!!'})
-                            res.status_code = 409
-                            return res
-                    if len(args) >= 2 and args[0] == 1452:
-                        error_message = args[1]
-                        if 'Cannot add or update a child row' in error_message:
-                            res = jsonify({'message': 'There is no such father row!!'})
-                            res.status_code = 409
-                            return res
-                raise e
+        if is_permissions_changed:
+            permission_matrix.refresh_roles([id], committed_version(PERMISSION_MATRIX_VERSION))
 
         return jsonify(role_schema.dump(role))
 
@@ -234,7 +253,9 @@ class DeleteRole(Resource):
             return res
         try:
             db.session.delete(role)
+            mark_written(PERMISSION_MATRIX_VERSION)
             db.session.commit()
+            permission_matrix.refresh_roles([id], committed_version(PERMISSION_MATRIX_VERSION))
         except Exception as e:
             orig = e.orig
             if orig:
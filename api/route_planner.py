@@ -0,0 +1,158 @@
+from bisect import bisect_left, insort
+from datetime import date, datetime
+
+from flask import request
+
+from config import app, db
+from model import Transportation
+from schema import transportations_schema
+from versions import VersionedIndex
+
+TRANSPORTATION_GRAPH_VERSION = 'transportation'
+
+
+class TransportationGraph(VersionedIndex):
+    # start_city_id -> end_city_id -> [(start day, end day, leg id)] sorted by departure, with days as date ordinals.
+    # Grouping legs by city pair lets a route query stop scanning a pair as soon as departures can no longer beat
+    # the best known arrival at that city.
+    def __init__(self, check_interval_seconds):
+        super().__init__(TRANSPORTATION_GRAPH_VERSION, check_interval_seconds)
+        self._adjacency = {}
+        self._legs = {}
+
+    def _add(self, leg_id, start_city_id, end_city_id, start_time, end_time):
+        if start_city_id is None or end_city_id is None or start_city_id == end_city_id:
+            return
+        leg = (start_time.toordinal(), end_time.toordinal(), leg_id)
+        insort(self._adjacency.setdefault(start_city_id, {}).setdefault(end_city_id, []), leg)
+        self._legs[leg_id] = (start_city_id, end_city_id, leg)
+
+    def _remove(self, leg_id):
+        entry = self._legs.pop(leg_id, None)
+        if entry is None:
+            return
+        start_city_id, end_city_id, leg = entry
+        legs = self._adjacency[start_city_id][end_city_id]
+        del legs[bisect_left(legs, leg)]
+        if not legs:
+            del self._adjacency[start_city_id][end_city_id]
+            if not self._adjacency[start_city_id]:
+                del self._adjacency[start_city_id]
+
+    @staticmethod
+    def _query_legs():
+        return db.session.query(Transportation.id, Transportation.start_city_id, Transportation.end_city_id,
+                                Transportation.start_time, Transportation.end_time)
+
+    def _rebuild(self):
+        self._adjacency = {}
+        self._legs = {}
+        for row in self._query_legs():
+            self._add(*row)
+
+    def _apply(self, leg_ids):
+        rows = self._query_legs().filter(Transportation.id.in_(leg_ids)).all()
+        for leg_id in leg_ids:
+            self._remove(leg_id)
+        for row in rows:
+            self._add(*row)
+
+    def find_routes(self, from_city_id, to_city_id, depart_after, max_legs):
+        # Round-based search (as in RAPTOR): round k finds the earliest arrival at every city using at most k legs,
+        # scanning only cities that improved in round k - 1. Each round that improves the arrival at the destination
+        # contributes one itinerary, so the result is the Pareto front from fewest legs to earliest arrival.
+        # Returns lists of leg ids; a leg may depart on the day the previous one arrives.
+        self.ensure_fresh()
+        unreached = date.max.toordinal() + 1
+        best_arrival = {from_city_id: depart_after.toordinal()}
+        previous_round = {from_city_id: depart_after.toordinal()}
+        parents = []
+        itineraries = []
+        with self._lock:
+            for _ in range(max_legs):
+                current_round = {}
+                round_parents = {}
+                for city_id, ready_at in previous_round.items():
+                    if ready_at >= best_arrival.get(to_city_id, unreached):
+                        continue
+                    for end_city_id, legs in self._adjacency.get(city_id, {}).items():
+                        bound = min(best_arrival.get(end_city_id, unreached), best_arrival.get(to_city_id, unreached))
+                        if ready_at >= bound:
+                            continue
+                        best_leg = None
+                        for index in range(bisect_left(legs, (ready_at,)), len(legs)):
+                            leg = legs[index]
+                            if leg[0] >= bound:
+                                break
+                            if leg[1] < bound:
+                                bound = leg[1]
+                                best_leg = leg
+                        if best_leg is not None:
+                            best_arrival[end_city_id] = best_leg[1]
+                            current_round[end_city_id] = best_leg[1]
+                            round_parents[end_city_id] = (best_leg[2], city_id)
+                parents.append(round_parents)
+                if to_city_id in round_parents:
+                    itineraries.append(self._backtrack(parents, to_city_id))
+                if not current_round:
+                    break
+                previous_round = current_round
+        return itineraries
+
+    @staticmethod
+    def _backtrack(parents, city_id):
+        # A city scanned in round k improved in round k - 1, so each step back moves exactly one round back.
+        leg_ids = []
+        for round_parents in reversed(parents):
+            leg_id, city_id = round_parents[city_id]
+            leg_ids.append(leg_id)
+        return leg_ids[::-1]
+
+
+transportation_graph = TransportationGraph(app.config['ROUTE_GRAPH_CHECK_INTERVAL_SECONDS'])
+
+
+class InvalidRouteParams(Exception):
+    pass
+
+
+def get_route_params():
+    max_legs_limit = app.config['ROUTE_MAX_LEGS']
+    try:
+        from_city_id = int(request.args['from'])
+        to_city_id = int(request.args['to'])
+    except (KeyError, ValueError):
+        raise InvalidRouteParams('from and to are required City ids!')
+    try:
+        depart_after = request.args.get('depart_after')
+        depart_after = datetime.strptime(depart_after, "%Y-%m-%d").date() if depart_after else date.today()
+    except ValueError:
+        raise InvalidRouteParams('depart_after must be a date in YYYY-MM-DD format!')
+    try:
+        max_legs = int(request.args.get('max_legs', 4))
+    except ValueError:
+        raise InvalidRouteParams('max_legs must be an integer!')
+    if max_legs < 1 or max_legs > max_legs_limit:
+        raise InvalidRouteParams(f'max_legs must be between 1 and {max_legs_limit}!')
+    if from_city_id == to_city_id:
+        raise InvalidRouteParams('from and to must be different Cities!')
+    return from_city_id, to_city_id, depart_after, max_legs
+
+
+def plan_routes(from_city_id, to_city_id, depart_after, max_legs):
+    routes = transportation_graph.find_routes(from_city_id, to_city_id, depart_after, max_legs)
+    leg_ids = {leg_id for route in routes for leg_id in route}
+    legs = {leg.id: leg for leg in Transportation.query.filter(Transportation.id.in_(leg_ids))} if leg_ids else {}
+    itineraries = []
+    for route in routes:
+        if not all(leg_id in legs for leg_id in route):
+            # Deleted between the graph lookup and the load; the next query sees the refreshed graph.
+            continue
+        dtos = transportations_schema.dump([legs[leg_id] for leg_id in route])
+        itineraries.append({
+            'legs': dtos,
+            'leg_count': len(dtos),
+            'depart': dtos[0]['start_time'],
+            'arrive': dtos[-1]['end_time']
+        })
+    return itineraries
@@ -0,0 +1,35 @@
+from flask import Response, request, stream_with_context, json
+
+from config import app
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def is_stream_requested():
+    if request.args.get('stream') == '1':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def stream_response(query, schema, decorate_batch=None):
+    # Rows are fetched through a server-side cursor in batches and written out one JSON line at a time,
+    # so neither the ORM objects nor the encoded body of the whole table are ever held in memory.
+    batch_size = app.config['STREAM_BATCH_SIZE']
+
+    def encode(rows):
+        dtos = [schema.dump(row) for row in rows]
+        if decorate_batch is not None:
+            decorate_batch(dtos)
+        return ''.join(json.dumps(dto) + '\n' for dto in dtos)
+
+    def generate():
+        rows = []
+        for row in query.yield_per(batch_size):
+            rows.append(row)
+            if len(rows) == batch_size:
+                yield encode(rows)
+                rows = []
+        if rows:
+            yield encode(rows)
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
@@ -4,10 +4,16 @@ from flask import Response, request, jsonify
 from flask_restx import Namespace, Resource
 from werkzeug.exceptions import NotFound
 
+from api.associations import attach_association_ids, insert_association_ids, replace_association_ids
 from api.auth import auth
+from api.batch import create_batch, get_batch_items, InvalidBatch, BatchAssociation
+from api.conditional import conditional
+from api.occupancy import check_capacity, TourFullyBooked
+from api.pagination import paginate, paginate_sorted, page_response, InvalidPageParams
+from api.projection import get_fields, load_fields, is_requested, InvalidFields
 from config import api, db
-from model import Tour, TourAttraction
-from schema import tour_model, tour_schema, tours_schema
+from model import Tour, TourAttraction, TouristAttraction
+from schema import tour_model, tour_schema, tours_schema, batch_result_model
 
 from sqlalchemy import delete
 
@@ -25,6 +31,7 @@ class CreateTour(Resource):
     @auth("CREATE_TOUR")
     def post(self):
         json = request.json
+        tourist_attraction_ids = json.get('tourist_attraction_ids')
 
         try:
             tour = Tour(
@@ -37,9 +44,14 @@ class CreateTour(Resource):
                 recommended_pocket_money=json.get('recommended_pocket_money')
             )
             db.session.add(tour)
+            db.session.flush()
+            if tourist_attraction_ids:
+                insert_association_ids(TourAttraction, TourAttraction.tour_id, TourAttraction.tourist_attractions_id,
+                                       tour.id, set(tourist_attraction_ids))
             db.session.commit()
 
         except Exception as e:
+            db.session.rollback()
             orig = e.orig
             if orig:
                 args = orig.args
@@ -49,38 +61,18 @@ class CreateTour(Resource):
                         res = jsonify({'message': 'There is already the tour with this name!'})
                         res.status_code = 409
                         return res
+                    if 'Duplicate entry' in error_message:
+                        res = jsonify({'message': 'There is already address for this customer!!'})
+                        res.status_code = 409
+                        return res
+                if len(args) >= 2 and args[0] == 1452:
+                    error_message = args[1]
+                    if 'Cannot add or update a child row' in error_message:
+                        res = jsonify({'message': 'There is no such father row!!'})
+                        res.status_code = 409
+                        return res
             raise e
 
-        tour_id = tour.id
-        tourist_attraction_ids = json.get('tourist_attraction_ids')
-
-        if tourist_attraction_ids:
-            for tourist_attraction_id in set(tourist_attraction_ids):
-                tour_attraction = TourAttraction(
-                    tour_id=tour_id,
-                    tourist_attractions_id=tourist_attraction_id
-                )
-                db.session.add(tour_attraction)
-            try:
-                db.session.commit()
-            except Exception as e:
-                orig = e.orig
-                if orig:
-                    args = orig.args
-                    if len(args) >= 2 and args[0] == 1062:
-                        error_message = args[1]
-                        if 'Duplicate entry' in error_message:
-                            res = jsonify({'message': 'There is already address for this customer!!'})
-                            res.status_code = 409
-                            return res
-                    if len(args) >= 2 and args[0] == 1452:
-                        error_message = args[1]
-                        if 'Cannot add or update a child row' in error_message:
-                            res = jsonify({'message': 'There is no such father row!!'})
-                            res.status_code = 409
-                            return res
-                raise e
-
         tour.tourist_attraction_ids = tourist_attraction_ids
 
         res = jsonify(tour_schema.dump(tour))
@@ -88,40 +80,188 @@ class CreateTour(Resource):
         return res
 
 
+def build_tour_row(json):
+    return {
+        'name': json.get('name'),
+        'price': json.get('price'),
+        'person_count': json.get('person_count'),
+        'start_time': datetime.strptime(json.get('start_time'), "%Y-%m-%d"),
+        'end_time': datetime.strptime(json.get('end_time'), "%Y-%m-%d"),
+        'description': json.get('description'),
+        'recommended_pocket_money': json.get('recommended_pocket_money')
+    }
+
+
+@ns.route('/batch')
+class CreateTours(Resource):
+    @ns.expect([tour_model])
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully processed batch of Tours', model=[batch_result_model])
+    @ns.response(400, description='Invalid batch!')
+    @ns.response(401, description='Customer is not authenticated!', model=tour_model)
+    @ns.response(403, description='Customer is not authorized!', model=tour_model)
+    @auth("CREATE_TOUR")
+    def post(self):
+        try:
+            items = get_batch_items()
+        except InvalidBatch as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return jsonify(create_batch(
+            Tour, items, build_tour_row,
+            unique_fields=[(Tour.name, 'There is already the tour with this name!')],
+            associations=[BatchAssociation('tourist_attraction_ids', TourAttraction, TourAttraction.tour_id,
+                                           TourAttraction.tourist_attractions_id, TouristAttraction.id)]
+        ))
+
+
 @ns.route('/<int:id>/get')
 class GetTour(Resource):
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get Tour', model=tour_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid fields!')
     @ns.response(404, description='Tour not found!')
     @ns.response(401, description='Customer is not authenticated!', model=tour_model)
     @ns.response(403, description='Customer is not authorized!', model=tour_model)
     @auth("GET_TOUR_BY_ID")
+    @conditional(Tour, TourAttraction)
     def get(self, id):
         try:
-            tour = Tour.query.get_or_404(id)
+            fields = get_fields(tour_schema)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        try:
+            tour = Tour.query.options(*load_fields(Tour, fields)).get_or_404(id)
         except NotFound:
             res = jsonify({'message': 'Tour not found!'})
             res.status_code = 404
             return res
 
-        tour_attractions = TourAttraction.query.filter_by(tour_id=id).all()
-        tourist_attractions_ids = [tour_attraction.tourist_attractions_id for tour_attraction in tour_attractions]
-
-        tour_dto = tour_schema.dump(tour)
-        tour_dto['tourist_attraction_ids'] = tourist_attractions_ids
+        tour_dto = tour_schema.project(fields).dump(tour)
+        if is_requested(fields, 'tourist_attraction_ids'):
+            tour_attractions = TourAttraction.query.filter_by(tour_id=id).all()
+            tour_dto['tourist_attraction_ids'] = [tour_attraction.tourist_attractions_id
+                                                  for tour_attraction in tour_attractions]
 
         return jsonify(tour_dto)
 
 
 @ns.route('/get')
 class GetTours(Resource):
+    @ns.param(name='limit', description='Maximum number of items in the page', _in='query', type='integer')
+    @ns.param(name='after', description='Cursor returned as next_cursor by the previous page', _in='query', type='integer')
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get list of Tours', model=tour_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid page parameters or fields!')
     @ns.response(401, description='Customer is not authenticated!', model=tour_model)
     @ns.response(403, description='Customer is not authorized!', model=tour_model)
     @auth("GET_TOURS_LIST")
+    @conditional(Tour, TourAttraction)
     def get(self):
-        return jsonify(tours_schema.dump(Tour.query.all()))
+        try:
+            fields = get_fields(tours_schema)
+            tours, next_cursor = paginate(Tour.query.options(*load_fields(Tour, fields)), Tour.id)
+        except (InvalidPageParams, InvalidFields) as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        tour_dtos = tours_schema.project(fields).dump(tours)
+        if is_requested(fields, 'tourist_attraction_ids'):
+            attach_association_ids(tour_dtos, 'tourist_attraction_ids', TourAttraction.tour_id,
+                                   TourAttraction.tourist_attractions_id)
+
+        return page_response(tour_dtos, next_cursor)
+
+
+TOUR_SEARCH_SORTS = {
+    'start_time': (Tour.start_time, False),
+    '-start_time': (Tour.start_time, True),
+    'price': (Tour.price, False),
+    '-price': (Tour.price, True)
+}
+
+
+def build_tour_search_query(args):
+    query = Tour.query
+    if args.get('start_time'):
+        # Tours overlapping the window: starting before it ends and ending after it starts.
+        query = query.filter(Tour.end_time >= datetime.strptime(args.get('start_time'), "%Y-%m-%d").date())
+    if args.get('end_time'):
+        query = query.filter(Tour.start_time <= datetime.strptime(args.get('end_time'), "%Y-%m-%d").date())
+    if args.get('min_price'):
+        query = query.filter(Tour.price >= int(args.get('min_price')))
+    if args.get('max_price'):
+        query = query.filter(Tour.price <= int(args.get('max_price')))
+    if args.get('min_person_count'):
+        query = query.filter(Tour.person_count >= int(args.get('min_person_count')))
+    return query
+
+
+@ns.route('/search')
+class SearchTours(Resource):
+    @ns.param(name='start_time', description='Start of the date window (YYYY-MM-DD)', _in='query')
+    @ns.param(name='end_time', description='End of the date window (YYYY-MM-DD)', _in='query')
+    @ns.param(name='min_price', description='Minimum price', _in='query', type='integer')
+    @ns.param(name='max_price', description='Maximum price', _in='query', type='integer')
+    @ns.param(name='min_person_count', description='Minimum person count', _in='query', type='integer')
+    @ns.param(name='sort', description='One of start_time, -start_time, price, -price', _in='query')
+    @ns.param(name='limit', description='Maximum number of items in the page', _in='query', type='integer')
+    @ns.param(name='after', description='Cursor returned as next_cursor by the previous page', _in='query')
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully searched Tours', model=tour_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid search parameters!')
+    @ns.response(401, description='Customer is not authenticated!', model=tour_model)
+    @ns.response(403, description='Customer is not authorized!', model=tour_model)
+    @auth("GET_TOURS_LIST")
+    @conditional(Tour, TourAttraction)
+    def get(self):
+        sort = request.args.get('sort', 'start_time')
+        if sort not in TOUR_SEARCH_SORTS:
+            res = jsonify({'message': f'Sort must be one of {", ".join(TOUR_SEARCH_SORTS)}!'})
+            res.status_code = 400
+            return res
+
+        try:
+            fields = get_fields(tours_schema)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        try:
+            query = build_tour_search_query(request.args)
+        except ValueError:
+            res = jsonify({'message': 'Dates must be YYYY-MM-DD and prices and person count integers!'})
+            res.status_code = 400
+            return res
+
+        sort_column, descending = TOUR_SEARCH_SORTS[sort]
+        query = query.options(*load_fields(Tour, fields, sort_column))
+        try:
+            tours, next_cursor = paginate_sorted(query, sort_column, Tour.id, descending)
+        except InvalidPageParams as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        tour_dtos = tours_schema.project(fields).dump(tours)
+        if is_requested(fields, 'tourist_attraction_ids'):
+            attach_association_ids(tour_dtos, 'tourist_attraction_ids', TourAttraction.tour_id,
+                                   TourAttraction.tourist_attractions_id)
+
+        return page_response(tour_dtos, next_cursor)
 
 
 @ns.route('/<int:id>/update')
@@ -130,6 +270,7 @@ class UpdateTour(Resource):
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully updated Tour', model=tour_model)
     @ns.response(404, description='Tour not found!')
+    @ns.response(409, description='Tour already has more booked seats than this person count!')
     @ns.response(401, description='Customer is not authenticated!', model=tour_model)
     @ns.response(403, description='Customer is not authorized!', model=tour_model)
     @auth("UPDATE_TOUR")
@@ -150,8 +291,19 @@ class UpdateTour(Resource):
             tour.end_time = datetime.strptime(json.get('end_time'), "%Y-%m-%d")
             tour.description = json.get('description')
             tour.recommended_pocket_money = json.get('recommended_pocket_money')
+            # A payload without the key leaves the links alone; an explicit null or [] clears them.
+            if 'tourist_attraction_ids' in json:
+                replace_association_ids(TourAttraction, TourAttraction.tour_id, TourAttraction.tourist_attractions_id,
+                                        id, json.get('tourist_attraction_ids') or ())
+            check_capacity(id)
             db.session.commit()
+        except TourFullyBooked as e:
+            db.session.rollback()
+            res = jsonify({'message': str(e)})
+            res.status_code = 409
+            return res
         except Exception as e:
+            db.session.rollback()
             orig = e.orig
             if orig:
                 args = orig.args
@@ -161,30 +313,6 @@ class UpdateTour(Resource):
                         res = jsonify({'message': 'There is already the tour with this name!'})
                         res.status_code = 409
                         return res
-            raise e
-        input_attractions_ids = set(json.get('tourist_attraction_ids'))
-
-        tour_attractions = TourAttraction.query.filter_by(tour_id=id).all()
-        existing_attractions_ids = {tour_attraction.tourist_attractions_id for tour_attraction in tour_attractions}
-
-        removed_attractions_ids = existing_attractions_ids - input_attractions_ids
-        if removed_attractions_ids:
-            # deleted_attractions = TourAttraction.query.filter_by(
-            #    tour_id=id and TourAttraction.tourist_attractions_id.in_(removed_attractions_ids)).delete()
-            # deleted_attractions = TourAttraction.delete().where(
-            #     TourAttraction.tour_id == id and TourAttraction.tourist_attractions_id.in_(removed_attractions_ids))
-            db.session.query(TourAttraction).filter(
-                TourAttraction.tour_id == id).filter(TourAttraction.tourist_attractions_id.in_(
-                    removed_attractions_ids)).delete()
-        # db.session.delete(deleted_attractions)
-        try:
-            db.session.commit()
-        except Exception as e:
-            orig = e.orig
-            if orig:
-                args = orig.args
-                if len(args) >= 2 and args[0] == 1062:
-                    error_message = args[1]
                     if 'Duplicate entry' in error_message:
                         res = jsonify({'message': 'There is already address for this customer!!'})
                         res.status_code = 409
@@ -197,34 +325,6 @@ class UpdateTour(Resource):
                         return res
             raise e
 
-        new_attractions_ids = input_attractions_ids - existing_attractions_ids
-        if new_attractions_ids:
-            for tourist_attraction_id in new_attractions_ids:
-                tour_attraction = TourAttraction(
-                    tour_id=id,
-                    tourist_attractions_id=tourist_attraction_id
-                )
-                db.session.add(tour_attraction)
-            try:
-                db.session.commit()
-            except Exception as e:
-                orig = e.orig
-                if orig:
-                    args = orig.args
-                    if len(args) >= 2 and args[0] == 1062:
-                        error_message = args[1]
-                        if 'Duplicate entry' in error_message:
-                            res = jsonify({'message': 'There is already address for this customer!!'})
-                            res.status_code = 409
-                            return res
-                    if len(args) >= 2 and args[0] == 1452:
-                        error_message = args[1]
-                        if 'Cannot add or update a child row' in error_message:
-                            res = jsonify({'message': 'There is no such father row!!'})
-                            res.status_code = 409
-                            return res
-                raise e
-
         return jsonify(tour_schema.dump(tour))
 
 
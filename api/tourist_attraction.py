@@ -3,13 +3,23 @@ from flask_restx import Namespace, Resource
 from werkzeug.exceptions import NotFound
 
 from api.auth import auth
+from api.batch import create_batch, get_batch_items, InvalidBatch
+from api.conditional import conditional
+from api.geo import InvalidGeoParams, get_point, get_radius_km, get_k, get_limit, find_nearby, find_nearest, \
+    dump_located
+from api.pagination import paginate, page_response, InvalidPageParams
+from api.projection import get_fields, load_fields, InvalidFields
+from api.reference_cache import create_reference_cache
+from api.response_cache import cached_response
 from config import api, db
-from model import TouristAttraction
-from schema import tourist_attraction_model, tourist_attraction_schema, tourist_attractions_schema
+from model import TouristAttraction, City
+from schema import tourist_attraction_model, tourist_attraction_schema, tourist_attractions_schema, batch_result_model
 
 ns = Namespace('tourist-attractions', description='CRUD operations for Tourist Attraction essence')
 api.add_namespace(ns)
 
+tourist_attraction_cache = create_reference_cache(TouristAttraction, tourist_attraction_schema)
+
 
 @ns.route('/post')
 class CreateTouristAttraction(Resource):
@@ -52,33 +62,142 @@ class CreateTouristAttraction(Resource):
         return res
 
 
+def build_tourist_attraction_row(json):
+    return {
+        'name': json.get('name'),
+        'type': json.get('type'),
+        'city_id': json.get('city_id'),
+        'details': json.get('details')
+    }
+
+
+@ns.route('/batch')
+class CreateTouristAttractions(Resource):
+    @ns.expect([tourist_attraction_model])
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully processed batch of Tourist Attractions', model=[batch_result_model])
+    @ns.response(400, description='Invalid batch!')
+    @ns.response(401, description='Customer is not authenticated!', model=tourist_attraction_model)
+    @ns.response(403, description='Customer is not authorized!', model=tourist_attraction_model)
+    @auth("CREATE_TOURIST_ATTRACTION")
+    def post(self):
+        try:
+            items = get_batch_items()
+        except InvalidBatch as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return jsonify(create_batch(
+            TouristAttraction, items, build_tourist_attraction_row,
+            foreign_keys=[('city_id', City.id)]
+        ))
+
+
 @ns.route('/<int:id>/get')
 class GetTouristAttraction(Resource):
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get Tourist Attraction', model=tourist_attraction_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid fields!')
     @ns.response(404, description='Tourist Attraction not found!')
     @ns.response(401, description='Customer is not authenticated!', model=tourist_attraction_model)
     @ns.response(403, description='Customer is not authorized!', model=tourist_attraction_model)
     @auth("GET_TOURIST_ATTRACTION_BY_ID")
+    @conditional(TouristAttraction)
     def get(self, id):
         try:
-            tourist_attraction = TouristAttraction.query.get_or_404(id)
-        except NotFound:
+            fields = get_fields(tourist_attraction_schema)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        tourist_attraction_dto = tourist_attraction_cache.get(id)
+        if tourist_attraction_dto is None:
             res = jsonify({'message': 'Tourist Attraction not found!'})
             res.status_code = 404
             return res
-        return jsonify(tourist_attraction_schema.dump(tourist_attraction))
+        return jsonify(tourist_attraction_schema.project(fields).dump(tourist_attraction_dto))
 
 
 @ns.route('/get')
 class GetTouristAttractions(Resource):
+    @ns.param(name='limit', description='Maximum number of items in the page', _in='query', type='integer')
+    @ns.param(name='after', description='Cursor returned as next_cursor by the previous page', _in='query', type='integer')
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get list of Tourist Attractions', model=tourist_attraction_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid page parameters or fields!')
     @ns.response(401, description='Customer is not authenticated!', model=tourist_attraction_model)
     @ns.response(403, description='Customer is not authorized!', model=tourist_attraction_model)
     @auth("GET_TOURIST_ATTRACTIONS_LIST")
+    @conditional(TouristAttraction)
+    @cached_response(TouristAttraction)
     def get(self):
-        return jsonify(tourist_attractions_schema.dump(TouristAttraction.query.all()))
+        try:
+            fields = get_fields(tourist_attractions_schema)
+            tourist_attractions, next_cursor = paginate(
+                TouristAttraction.query.options(*load_fields(TouristAttraction, fields)), TouristAttraction.id)
+        except (InvalidPageParams, InvalidFields) as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return page_response(tourist_attractions_schema.project(fields).dump(tourist_attractions), next_cursor)
+
+
+@ns.route('/nearby')
+class GetNearbyTouristAttractions(Resource):
+    @ns.param(name='lat', description='Latitude of the point', _in='query', type='number', required=True)
+    @ns.param(name='lon', description='Longitude of the point', _in='query', type='number', required=True)
+    @ns.param(name='radius_km', description='Search radius in kilometres', _in='query', type='number', required=True)
+    @ns.param(name='limit', description='Maximum number of items (default 100, at most 1000)', _in='query',
+              type='integer')
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully get Tourist Attractions in Cities within the radius, nearest first', model=tourist_attraction_model)
+    @ns.response(400, description='Invalid location parameters!')
+    @ns.response(401, description='Customer is not authenticated!', model=tourist_attraction_model)
+    @ns.response(403, description='Customer is not authorized!', model=tourist_attraction_model)
+    @auth("GET_TOURIST_ATTRACTIONS_LIST")
+    def get(self):
+        try:
+            latitude, longitude = get_point()
+            radius_km = get_radius_km()
+            limit = get_limit()
+        except InvalidGeoParams as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        located = find_nearby(TouristAttraction, TouristAttraction.city_id, latitude, longitude, radius_km, limit)
+        return jsonify({'items': dump_located(tourist_attractions_schema, located)})
+
+
+@ns.route('/nearest')
+class GetNearestTouristAttractions(Resource):
+    @ns.param(name='lat', description='Latitude of the point', _in='query', type='number', required=True)
+    @ns.param(name='lon', description='Longitude of the point', _in='query', type='number', required=True)
+    @ns.param(name='k', description='Number of Tourist Attractions to return (default 10)', _in='query', type='integer')
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully get the k nearest Tourist Attractions by City location, nearest first', model=tourist_attraction_model)
+    @ns.response(400, description='Invalid location parameters!')
+    @ns.response(401, description='Customer is not authenticated!', model=tourist_attraction_model)
+    @ns.response(403, description='Customer is not authorized!', model=tourist_attraction_model)
+    @auth("GET_TOURIST_ATTRACTIONS_LIST")
+    def get(self):
+        try:
+            latitude, longitude = get_point()
+            k = get_k()
+        except InvalidGeoParams as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        located = find_nearest(TouristAttraction, TouristAttraction.city_id, latitude, longitude, k)
+        return jsonify({'items': dump_located(tourist_attractions_schema, located)})
 
 
 @ns.route('/<int:id>/update')
@@ -102,9 +221,10 @@ class UpdateTouristAttraction(Resource):
         try:
             tourist_attraction.name = json.get('name')
             tourist_attraction.type = json.get('type')
-            tourist_attraction.city_id = json.get('city_id'),
+            tourist_attraction.city_id = json.get('city_id')
             tourist_attraction.details = json.get('details')
             db.session.commit()
+            tourist_attraction_cache.invalidate(id)
         except Exception as e:
             orig = e.orig
             if orig:
@@ -141,4 +261,5 @@ class DeleteTouristAttraction(Resource):
             return res
         db.session.delete(tourist_attraction)
         db.session.commit()
+        tourist_attraction_cache.invalidate(id)
         return Response(status=204)
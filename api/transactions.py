@@ -0,0 +1,61 @@
+import random
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from config import app, db
+
+# MySQL: 1213 deadlock found when trying to get lock, 1205 lock wait timeout exceeded.
+RETRYABLE_ERROR_CODES = {1205, 1213}
+
+
+class RetryStats:
+    def __init__(self):
+        self.retries = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def record(self, is_exhausted):
+        with self._lock:
+            if is_exhausted:
+                self.exhausted += 1
+            else:
+                self.retries += 1
+
+    def stats(self):
+        with self._lock:
+            return {'retries': self.retries, 'exhausted': self.exhausted}
+
+
+retry_stats = RetryStats()
+
+
+def is_retryable(error):
+    orig = getattr(error, 'orig', None)
+    args = getattr(orig, 'args', ())
+    if args and args[0] in RETRYABLE_ERROR_CODES:
+        return True
+    # SQLite reports a busy writer lock the same way when its busy timeout runs out.
+    return 'database is locked' in str(orig)
+
+
+def run_with_retry(work):
+    # Runs work() and commits as one transaction, starting over with a fresh transaction when the database picks
+    # it as a deadlock victim or gives up waiting for a lock. Any other error, or the last failed attempt, is
+    # raised to the caller with the session rolled back.
+    attempts = app.config['TRANSACTION_RETRY_ATTEMPTS']
+    backoff_seconds = app.config['TRANSACTION_RETRY_BACKOFF_SECONDS']
+    for attempt in range(1, attempts + 1):
+        try:
+            result = work()
+            db.session.commit()
+            return result
+        except OperationalError as e:
+            db.session.rollback()
+            if not is_retryable(e):
+                raise
+            retry_stats.record(attempt == attempts)
+            if attempt == attempts:
+                raise
+            time.sleep(random.uniform(0, backoff_seconds * 2 ** (attempt - 1)))
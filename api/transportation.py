@@ -5,9 +5,16 @@ from flask_restx import Namespace, Resource
 from werkzeug.exceptions import NotFound
 
 from api.auth import auth
+from api.batch import create_batch, get_batch_items, InvalidBatch
+from api.conditional import conditional
+from api.pagination import paginate, page_response, InvalidPageParams
+from api.projection import get_fields, load_fields, InvalidFields
+from api.route_planner import transportation_graph, TRANSPORTATION_GRAPH_VERSION, InvalidRouteParams, \
+    get_route_params, plan_routes
 from config import api, db
-from model import Transportation
-from schema import transportation_model, transportation_schema, transportations_schema
+from model import Transportation, City, Tour
+from schema import transportation_model, transportation_schema, transportations_schema, batch_result_model
+from versions import committed_version, mark_written
 
 ns = Namespace('transportations', description='CRUD operations for Transportation essence')
 api.add_namespace(ns)
@@ -35,7 +42,10 @@ class CreateTransportation(Resource):
         )
         try:
             db.session.add(transportation)
+            db.session.flush()
+            mark_written(TRANSPORTATION_GRAPH_VERSION)
             db.session.commit()
+            transportation_graph.refresh([transportation.id], committed_version(TRANSPORTATION_GRAPH_VERSION))
         except Exception as e:
             orig = e.orig
             if orig:
@@ -58,34 +68,125 @@ class CreateTransportation(Resource):
         return res
 
 
+def build_transportation_row(json):
+    return {
+        'tour_id': json.get('tour_id'),
+        'transport_type': json.get('transport_type'),
+        'start_time': datetime.strptime(json.get('start_time'), "%Y-%m-%d"),
+        'end_time': datetime.strptime(json.get('end_time'), "%Y-%m-%d"),
+        'start_city_id': json.get('start_city_id'),
+        'end_city_id': json.get('end_city_id'),
+        'details': json.get('details')
+    }
+
+
+@ns.route('/batch')
+class CreateTransportations(Resource):
+    @ns.expect([transportation_model])
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully processed batch of Transportations', model=[batch_result_model])
+    @ns.response(400, description='Invalid batch!')
+    @ns.response(401, description='Customer is not authenticated!', model=transportation_model)
+    @ns.response(403, description='Customer is not authorized!', model=transportation_model)
+    @auth("CREATE_TRANSPORTATION")
+    def post(self):
+        try:
+            items = get_batch_items()
+        except InvalidBatch as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        results = create_batch(
+            Transportation, items, build_transportation_row,
+            foreign_keys=[('tour_id', Tour.id), ('start_city_id', City.id), ('end_city_id', City.id)]
+        )
+        # Ids are only reported as created when the batch committed; a rolled back batch has nothing to refresh.
+        created_ids = [result['id'] for result in results if result['status'] == 201]
+        if created_ids:
+            transportation_graph.refresh(created_ids, committed_version(TRANSPORTATION_GRAPH_VERSION))
+
+        return jsonify(results)
+
+
 @ns.route('/<int:id>/get')
 class GetTransportation(Resource):
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get Transportation', model=transportation_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid fields!')
     @ns.response(404, description='Transportation not found!')
     @ns.response(401, description='Customer is not authenticated!', model=transportation_model)
     @ns.response(403, description='Customer is not authorized!', model=transportation_model)
     @auth("GET_TRANSPORTATION_BY_ID")
+    @conditional(Transportation)
     def get(self, id):
         try:
-            transportation = Transportation.query.get_or_404(id)
+            fields = get_fields(transportation_schema)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        try:
+            transportation = Transportation.query.options(*load_fields(Transportation, fields)).get_or_404(id)
         except NotFound:
             res = jsonify({'message': 'Transportation not found!'})
             res.status_code = 404
             return res
 
-        return jsonify(transportation_schema.dump(transportation))
+        return jsonify(transportation_schema.project(fields).dump(transportation))
 
 
 @ns.route('/get')
 class GetTransportations(Resource):
+    @ns.param(name='limit', description='Maximum number of items in the page', _in='query', type='integer')
+    @ns.param(name='after', description='Cursor returned as next_cursor by the previous page', _in='query', type='integer')
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get list of Transportations', model=transportation_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid page parameters or fields!')
+    @ns.response(401, description='Customer is not authenticated!', model=transportation_model)
+    @ns.response(403, description='Customer is not authorized!', model=transportation_model)
+    @auth("GET_TRANSPORTATIONS_LIST")
+    @conditional(Transportation)
+    def get(self):
+        try:
+            fields = get_fields(transportations_schema)
+            transportations, next_cursor = paginate(
+                Transportation.query.options(*load_fields(Transportation, fields)), Transportation.id)
+        except (InvalidPageParams, InvalidFields) as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return page_response(transportations_schema.project(fields).dump(transportations), next_cursor)
+
+
+@ns.route('/routes')
+class GetTransportationRoutes(Resource):
+    @ns.param(name='from', description='Id of the departure City', _in='query', type='integer', required=True)
+    @ns.param(name='to', description='Id of the destination City', _in='query', type='integer', required=True)
+    @ns.param(name='depart_after', description='Earliest departure date, YYYY-MM-DD (default today)', _in='query')
+    @ns.param(name='max_legs', description='Maximum number of legs per itinerary (default 4)', _in='query',
+              type='integer')
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully get itineraries from fewest legs to earliest arrival')
+    @ns.response(400, description='Invalid route parameters!')
     @ns.response(401, description='Customer is not authenticated!', model=transportation_model)
     @ns.response(403, description='Customer is not authorized!', model=transportation_model)
     @auth("GET_TRANSPORTATIONS_LIST")
     def get(self):
-        return jsonify(transportations_schema.dump(Transportation.query.all()))
+        try:
+            from_city_id, to_city_id, depart_after, max_legs = get_route_params()
+        except InvalidRouteParams as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        return jsonify({'itineraries': plan_routes(from_city_id, to_city_id, depart_after, max_legs)})
 
 
 @ns.route('/<int:id>/update')
@@ -114,7 +215,9 @@ class UpdateTransportation(Resource):
             transportation.start_city_id = json.get('start_city_id')
             transportation.end_city_id = json.get('end_city_id')
             transportation.details = json.get('details')
+            mark_written(TRANSPORTATION_GRAPH_VERSION)
             db.session.commit()
+            transportation_graph.refresh([id], committed_version(TRANSPORTATION_GRAPH_VERSION))
         except Exception as e:
             orig = e.orig
             if orig:
@@ -151,5 +254,7 @@ class DeleteTransportation(Resource):
             res.status_code = 404
             return res
         db.session.delete(transportation)
+        mark_written(TRANSPORTATION_GRAPH_VERSION)
         db.session.commit()
+        transportation_graph.refresh([id], committed_version(TRANSPORTATION_GRAPH_VERSION))
         return Response(status=204)
@@ -1,36 +1,84 @@
 from datetime import datetime
+from functools import partial
 
 from flask import Response, request, jsonify
 from flask_restx import Namespace, Resource
 from werkzeug.exceptions import NotFound
 
+from api.associations import attach_association_ids, insert_association_ids, replace_association_ids
 from api.auth import auth
+from api.batch import create_batch, get_batch_items, InvalidBatch, BatchAssociation
+from api.conditional import conditional
+from api.occupancy import lock_tours, reserve_seats, release_seats, move_seats, NoSuchTour, TourFullyBooked
+from api.pagination import paginate, page_response, InvalidPageParams
+from api.projection import get_fields, load_fields, is_requested, InvalidFields
+from api.streaming import is_stream_requested, stream_response
+from api.transactions import run_with_retry
 from config import api, db
-from model import Vouchers, VoucherCustomers
-from schema import voucher_model, voucher_schema, vouchers_schema
+from model import Vouchers, VoucherCustomers, Customer, Tour
+from schema import voucher_model, voucher_schema, vouchers_schema, batch_result_model
 
 ns = Namespace('vouchers', description='CRUD operations for Voucher essence')
 api.add_namespace(ns)
 
 
+# The write paths below run through run_with_retry, which commits them and replays them from the start when the
+# transaction is chosen as a deadlock victim, so each one takes its locks and reads its state afresh.
+def create_voucher(tour_id, customer_ids):
+    lock_tours([tour_id])
+    voucher = Vouchers(
+        tour_id=tour_id
+    )
+    db.session.add(voucher)
+    db.session.flush()
+    insert_association_ids(VoucherCustomers, VoucherCustomers.voucher_id, VoucherCustomers.customer_id,
+                           voucher.id, customer_ids)
+    reserve_seats(tour_id, len(customer_ids))
+    return voucher
+
+
+def update_voucher(voucher, tour_id, customer_ids):
+    db.session.refresh(voucher, with_for_update=True)
+    lock_tours([voucher.tour_id, tour_id])
+    old_tour_id = voucher.tour_id
+    old_seats = VoucherCustomers.query.filter_by(voucher_id=voucher.id).count()
+    voucher.tour_id = tour_id
+    removed_ids, new_ids = replace_association_ids(VoucherCustomers, VoucherCustomers.voucher_id,
+                                                   VoucherCustomers.customer_id, voucher.id, customer_ids)
+    move_seats(old_tour_id, old_seats, tour_id, old_seats - len(removed_ids) + len(new_ids))
+
+
+def delete_voucher(voucher):
+    db.session.refresh(voucher, with_for_update=True)
+    lock_tours([voucher.tour_id])
+    removed_ids, _ = replace_association_ids(VoucherCustomers, VoucherCustomers.voucher_id,
+                                             VoucherCustomers.customer_id, voucher.id, ())
+    release_seats(voucher.tour_id, len(removed_ids))
+    db.session.delete(voucher)
+
+
 @ns.route('/post')
 class CreateVoucher(Resource):
     @ns.expect(voucher_model)
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(201, description='Successfully created new Voucher', model=voucher_model)
+    @ns.response(409, description='There are not enough free seats on this tour!')
     @ns.response(401, description='Customer is not authenticated!', model=voucher_model)
     @ns.response(403, description='Customer is not authorized!', model=voucher_model)
     @auth("CREATE_VOUCHER")
     def post(self):
         json = request.json
+        customer_ids = json.get('customer_ids')
 
-        voucher = Vouchers(
-            tour_id=json.get('tour_id')
-        )
         try:
-            db.session.add(voucher)
-            db.session.commit()
+            voucher = run_with_retry(partial(create_voucher, json.get('tour_id'), set(customer_ids or ())))
+        except (TourFullyBooked, NoSuchTour) as e:
+            db.session.rollback()
+            res = jsonify({'message': str(e)})
+            res.status_code = 409
+            return res
         except Exception as e:
+            db.session.rollback()
             orig = e.orig
             if orig:
                 args = orig.args
@@ -48,36 +96,6 @@ class CreateVoucher(Resource):
                         return res
             raise e
 
-        voucher_id = voucher.id
-        customer_ids = json.get('customer_ids')
-
-        if customer_ids:
-            for customer_id in set(customer_ids):
-                voucher_customer = VoucherCustomers(
-                    voucher_id=voucher_id,
-                    customer_id=customer_id
-                )
-                db.session.add(voucher_customer)
-            try:
-                db.session.commit()
-            except Exception as e:
-                orig = e.orig
-                if orig:
-                    args = orig.args
-                    if len(args) >= 2 and args[0] == 1062:
-                        error_message = args[1]
-                        if 'Duplicate entry' in error_message:
-                            res = jsonify({'message': 'There is already address for this customer!!'})
-                            res.status_code = 409
-                            return res
-                    if len(args) >= 2 and args[0] == 1452:
-                        error_message = args[1]
-                        if 'Cannot add or update a child row' in error_message:
-                            res = jsonify({'message': 'There is no such father row!!'})
-                            res.status_code = 409
-                            return res
-                raise e
-
         voucher.customer_ids = customer_ids
 
         res = jsonify(voucher_schema.dump(voucher))
@@ -85,40 +103,129 @@ class CreateVoucher(Resource):
         return res
 
 
+def build_voucher_row(json):
+    return {
+        'tour_id': json.get('tour_id')
+    }
+
+
+def reserve_voucher_seats(row, links):
+    try:
+        reserve_seats(row['tour_id'], len(links['customer_ids']))
+    except (TourFullyBooked, NoSuchTour) as e:
+        return str(e)
+
+
+@ns.route('/batch')
+class CreateVouchers(Resource):
+    @ns.expect([voucher_model])
+    @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
+    @ns.response(200, description='Successfully processed batch of Vouchers', model=[batch_result_model])
+    @ns.response(400, description='Invalid batch!')
+    @ns.response(401, description='Customer is not authenticated!', model=voucher_model)
+    @ns.response(403, description='Customer is not authorized!', model=voucher_model)
+    @auth("CREATE_VOUCHER")
+    def post(self):
+        try:
+            items = get_batch_items()
+        except InvalidBatch as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        def create_vouchers():
+            lock_tours([item.get('tour_id') for item in items if isinstance(item, dict)])
+            return create_batch(
+                Vouchers, items, build_voucher_row,
+                foreign_keys=[('tour_id', Tour.id)],
+                associations=[BatchAssociation('customer_ids', VoucherCustomers, VoucherCustomers.voucher_id,
+                                               VoucherCustomers.customer_id, Customer.id)],
+                reserve=reserve_voucher_seats
+            )
+
+        return jsonify(run_with_retry(create_vouchers))
+
+
 @ns.route('/<int:id>/get')
 class GetVoucher(Resource):
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get Voucher', model=voucher_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid fields!')
     @ns.response(404, description='Voucher not found!')
     @ns.response(401, description='Customer is not authenticated!', model=voucher_model)
     @ns.response(403, description='Customer is not authorized!', model=voucher_model)
     @auth("GET_VOUCHER_BY_ID")
+    @conditional(Vouchers, VoucherCustomers)
     def get(self, id):
         try:
-            voucher = Vouchers.query.get_or_404(id)
+            fields = get_fields(voucher_schema)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        try:
+            voucher = Vouchers.query.options(*load_fields(Vouchers, fields)).get_or_404(id)
         except NotFound:
             res = jsonify({'message': 'Voucher not found!'})
             res.status_code = 404
             return res
 
-        voucher_customers = VoucherCustomers.query.filter_by(voucher_id=id).all()
-        customer_ids = [voucher_customer.customer_id for voucher_customer in voucher_customers]
-
-        voucher_dto = voucher_schema.dump(voucher)
-        voucher_dto['customer_ids'] = customer_ids
+        voucher_dto = voucher_schema.project(fields).dump(voucher)
+        if is_requested(fields, 'customer_ids'):
+            voucher_customers = VoucherCustomers.query.filter_by(voucher_id=id).all()
+            voucher_dto['customer_ids'] = [voucher_customer.customer_id for voucher_customer in voucher_customers]
 
         return jsonify(voucher_dto)
 
 
 @ns.route('/get')
 class GetVouchers(Resource):
+    @ns.param(name='limit', description='Maximum number of items in the page', _in='query', type='integer')
+    @ns.param(name='after', description='Cursor returned as next_cursor by the previous page', _in='query', type='integer')
+    @ns.param(name='stream', description='Set to 1 to stream every row as NDJSON (same as Accept: application/x-ndjson)',
+              _in='query', type='integer')
+    @ns.param(name='fields', description='Comma-separated fields to return, id is always included', _in='query')
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully get list of Vouchers', model=voucher_model)
+    @ns.response(304, description='Not modified since the ETag in If-None-Match')
+    @ns.response(400, description='Invalid page parameters or fields!')
     @ns.response(401, description='Customer is not authenticated!', model=voucher_model)
     @ns.response(403, description='Customer is not authorized!', model=voucher_model)
     @auth("GET_VOUCHERS_LIST")
+    @conditional(Vouchers, VoucherCustomers)
     def get(self):
-        return jsonify(vouchers_schema.dump(Vouchers.query.all()))
+        try:
+            fields = get_fields(vouchers_schema)
+        except InvalidFields as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        query = Vouchers.query.options(*load_fields(Vouchers, fields))
+        is_customer_ids_requested = is_requested(fields, 'customer_ids')
+        if is_stream_requested():
+            return stream_response(query.order_by(Vouchers.id), voucher_schema.project(fields), partial(
+                attach_association_ids,
+                field='customer_ids',
+                parent_column=VoucherCustomers.voucher_id,
+                child_column=VoucherCustomers.customer_id
+            ) if is_customer_ids_requested else None)
+
+        try:
+            vouchers, next_cursor = paginate(query, Vouchers.id)
+        except InvalidPageParams as e:
+            res = jsonify({'message': str(e)})
+            res.status_code = 400
+            return res
+
+        voucher_dtos = vouchers_schema.project(fields).dump(vouchers)
+        if is_customer_ids_requested:
+            attach_association_ids(voucher_dtos, 'customer_ids', VoucherCustomers.voucher_id, VoucherCustomers.customer_id)
+
+        return page_response(voucher_dtos, next_cursor)
 
 
 @ns.route('/<int:id>/update')
@@ -127,6 +234,7 @@ class UpdateVoucher(Resource):
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(200, description='Successfully updated Voucher', model=voucher_model)
     @ns.response(404, description='Voucher not found!')
+    @ns.response(409, description='There are not enough free seats on this tour!')
     @ns.response(401, description='Customer is not authenticated!', model=voucher_model)
     @ns.response(403, description='Customer is not authorized!', model=voucher_model)
     @auth("UPDATE_VOUCHER")
@@ -140,37 +248,14 @@ class UpdateVoucher(Resource):
             res.status_code = 404
             return res
         try:
-            voucher.tour_id = json.get('tour_id')
-            db.session.commit()
-        except Exception as e:
-            orig = e.orig
-            if orig:
-                args = orig.args
-                if len(args) >= 2 and args[0] == 1062:
-                    error_message = args[1]
-                    if 'Duplicate entry' in error_message:
-                        res = jsonify({'message': 'There is already address for this customer!!'})
-                        res.status_code = 409
-                        return res
-                if len(args) >= 2 and args[0] == 1452:
-                    error_message = args[1]
-                    if 'Cannot add or update a child row' in error_message:
-                        res = jsonify({'message': 'There is no such father row!!'})
-                        res.status_code = 409
-                        return res
-            raise e
-        input_customers_ids = set(json.get('customer_ids'))
-
-        voucher_customers = VoucherCustomers.query.filter_by(voucher_id=id).all()
-        existing_customers_ids = {voucher_customer.customer_id for voucher_customer in voucher_customers}
-
-        removed_customers_ids = existing_customers_ids - input_customers_ids
-        if removed_customers_ids:
-            db.session.query(VoucherCustomers).filter(VoucherCustomers.voucher_id == id).filter(
-                VoucherCustomers.customer_id.in_(removed_customers_ids)).delete()
-        try:
-            db.session.commit()
+            run_with_retry(partial(update_voucher, voucher, json.get('tour_id'), set(json.get('customer_ids') or ())))
+        except (TourFullyBooked, NoSuchTour) as e:
+            db.session.rollback()
+            res = jsonify({'message': str(e)})
+            res.status_code = 409
+            return res
         except Exception as e:
+            db.session.rollback()
             orig = e.orig
             if orig:
                 args = orig.args
@@ -188,33 +273,6 @@ class UpdateVoucher(Resource):
                         return res
             raise e
 
-        new_customers_ids = input_customers_ids - existing_customers_ids
-        if new_customers_ids:
-            for customer_id in set(new_customers_ids):
-                voucher_customer = VoucherCustomers(
-                    voucher_id=id,
-                    customer_id=customer_id
-                )
-                db.session.add(voucher_customer)
-            try:
-                db.session.commit()
-            except Exception as e:
-                orig = e.orig
-                if orig:
-                    args = orig.args
-                    if len(args) >= 2 and args[0] == 1062:
-                        error_message = args[1]
-                        if 'Duplicate entry' in error_message:
-                            res = jsonify({'message': 'There is already address for this customer!!'})
-                            res.status_code = 409
-                            return res
-                    if len(args) >= 2 and args[0] == 1452:
-                        error_message = args[1]
-                        if 'Cannot add or update a child row' in error_message:
-                            res = jsonify({'message': 'There is no such father row!!'})
-                            res.status_code = 409
-                            return res
-                raise e
         return jsonify(voucher_schema.dump(voucher))
 
 
@@ -223,6 +281,7 @@ class DeleteVoucher(Resource):
     @ns.param(name='Authorization', description='Basic access authentication token', _in='header', required=True)
     @ns.response(204, description='Successfully removed Voucher')
     @ns.response(404, description='Voucher not found!')
+    @ns.response(409, description='Something attached to voucher!')
     @ns.response(401, description='Customer is not authenticated!', model=voucher_model)
     @ns.response(403, description='Customer is not authorized!', model=voucher_model)
     @auth("DELETE_VOUCHER")
@@ -233,6 +292,18 @@ class DeleteVoucher(Resource):
             res = jsonify({'message': 'Voucher not found!'})
             res.status_code = 404
             return res
-        db.session.delete(voucher)
-        db.session.commit()
+        try:
+            run_with_retry(partial(delete_voucher, voucher))
+        except Exception as e:
+            db.session.rollback()
+            orig = e.orig
+            if orig:
+                args = orig.args
+                if len(args) >= 2 and args[0] == 1451:
+                    error_message = args[1]
+                    if 'a foreign key constraint fails' in error_message:
+                        res = jsonify({'message': 'Something attached to voucher!'})
+                        res.status_code = 409
+                        return res
+            raise e
         return Response(status=204)
@@ -12,7 +12,8 @@ from api import \
     hotel, \
     voucher, \
     role, \
-    permission
+    permission, \
+    internal
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,10 @@
+from a2wsgi import WSGIMiddleware
+
+import app as application  # noqa: F401 - registers every namespace on the Api
+from config import app as flask_app
+
+# ASGI entry point: uvicorn asgi:app --workers 4. This only wraps the WSGI app: the event loop reads and writes the
+# client connections, so idle keep-alive connections cost no thread, but every request still runs on one of
+# ASGI_THREADS threads with blocking SQLAlchemy calls, as under the threaded server. Keep DB_POOL_SIZE +
+# DB_MAX_OVERFLOW at least ASGI_THREADS so no request thread waits for a connection.
+app = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_THREADS'])
@@ -0,0 +1,113 @@
+import argparse
+import datetime
+import json
+import sys
+
+from api.associations import insert_association_ids, replace_association_ids
+from benchmarks.common import DEFAULT_DATABASE_URI, StatementCounter, bootstrap, summarize, timed
+from config import db
+from model import City, Country, Tour, TouristAttraction, TourAttraction
+
+
+def seed_attractions(count):
+    country = Country(country_name='Benchmark', official_language='none', population='0', details=0)
+    db.session.add(country)
+    db.session.flush()
+    city = City(city_name='Benchmark', country_id=country.id, city_latitude=0, city_longitude=0)
+    db.session.add(city)
+    db.session.flush()
+    db.session.execute(TouristAttraction.__table__.insert(), [
+        {'name': f'attraction-{i}', 'type': 'EXCURSION', 'city_id': city.id, 'details': ''} for i in range(count)
+    ])
+    db.session.commit()
+    return [attraction_id for (attraction_id,) in db.session.query(TouristAttraction.id).order_by(TouristAttraction.id)]
+
+
+def new_tour(name):
+    return Tour(name=name, price=100, person_count=2, start_time=datetime.date(2021, 9, 19),
+                end_time=datetime.date(2021, 9, 25), description='benchmark')
+
+
+def legacy_create(name, attraction_ids):
+    # Write path before the change: one commit for the tour, one ORM object and one commit for the links.
+    tour = new_tour(name)
+    db.session.add(tour)
+    db.session.commit()
+    for attraction_id in set(attraction_ids):
+        db.session.add(TourAttraction(tour_id=tour.id, tourist_attractions_id=attraction_id))
+    db.session.commit()
+    return tour.id
+
+
+def legacy_update(tour_id, attraction_ids):
+    db.session.commit()
+    input_ids = set(attraction_ids)
+    existing_ids = {link.tourist_attractions_id for link in TourAttraction.query.filter_by(tour_id=tour_id).all()}
+    removed_ids = existing_ids - input_ids
+    if removed_ids:
+        db.session.query(TourAttraction).filter(TourAttraction.tour_id == tour_id).filter(
+            TourAttraction.tourist_attractions_id.in_(removed_ids)).delete(synchronize_session=False)
+    db.session.commit()
+    for attraction_id in input_ids - existing_ids:
+        db.session.add(TourAttraction(tour_id=tour_id, tourist_attractions_id=attraction_id))
+    db.session.commit()
+
+
+def bulk_create(name, attraction_ids):
+    tour = new_tour(name)
+    db.session.add(tour)
+    db.session.flush()
+    insert_association_ids(TourAttraction, TourAttraction.tour_id, TourAttraction.tourist_attractions_id,
+                           tour.id, set(attraction_ids))
+    db.session.commit()
+    return tour.id
+
+
+def bulk_update(tour_id, attraction_ids):
+    replace_association_ids(TourAttraction, TourAttraction.tour_id, TourAttraction.tourist_attractions_id,
+                            tour_id, attraction_ids)
+    db.session.commit()
+
+
+def run_variant(label, create, update, attraction_ids, id_count, iterations):
+    create_samples = []
+    update_samples = []
+    with StatementCounter(db.engine) as counter:
+        for iteration in range(iterations):
+            create_ids = attraction_ids[:id_count]
+            # Updates keep half of the links and swap the other half, so both the DELETE and INSERT paths run.
+            update_ids = attraction_ids[id_count // 2:id_count // 2 + id_count]
+            elapsed, tour_id = timed(create, f'{label}-{iteration}', create_ids)
+            create_samples.append(elapsed)
+            elapsed, _ = timed(update, tour_id, update_ids)
+            update_samples.append(elapsed)
+    return {
+        'variant': label,
+        'ids_per_payload': id_count,
+        'commits_per_request': counter.commits / (2 * iterations),
+        'statements_per_request': counter.statements / (2 * iterations),
+        'create': summarize(create_samples),
+        'update': summarize(update_samples)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the legacy and bulk association write paths.')
+    parser.add_argument('--database-uri', default=DEFAULT_DATABASE_URI)
+    parser.add_argument('--ids', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    app = bootstrap(args.database_uri)
+    with app.app_context():
+        attraction_ids = seed_attractions(args.ids * 2)
+        results = [
+            run_variant('legacy', legacy_create, legacy_update, attraction_ids, args.ids, args.iterations),
+            run_variant('bulk', bulk_create, bulk_update, attraction_ids, args.ids, args.iterations)
+        ]
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
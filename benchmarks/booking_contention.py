@@ -0,0 +1,142 @@
+import argparse
+import base64
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+
+from benchmarks.common import SQLITE_BUSY_TIMEOUT_SECONDS, bootstrap, enable_sqlite_wal, summarize
+from tools.seed_data import scaled_counts, seed_database
+
+DEFAULT_DATABASE_URI = 'sqlite:///benchmark_booking.db'
+BENCHMARK_USERNAME = 'benchmark'
+BENCHMARK_PASSWORD = 'benchmark'
+
+
+def open_hot_tours(hot_tours, seats):
+    # Gives each hot tour exactly `seats` free seats on top of what the seeder booked.
+    from config import db
+    from model import Tour
+    for tour_id in hot_tours:
+        db.session.query(Tour).filter(Tour.id == tour_id).update(
+            {Tour.person_count: Tour.booked_count + seats}, synchronize_session=False)
+    db.session.commit()
+
+
+def run_bookers(app, bookings, bookers, hot_tours, max_party_size, customer_count, seed_value):
+    headers = {'Authorization': 'Basic ' + base64.b64encode(
+        f'{BENCHMARK_USERNAME}:{BENCHMARK_PASSWORD}'.encode('utf8')).decode('utf8')}
+    samples = []
+    samples_lock = threading.Lock()
+    chunks = [range(bookings)[booker::bookers] for booker in range(bookers)]
+
+    def booker(booker_index):
+        client = app.test_client()
+        rng = random.Random(seed_value * 1000 + booker_index)
+        booker_samples = []
+        for _ in chunks[booker_index]:
+            payload = {'tour_id': rng.choice(hot_tours),
+                       'customer_ids': rng.sample(range(1, customer_count + 1), rng.randint(1, max_party_size))}
+            started_at = time.perf_counter()
+            response = client.post('/vouchers/post', json=payload, headers=headers)
+            elapsed = time.perf_counter() - started_at
+            seats = len(payload['customer_ids']) if response.status_code == 201 else 0
+            booker_samples.append((payload['tour_id'], response.status_code, elapsed, seats))
+        with samples_lock:
+            samples.extend(booker_samples)
+
+    # Warm the credential cache and permission matrix so the first bookings don't all pay for bcrypt.
+    app.test_client().get('/tours/1/get', headers=headers)
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=bookers) as executor:
+        list(executor.map(booker, range(bookers)))
+    return samples, time.perf_counter() - started_at
+
+
+def check_occupancy(hot_tours, seats, samples):
+    # Compares the maintained counters with the voucher links they summarise, and the seats each hot tour sold
+    # with what the successful responses claimed.
+    from config import db
+    from model import Tour, VoucherCustomers, Vouchers
+    linked = dict(db.session.query(Vouchers.tour_id, func.count())
+                  .join(VoucherCustomers, VoucherCustomers.voucher_id == Vouchers.id)
+                  .group_by(Vouchers.tour_id))
+    tours = db.session.query(Tour.id, Tour.person_count, Tour.booked_count).all()
+    sold = {tour_id: 0 for tour_id in hot_tours}
+    for tour_id, _, _, booked_seats in samples:
+        sold[tour_id] += booked_seats
+    return {
+        'overbooked_tours': sum(1 for _, person_count, booked_count in tours if booked_count > person_count),
+        'counter_mismatches': sum(1 for tour_id, _, booked_count in tours if booked_count != linked.get(tour_id, 0)),
+        'hot_tours_over_capacity': sum(1 for tour_id in hot_tours if sold[tour_id] > seats),
+        'seats_sold': sum(sold.values()),
+        'seats_offered': seats * len(hot_tours)
+    }
+
+
+def report(samples, duration):
+    status_counts = {}
+    for _, status, _, _ in samples:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+    return dict(summarize([elapsed for _, _, elapsed, _ in samples]), **{
+        'req_per_s': len(samples) / duration,
+        'bookings_per_s': sum(1 for _, status, _, _ in samples if status == 201) / duration,
+        'status_counts': status_counts,
+        'duration_s': duration
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent bookings competing for the last seats of a few tours.')
+    parser.add_argument('--database-uri', default=DEFAULT_DATABASE_URI)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--tours', type=int, default=100)
+    parser.add_argument('--hot-tours', type=int, default=3, help='tours every booker competes for')
+    parser.add_argument('--seats', type=int, default=100, help='free seats on each hot tour')
+    parser.add_argument('--bookings', type=int, default=1000)
+    parser.add_argument('--bookers', type=int, default=16, help='concurrent booking threads')
+    parser.add_argument('--max-party-size', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    is_sqlite = args.database_uri.startswith('sqlite')
+    engine_options = {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_SECONDS}} if is_sqlite else {}
+    app = bootstrap(args.database_uri, **engine_options)
+    # Rejected bookings are counted in the report; their tracebacks would only drown the output.
+    app.logger.setLevel(logging.CRITICAL)
+
+    from api.transactions import retry_stats
+    from config import db
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        if is_sqlite:
+            enable_sqlite_wal(db.engine)
+        counts = scaled_counts(args.customers, args.tours)
+        seed_database(db.engine, counts, args.seed, BENCHMARK_USERNAME, BENCHMARK_PASSWORD, distinct_passwords=1)
+        hot_tours = rng.sample(range(1, counts['tours'] + 1), min(args.hot_tours, counts['tours']))
+        open_hot_tours(hot_tours, args.seats)
+        samples, duration = run_bookers(app, args.bookings, args.bookers, hot_tours, args.max_party_size,
+                                        counts['customers'], args.seed)
+        occupancy = check_occupancy(hot_tours, args.seats, samples)
+
+    results = dict(report(samples, duration), occupancy=occupancy, transaction_retries=retry_stats.stats(), config={
+        'database_uri': args.database_uri, 'customers': args.customers, 'tours': args.tours,
+        'hot_tours': args.hot_tours, 'seats': args.seats, 'bookings': args.bookings, 'bookers': args.bookers,
+        'max_party_size': args.max_party_size, 'seed': args.seed
+    })
+    sys.stdout.write(json.dumps(results, indent=2) + '\n')
+
+    if occupancy['overbooked_tours'] or occupancy['counter_mismatches'] or occupancy['hot_tours_over_capacity']:
+        sys.stderr.write('occupancy check failed\n')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
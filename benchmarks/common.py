@@ -0,0 +1,99 @@
+import statistics
+import threading
+import time
+
+from sqlalchemy import event
+
+from config import app, build_engine_options, db
+
+DEFAULT_DATABASE_URI = 'sqlite:///benchmark.db'
+SQLITE_BUSY_TIMEOUT_SECONDS = 30
+
+
+def bootstrap(database_uri, **engine_options):
+    # The engine is created lazily, so pointing the app at another database is enough as long as
+    # nothing has touched db.engine yet.
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(build_engine_options(database_uri), **engine_options)
+    import app as application  # noqa: F401 - registers every namespace on the Api
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+def enable_sqlite_wal(engine):
+    @event.listens_for(engine, 'connect')
+    def set_wal(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.close()
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = 0
+        self.commits = 0
+
+    def _count_statement(self, *args):
+        self.statements += 1
+
+    def _count_commit(self, *args):
+        self.commits += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count_statement)
+        event.listen(self.engine, 'commit', self._count_commit)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._count_statement)
+        event.remove(self.engine, 'commit', self._count_commit)
+
+
+class ThreadStatementCounter:
+    # Counts statements per thread, so concurrent workers can attribute queries to their own requests.
+    def __init__(self, engine):
+        self.engine = engine
+        self._local = threading.local()
+
+    def _count_statement(self, *args):
+        self._local.statements = getattr(self._local, 'statements', 0) + 1
+
+    def reset(self):
+        self._local.statements = 0
+
+    @property
+    def statements(self):
+        return getattr(self._local, 'statements', 0)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count_statement)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._count_statement)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        'count': len(samples),
+        'mean_ms': statistics.mean(samples) * 1000,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000
+    }
+
+
+def timed(func, *args, **kwargs):
+    started_at = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started_at, result
@@ -0,0 +1,69 @@
+import argparse
+import gzip
+import json
+import sys
+import zlib
+
+from benchmarks.common import DEFAULT_DATABASE_URI, bootstrap, summarize, timed
+from benchmarks.json_encoding import encode, list_payloads
+from tools.seed_data import scaled_counts, seed_database
+
+DECOMPRESSORS = {
+    'gzip': gzip.decompress,
+    'deflate': zlib.decompress
+}
+
+
+def run_encoding(body, encoding, iterations):
+    from compression import compress, compression_level
+    compressed = compress(body, encoding)
+    samples = [timed(compress, body, encoding)[0] for _ in range(iterations)]
+    result = {'level': compression_level(len(body), encoding), 'bytes': len(compressed),
+              'ratio': len(body) / len(compressed)}
+    result.update(summarize(samples))
+    p50_seconds = result['p50_ms'] / 1000
+    result['mb_per_s'] = len(body) / 1e6 / p50_seconds if p50_seconds else None
+    result['round_trip'] = DECOMPRESSORS[encoding](compressed) == body
+    return result
+
+
+def run_payload(app, label, payload, rows, encodings, iterations):
+    body = encode(app, {'items': payload['items'][:rows], 'next_cursor': None})
+    result = {'payload': label, 'rows': min(rows, len(payload['items'])), 'identity_bytes': len(body)}
+    for encoding in encodings:
+        result[encoding] = run_encoding(body, encoding, iterations)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure bytes on the wire and CPU cost of response compression.')
+    parser.add_argument('--database-uri', default=DEFAULT_DATABASE_URI)
+    parser.add_argument('--rows', default='100,1000,10000', help='comma-separated page sizes to compress')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    page_sizes = [int(rows) for rows in args.rows.split(',')]
+
+    app = bootstrap(args.database_uri)
+    from config import db
+    from compression import available_encodings, brotli
+    if brotli is None:
+        sys.stderr.write('brotli is not installed, measuring gzip and deflate only\n')
+    else:
+        DECOMPRESSORS['br'] = brotli.decompress
+    encodings = available_encodings()
+
+    with app.app_context():
+        seed_database(db.engine, scaled_counts(max(page_sizes), max(page_sizes)), args.seed, distinct_passwords=1)
+        results = [run_payload(app, label, payload, rows, encodings, args.iterations)
+                   for label, payload in list_payloads(max(page_sizes)) for rows in page_sizes]
+
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    if not all(result[encoding]['round_trip'] for result in results for encoding in encodings):
+        sys.stderr.write('Compressed responses did not decompress to the original body\n')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import json
+import sys
+
+from benchmarks.common import DEFAULT_DATABASE_URI, bootstrap, summarize, timed
+from tools.seed_data import scaled_counts, seed_database
+
+
+def list_payloads(rows):
+    # The bodies the list routes send for a page of `rows` rows, built once and encoded repeatedly.
+    from model import Customer, Tour, Transportation
+    from schema import customers_schema_get, tours_schema, transportations_schema
+    payloads = []
+    for label, model, schema in [('tours', Tour, tours_schema), ('transportation', Transportation, transportations_schema),
+                                 ('customers', Customer, customers_schema_get)]:
+        instances = model.query.order_by(*model.__mapper__.primary_key).limit(rows).all()
+        payloads.append((label, {'items': schema.dump(instances), 'next_cursor': None}))
+    return payloads
+
+
+def encode(app, payload):
+    from flask import jsonify
+    with app.test_request_context():
+        return jsonify(payload).get_data()
+
+
+def run_backend(app, backend, payload, iterations):
+    from json_provider import init_json
+    app.config['JSON_BACKEND'] = backend
+    init_json(app)
+    body = encode(app, payload)
+    samples = [timed(encode, app, payload)[0] for _ in range(iterations)]
+    return body, summarize(samples)
+
+
+def run_payload(app, label, payload, backends, iterations):
+    rows = len(payload['items'])
+    bodies, results = {}, {}
+    for backend in backends:
+        bodies[backend], results[backend] = run_backend(app, backend, payload, iterations)
+        p50_seconds = results[backend]['p50_ms'] / 1000
+        results[backend].update({
+            'rows_per_s': rows / p50_seconds if p50_seconds else None,
+            'mb_per_s': len(bodies[backend]) / 1e6 / p50_seconds if p50_seconds else None
+        })
+    reference = bodies['stdlib']
+    result = {
+        'payload': label,
+        'rows': rows,
+        'bytes': len(reference),
+        'identical_output': all(body == reference for body in bodies.values())
+    }
+    result.update(results)
+    if 'orjson' in results and results['orjson']['p50_ms']:
+        result['speedup_p50'] = results['stdlib']['p50_ms'] / results['orjson']['p50_ms']
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare response encoding throughput of the JSON backends.')
+    parser.add_argument('--database-uri', default=DEFAULT_DATABASE_URI)
+    parser.add_argument('--rows', type=int, default=10000, help='rows per list payload')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    app = bootstrap(args.database_uri)
+    from config import db
+    from json_provider import orjson
+    backends = ['stdlib'] if orjson is None else ['stdlib', 'orjson']
+    if orjson is None:
+        sys.stderr.write('orjson is not installed, measuring the stdlib backend only\n')
+
+    with app.app_context():
+        seed_database(db.engine, scaled_counts(args.rows, args.rows), args.seed, distinct_passwords=1)
+        results = [run_payload(app, label, payload, backends, args.iterations)
+                   for label, payload in list_payloads(args.rows)]
+
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    if not all(result['identical_output'] for result in results):
+        sys.stderr.write('JSON backends produced different responses\n')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
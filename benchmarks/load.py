@@ -0,0 +1,256 @@
+import argparse
+import base64
+import datetime
+import itertools
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import SQLITE_BUSY_TIMEOUT_SECONDS, ThreadStatementCounter, bootstrap, enable_sqlite_wal, \
+    summarize
+from tools.seed_data import scaled_counts, seed_database
+
+DEFAULT_DATABASE_URI = 'sqlite:///benchmark_load.db'
+DEFAULT_MIX = 'get=50,list=30,create=10,update=10'
+BENCHMARK_USERNAME = 'benchmark'
+BENCHMARK_PASSWORD = 'benchmark'
+MIN_GATED_SAMPLES = 50
+
+
+def tour_payload(name, rng):
+    # Seeded tours hold up to 60 people, so updates never shrink a tour below its booked seats.
+    return {'name': name, 'price': rng.randint(100, 5000), 'person_count': rng.randint(60, 100),
+            'description': 'benchmark', 'recommended_pocket_money': rng.randint(0, 1000)}
+
+
+def attraction_payload(name, counts, rng):
+    return {'name': name, 'type': 'EXCURSION', 'city_id': rng.randint(1, counts['cities']), 'details': ''}
+
+
+def hotel_payload(name, counts, rng):
+    return {'name': name, 'hotel_class': f'{rng.randint(1, 5)}*', 'city_id': rng.randint(1, counts['cities']),
+            'is_animals_allowed': rng.random() < 0.5, 'details': ''}
+
+
+def transportation_payload(counts, rng):
+    return {'tour_id': rng.randint(1, counts['tours']), 'transport_type': 'BUS',
+            'start_city_id': rng.randint(1, counts['cities']), 'end_city_id': rng.randint(1, counts['cities']),
+            'details': ''}
+
+
+def customer_payload(username):
+    return {'username': username, 'first_name': 'first', 'middle_name': 'middle', 'last_name': 'last',
+            'phone': '380000000000', 'gender': 'F', 'is_covid_vaccinated': True, 'is_blocked': False}
+
+
+def customer_address_payload(counts, rng):
+    return {'city_id': rng.randint(1, counts['cities']), 'zip_code': '79000', 'street': 'street',
+            'house_number': str(rng.randint(1, 200)), 'apartment_number': rng.randint(1, 100)}
+
+
+class Workload:
+    # Payload builders take (unique name, counts, rng); operations lists what the namespace can run.
+    def __init__(self, namespace, table, build_payload, operations=('get', 'list', 'create', 'update')):
+        self.namespace = namespace
+        self.table = table
+        self.build_payload = build_payload
+        self.operations = operations
+
+
+def dated(payload, days):
+    return dict(payload, start_time='2022-01-01', end_time=(datetime.date(2022, 1, 1) + datetime.timedelta(
+        days=days)).isoformat())
+
+
+WORKLOADS = [
+    Workload('countries', 'countries', lambda name, counts, rng: {
+        'country_name': name, 'official_language': 'language', 'population': '1000', 'details': 1}),
+    Workload('cities', 'cities', lambda name, counts, rng: {
+        'city_name': name, 'country_id': rng.randint(1, counts['countries']),
+        'city_latitude': rng.uniform(-90, 90), 'city_longitude': rng.uniform(-180, 180), 'details': ''}),
+    Workload('tours', 'tours', lambda name, counts, rng: dict(
+        dated(tour_payload(name, rng), 7),
+        tourist_attraction_ids=[rng.randint(1, counts['tourist_attractions']) for _ in range(3)])),
+    Workload('tourist-attractions', 'tourist_attractions', attraction_payload),
+    Workload('hotels', 'hotels', hotel_payload),
+    Workload('transportations', 'transportation',
+             lambda name, counts, rng: dated(transportation_payload(counts, rng), 1)),
+    Workload('customers', 'customers', lambda name, counts, rng: dict(
+        customer_payload(name), date_of_birthday='1990-01-01', password_hash='password', role_id=2)),
+    # Addresses are keyed by customer id and seeded for most customers, so creates would mostly collide;
+    # reads and updates still cover the namespace.
+    Workload('customer_addresses', 'customer_addresses',
+             lambda name, counts, rng: customer_address_payload(counts, rng), operations=('get', 'list', 'update')),
+    Workload('vouchers', 'vouchers', lambda name, counts, rng: {
+        'tour_id': rng.randint(1, counts['tours']), 'customer_ids': [rng.randint(1, counts['customers'])]}),
+    Workload('roles', 'roles', lambda name, counts, rng: {'name': name, 'permission_ids': []}),
+    # Renaming a permission would revoke it from the benchmark account, so permissions are never updated.
+    Workload('permissions', 'permissions', lambda name, counts, rng: {'method': name},
+             operations=('get', 'list', 'create'))
+]
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        operation, weight = part.split('=')
+        weights[operation.strip()] = int(weight)
+    return weights
+
+
+def build_plan(workloads, weights, requests, rng):
+    choices = [(workload, operation) for workload in workloads for operation in workload.operations
+               if weights.get(operation)]
+    return rng.choices(choices, weights=[weights[operation] for _, operation in choices], k=requests)
+
+
+def run_request(client, headers, workload, operation, counts, rng, names):
+    row_count = counts[workload.table]
+    prefix = f'/{workload.namespace}'
+    if operation == 'get':
+        return client.get(f'{prefix}/{rng.randint(1, row_count)}/get', headers=headers)
+    if operation == 'list':
+        return client.get(f'{prefix}/get?limit=100&after={rng.randint(0, max(0, row_count - 100))}', headers=headers)
+    payload = workload.build_payload(f'{workload.namespace}-{next(names)}', counts, rng)
+    if operation == 'create':
+        return client.post(f'{prefix}/post', json=payload, headers=headers)
+    # Updates leave the benchmark account and its admin role untouched.
+    first_id = 2 if workload.table in ('customers', 'roles') else 1
+    return client.put(f'{prefix}/{rng.randint(first_id, max(first_id, row_count))}/update', json=payload,
+                      headers=headers)
+
+
+def run_workload(app, plan, concurrency, counts, seed_value, counter):
+    headers = {'Authorization': 'Basic ' + base64.b64encode(
+        f'{BENCHMARK_USERNAME}:{BENCHMARK_PASSWORD}'.encode('utf8')).decode('utf8')}
+    names = itertools.count()
+    samples = []
+    samples_lock = threading.Lock()
+    chunks = [plan[worker::concurrency] for worker in range(concurrency)]
+
+    def worker(worker_index):
+        client = app.test_client()
+        rng = random.Random(seed_value * 1000 + worker_index)
+        worker_samples = []
+        for workload, operation in chunks[worker_index]:
+            counter.reset()
+            started_at = time.perf_counter()
+            response = run_request(client, headers, workload, operation, counts, rng, names)
+            elapsed = time.perf_counter() - started_at
+            worker_samples.append((workload.namespace, operation, response.status_code, elapsed, counter.statements))
+        with samples_lock:
+            samples.extend(worker_samples)
+
+    # Warm the credential cache and permission matrix so the first requests don't all pay for bcrypt.
+    app.test_client().get('/countries/1/get', headers=headers)
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    return samples, time.perf_counter() - started_at
+
+
+def report(samples, duration):
+    def group_summary(group, group_duration):
+        latencies = [elapsed for _, _, _, elapsed, _ in group]
+        status_counts = {}
+        for _, _, status, _, _ in group:
+            status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+        return dict(summarize(latencies), **{
+            'req_per_s': len(group) / group_duration,
+            'errors': sum(1 for _, _, status, _, _ in group if status >= 500),
+            'status_counts': status_counts,
+            'queries_per_request': sum(statements for _, _, _, _, statements in group) / len(group)
+        })
+
+    groups = {}
+    for sample in samples:
+        groups.setdefault(f'{sample[0]} {sample[1]}', []).append(sample)
+    return {
+        'total': dict(group_summary(samples, duration), duration_s=duration),
+        'operations': {key: group_summary(group, duration) for key, group in sorted(groups.items())}
+    }
+
+
+def find_regressions(results, baseline, max_regression):
+    # Throughput and p95 are gated on the totals; per-operation throughput only mirrors the mix, so operations
+    # are gated on p95 alone and only once both runs have enough samples for a stable percentile.
+    regressions = []
+    current, previous = results['total'], baseline['total']
+    if current['req_per_s'] < previous['req_per_s'] * (1 - max_regression):
+        regressions.append(f"total: req_per_s {previous['req_per_s']:.1f} -> {current['req_per_s']:.1f}")
+    for key, current in [('total', current)] + sorted(results['operations'].items()):
+        previous = baseline['total'] if key == 'total' else baseline['operations'].get(key)
+        if previous is None or min(current['count'], previous['count']) < MIN_GATED_SAMPLES:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + max_regression):
+            regressions.append(f"{key}: p95_ms {previous['p95_ms']:.2f} -> {current['p95_ms']:.2f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent mixed workload against every namespace.')
+    parser.add_argument('--database-uri', default=DEFAULT_DATABASE_URI)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--tours', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='operation weights, e.g. ' + DEFAULT_MIX)
+    parser.add_argument('--namespaces', help='comma separated subset of namespaces to drive')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.10,
+                        help='allowed relative drop in req/s or rise in p95 before exiting with status 1')
+    args = parser.parse_args(argv)
+
+    is_sqlite = args.database_uri.startswith('sqlite')
+    engine_options = {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_SECONDS}} if is_sqlite else {}
+    app = bootstrap(args.database_uri, **engine_options)
+    # Failed requests are counted in the report; their tracebacks would only drown the output.
+    app.logger.setLevel(logging.CRITICAL)
+
+    from config import db
+    workloads = WORKLOADS
+    if args.namespaces:
+        selected = set(args.namespaces.split(','))
+        workloads = [workload for workload in WORKLOADS if workload.namespace in selected]
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        if is_sqlite:
+            enable_sqlite_wal(db.engine)
+        # Seeded tables hold ids 1..rows, which is all the workload needs to pick valid ids and foreign keys.
+        seed_stats = seed_database(db.engine, scaled_counts(args.customers, args.tours), args.seed,
+                                   BENCHMARK_USERNAME, BENCHMARK_PASSWORD, distinct_passwords=1)
+        counts = {name: table_stats['rows'] for name, table_stats in seed_stats.items()}
+        plan = build_plan(workloads, parse_mix(args.mix), args.requests, rng)
+        with ThreadStatementCounter(db.engine) as counter:
+            samples, duration = run_workload(app, plan, args.concurrency, counts, args.seed, counter)
+
+    results = dict(report(samples, duration), config={
+        'database_uri': args.database_uri, 'customers': args.customers, 'tours': args.tours,
+        'requests': args.requests, 'concurrency': args.concurrency, 'mix': args.mix, 'seed': args.seed,
+        'seed_duration_s': seed_stats['total']['seconds']
+    })
+    output = json.dumps(results, indent=2)
+    sys.stdout.write(output + '\n')
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.max_regression)
+        for regression in regressions:
+            sys.stderr.write(f'regression: {regression}\n')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import json
+import sys
+
+from benchmarks.common import DEFAULT_DATABASE_URI, bootstrap, summarize, timed
+from tools.seed_data import scaled_counts, seed_database
+
+
+def list_schemas():
+    # (label, model, many-schema) for every list route; rows are loaded once and serialized repeatedly.
+    from model import City, Country, Customer, CustomerAddresses, Hotel, Permission, Role, Tour, \
+        TouristAttraction, Transportation, Vouchers
+    from schema import cities_schema, countries_schema, customer_addressess_schema, customers_schema_get, \
+        hotels_schema, permissions_schema, roles_schema, tourist_attractions_schema, tours_schema, \
+        transportations_schema, vouchers_schema
+    return [
+        ('countries', Country, countries_schema),
+        ('cities', City, cities_schema),
+        ('hotels', Hotel, hotels_schema),
+        ('tourist_attractions', TouristAttraction, tourist_attractions_schema),
+        ('tours', Tour, tours_schema),
+        ('transportation', Transportation, transportations_schema),
+        ('customers', Customer, customers_schema_get),
+        ('customer_addresses', CustomerAddresses, customer_addressess_schema),
+        ('vouchers', Vouchers, vouchers_schema),
+        ('roles', Role, roles_schema),
+        ('permissions', Permission, permissions_schema)
+    ]
+
+
+def run_schema(label, model, schema, rows, iterations):
+    instances = model.query.order_by(*model.__mapper__.primary_key).limit(rows).all()
+    generic_dtos = schema.marshmallow_dump(instances)
+    compiled_dtos = schema.dump(instances)
+    # Compared as the bytes jsonify would send, so value types and key sets must match too.
+    is_identical = json.dumps(generic_dtos, sort_keys=True, default=str) == \
+        json.dumps(compiled_dtos, sort_keys=True, default=str)
+
+    generic_samples = [timed(schema.marshmallow_dump, instances)[0] for _ in range(iterations)]
+    compiled_samples = [timed(schema.dump, instances)[0] for _ in range(iterations)]
+    generic, compiled = summarize(generic_samples), summarize(compiled_samples)
+    return {
+        'schema': label,
+        'rows': len(instances),
+        'identical_output': is_identical,
+        'marshmallow': generic,
+        'compiled': compiled,
+        'speedup_p50': generic['p50_ms'] / compiled['p50_ms'] if compiled['p50_ms'] else None
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare Marshmallow dump with the compiled serializers.')
+    parser.add_argument('--database-uri', default=DEFAULT_DATABASE_URI)
+    parser.add_argument('--rows', type=int, default=1000, help='rows per list dump, like a full page')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    app = bootstrap(args.database_uri)
+    from config import db
+    with app.app_context():
+        seed_database(db.engine, scaled_counts(args.rows, args.rows), args.seed, distinct_passwords=1)
+        results = [run_schema(label, model, schema, args.rows, args.iterations)
+                   for label, model, schema in list_schemas()]
+
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    if not all(result['identical_output'] for result in results):
+        sys.stderr.write('compiled serializers differ from Marshmallow\n')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import argparse
+import base64
+import http.client
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import SQLITE_BUSY_TIMEOUT_SECONDS, enable_sqlite_wal, summarize
+from benchmarks.load import BENCHMARK_PASSWORD, BENCHMARK_USERNAME, WORKLOADS, build_plan, parse_mix, run_request
+from tools.seed_data import scaled_counts, seed_database
+
+DEFAULT_DATABASE_URI = 'sqlite:///benchmark_serving.db'
+DEFAULT_MIX = 'get=60,list=40'
+MODES = ('wsgi', 'asgi')
+HOST = '127.0.0.1'
+STARTUP_TIMEOUT_SECONDS = 30
+
+
+class HttpClient:
+    # Just enough of the test client interface for load.run_request, over one keep-alive connection.
+    def __init__(self, port):
+        self.port = port
+        self.connection = None
+
+    def get(self, path, headers):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(HOST, self.port, timeout=60)
+        try:
+            self.connection.request('GET', path, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+            response.status_code = response.status
+            return response
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def serve(mode, port):
+    import app as application
+    if mode == 'wsgi':
+        from werkzeug.serving import make_server
+        # What app.py runs today: a thread per connection.
+        make_server(HOST, port, application.app, threaded=True).serve_forever()
+    else:
+        import uvicorn
+        uvicorn.run('asgi:app', host=HOST, port=port, log_level='warning')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, database_uri, threads):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URI=database_uri, ASGI_THREADS=str(threads))
+    process = subprocess.Popen([sys.executable, '-m', 'benchmarks.serving', '--serve', mode, '--port', str(port)],
+                               env=env, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((HOST, port), timeout=1):
+                return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{mode} server did not start on port {port}')
+
+
+def run_level(port, headers, plan, concurrency, counts, seed_value):
+    samples = []
+    errors = []
+    lock = threading.Lock()
+    chunks = [plan[worker::concurrency] for worker in range(concurrency)]
+
+    def worker(worker_index):
+        client = HttpClient(port)
+        rng = random.Random(seed_value * 1000 + worker_index)
+        names = itertools.count()
+        worker_samples, worker_errors = [], 0
+        for workload, operation in chunks[worker_index]:
+            started_at = time.perf_counter()
+            try:
+                status = run_request(client, headers, workload, operation, counts, rng, names).status_code
+            except (OSError, http.client.HTTPException):
+                status = None
+            worker_samples.append(time.perf_counter() - started_at)
+            if status != 200:
+                worker_errors += 1
+        client.close()
+        with lock:
+            samples.extend(worker_samples)
+            errors.append(worker_errors)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started_at
+    return dict(summarize(samples), requests_per_s=len(samples) / duration, errors=sum(errors))
+
+
+def run_mode(mode, args, headers, counts, levels):
+    process, port = start_server(mode, args.database_uri, args.threads)
+    try:
+        rng = random.Random(args.seed)
+        workloads = [workload for workload in WORKLOADS if workload.namespace in args.namespaces.split(',')]
+        # One request first, so every level runs with a warm credential cache and permission matrix.
+        run_request(HttpClient(port), headers, workloads[0], 'get', counts, rng, itertools.count())
+        results = {}
+        for concurrency in levels:
+            plan = build_plan(workloads, parse_mix(args.mix), args.requests, rng)
+            results[concurrency] = run_level(port, headers, plan, concurrency, counts, args.seed)
+        return results
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare concurrent-connection throughput of WSGI and ASGI serving.')
+    parser.add_argument('--database-uri', default=DEFAULT_DATABASE_URI)
+    parser.add_argument('--customers', type=int, default=10000)
+    parser.add_argument('--tours', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per concurrency level')
+    parser.add_argument('--concurrency', default='8,64,256', help='comma-separated numbers of client connections')
+    parser.add_argument('--threads', type=int, default=20, help='ASGI_THREADS of the ASGI server')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='operation weights, e.g. ' + DEFAULT_MIX)
+    parser.add_argument('--namespaces', default='countries,cities,hotels,tours,customers')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    from benchmarks.common import bootstrap
+    from config import db
+    is_sqlite = args.database_uri.startswith('sqlite')
+    engine_options = {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_SECONDS}} if is_sqlite else {}
+    app = bootstrap(args.database_uri, **engine_options)
+    with app.app_context():
+        if is_sqlite:
+            enable_sqlite_wal(db.engine)
+        seed_stats = seed_database(db.engine, scaled_counts(args.customers, args.tours), args.seed,
+                                   BENCHMARK_USERNAME, BENCHMARK_PASSWORD, distinct_passwords=1)
+    db.engine.dispose()
+    counts = {name: table_stats['rows'] for name, table_stats in seed_stats.items()}
+    headers = {'Authorization': 'Basic ' + base64.b64encode(
+        f'{BENCHMARK_USERNAME}:{BENCHMARK_PASSWORD}'.encode('utf8')).decode('utf8')}
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    results = {mode: run_mode(mode, args, headers, counts, levels) for mode in args.modes.split(',')}
+    if set(MODES) <= set(results):
+        results['asgi_speedup'] = {
+            concurrency: results['asgi'][concurrency]['requests_per_s'] / results['wsgi'][concurrency]['requests_per_s']
+            for concurrency in levels
+        }
+    results['config'] = {'database_uri': args.database_uri, 'customers': args.customers, 'tours': args.tours,
+                         'requests': args.requests, 'threads': args.threads, 'mix': args.mix, 'cpus': os.cpu_count()}
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # optional: only needed when a redis:// shared store is configured
+    redis = None
+
+
+class TTLCache:
+    def __init__(self, max_size, ttl_seconds):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return None if entry is None else entry[1]
+
+    def invalidate(self, predicate):
+        with self._lock:
+            stale_keys = [key for key, (_, value) in self._entries.items() if predicate(value)]
+            for key in stale_keys:
+                del self._entries[key]
+        return len(stale_keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'size': size,
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0
+        }
+
+
+class LocalStore:
+    # In-process stand-in for the shared store with the same interface as RedisStore, for tests and local runs.
+    def __init__(self, max_size, ttl_seconds):
+        self._entries = TTLCache(max_size, ttl_seconds)
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, value):
+        self._entries.set(key, value)
+
+
+class RedisStore:
+    # Errors are treated as misses: the database stays the source of truth when Redis is unavailable.
+    def __init__(self, url, ttl_seconds):
+        if redis is None:
+            raise RuntimeError('A redis:// cache store requires the redis package')
+        self._client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key):
+        try:
+            return self._client.get(key)
+        except redis.RedisError:
+            return None
+
+    def set(self, key, value):
+        try:
+            self._client.set(key, value, ex=self.ttl_seconds)
+        except redis.RedisError:
+            pass
+
+
+def create_store(url, max_size, ttl_seconds):
+    if not url:
+        return None
+    if url == 'local://':
+        return LocalStore(max_size, ttl_seconds)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore(url, ttl_seconds)
+    raise ValueError(f'Unsupported cache store URL {url}')
+
+
+class ReadThroughCache:
+    # LRU of JSON-serializable values loaded by loader(key), bounded by entry count and by the encoded size of the
+    # values. Entries are stamped with get_version() as read before loading, and a hit only counts while the stamp
+    # is still current, so a version bump invalidates every entry at once. Misses go to the optional shared store
+    # before the loader; its keys include the version, so entries written under an older version are never read.
+    def __init__(self, name, loader, get_version, max_size, max_bytes, store=None):
+        self.name = name
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._loader = loader
+        self._get_version = get_version
+        self._store = store
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _store_key(self, version, key):
+        return f'{self.name}:{version}:{key}'
+
+    def _put(self, key, version, value, size):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (version, value, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_size or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def get(self, key):
+        version = self._get_version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        if self._store is not None:
+            encoded = self._store.get(self._store_key(version, key))
+            if encoded is not None:
+                value = json.loads(encoded)
+                self._put(key, version, value, len(encoded))
+                with self._lock:
+                    self.store_hits += 1
+                return value
+
+        value = self._loader(key)
+        with self._lock:
+            self.misses += 1
+        if value is None:
+            return None
+        encoded = json.dumps(value)
+        self._put(key, version, value, len(encoded))
+        if self._store is not None:
+            self._store.set(self._store_key(version, key), encoded)
+        return value
+
+    def invalidate(self, key):
+        # Called by write handlers after commit. The commit's version bump already retires the entry in every
+        # worker (and every shared store key of the old version); dropping it here frees its memory right away.
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            size, size_bytes = len(self._entries), self._bytes
+            hits, store_hits, misses, evictions = self.hits, self.store_hits, self.misses, self.evictions
+        lookups = hits + store_hits + misses
+        return {
+            'name': self.name,
+            'size': size,
+            'max_size': self.max_size,
+            'bytes': size_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': hits,
+            'store_hits': store_hits,
+            'misses': misses,
+            'evictions': evictions,
+            'hit_ratio': (hits + store_hits) / lookups if lookups else 0.0,
+            'shared_store': self._store.__class__.__name__ if self._store is not None else None
+        }
+
+
+class ResponseCache:
+    # LRU of encoded response bodies keyed by request, bounded by entry count and total body bytes. Each entry
+    # keeps the stamp it was stored under and only matches a lookup with the same stamp.
+    def __init__(self, max_size, max_bytes):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, stamp):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stamp:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, stamp, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (stamp, value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_size or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            size, size_bytes = len(self._entries), self._bytes
+            hits, misses, evictions = self.hits, self.misses, self.evictions
+        lookups = hits + misses
+        return {
+            'size': size,
+            'max_size': self.max_size,
+            'bytes': size_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': hits,
+            'misses': misses,
+            'evictions': evictions,
+            'hit_ratio': hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,78 @@
+import gzip
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional: without it clients are offered gzip and deflate only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/javascript', 'application/x-ndjson')
+
+# (largest body, gzip/deflate level, brotli quality): small and mid-sized bodies get the better ratio, large ones
+# a faster level, so a 10k-row page does not spend more CPU on compression than on its query and encoding.
+COMPRESSION_LEVELS = (
+    (64 * 1024, 6, 5),
+    (1024 * 1024, 5, 4),
+    (None, 3, 3)
+)
+
+
+def available_encodings():
+    # In order of preference when the client weighs them equally.
+    return ('br', 'gzip', 'deflate') if brotli is not None else ('gzip', 'deflate')
+
+
+def choose_encoding():
+    if not current_app.config['COMPRESSION_ENABLED']:
+        return None
+    return request.accept_encodings.best_match(available_encodings())
+
+
+def compression_level(size, encoding):
+    for max_size, zlib_level, brotli_quality in COMPRESSION_LEVELS:
+        if max_size is None or size <= max_size:
+            return brotli_quality if encoding == 'br' else zlib_level
+
+
+def compress(body, encoding):
+    level = compression_level(len(body), encoding)
+    if encoding == 'br':
+        return brotli.compress(body, mode=brotli.MODE_TEXT, quality=level)
+    if encoding == 'gzip':
+        # A fixed mtime keeps the output identical for identical bodies.
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    if encoding == 'deflate':
+        return zlib.compress(body, level)
+    raise ValueError(f'Unsupported content encoding {encoding}')
+
+
+def is_compressible(response):
+    return response.status_code == 200 and not response.direct_passthrough and not response.is_streamed \
+        and 'Content-Encoding' not in response.headers \
+        and (response.mimetype in COMPRESSIBLE_MIMETYPES or response.mimetype.startswith('text/'))
+
+
+def compress_response(response, encoding):
+    # Compresses the body in place when the client accepts `encoding` and the body is worth it. Bodies below
+    # COMPRESSION_MIN_SIZE bytes go out as they are: the framing overhead eats most of the saving there.
+    if not is_compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < current_app.config['COMPRESSION_MIN_SIZE']:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _compress_response(response):
+    return compress_response(response, choose_encoding())
+
+
+def init_compression(app):
+    app.after_request(_compress_response)
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class PoolWaitStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total_seconds = 0.0
+        self.wait_max_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait_seconds, is_timeout=False):
+        with self._lock:
+            if is_timeout:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total_seconds += wait_seconds
+            self.wait_max_seconds = max(self.wait_max_seconds, wait_seconds)
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that records how long callers block waiting for a free connection.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.wait_stats.record(time.perf_counter() - started_at, is_timeout=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - started_at)
+        return connection
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'pool_class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'max_overflow': pool._max_overflow,
+            'timeout_seconds': pool.timeout()
+        })
+    wait_stats = getattr(pool, 'wait_stats', None)
+    if wait_stats is not None:
+        waits = wait_stats.checkouts + wait_stats.timeouts
+        stats.update({
+            'checkouts': wait_stats.checkouts,
+            'timeouts': wait_stats.timeouts,
+            'wait_total_ms': wait_stats.wait_total_seconds * 1000,
+            'wait_max_ms': wait_stats.wait_max_seconds * 1000,
+            'wait_mean_ms': wait_stats.wait_total_seconds * 1000 / waits if waits else 0.0
+        })
+    return stats
@@ -0,0 +1,143 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Server-Timing metric name for each phase recorded in g.request_timings.
+SERVER_TIMING_NAMES = {
+    'auth': 'auth',
+    'auth_bcrypt': 'auth-bcrypt',
+    'auth_permission': 'auth-permission',
+    'db': 'db',
+    'serialize': 'serialize'
+}
+
+_state = {'enabled': False}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        cumulative_counts = {}
+        cumulative_count = 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), self.bucket_counts):
+            cumulative_count += bucket_count
+            cumulative_counts[str(bound)] = cumulative_count
+        return {'buckets': cumulative_counts, 'count': self.count, 'sum': self.sum}
+
+
+class RouteTimings:
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route, name, value, buckets=LATENCY_BUCKETS_MS):
+        with self._lock:
+            histogram = self._histograms.get((route, name))
+            if histogram is None:
+                histogram = self._histograms[(route, name)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def to_dict(self):
+        with self._lock:
+            routes = {}
+            for (route, name), histogram in sorted(self._histograms.items()):
+                routes.setdefault(route, {})[name] = histogram.to_dict()
+            return routes
+
+
+route_timings = RouteTimings()
+
+
+def is_enabled():
+    return _state['enabled']
+
+
+def _add_timing(name, seconds):
+    timings = g.setdefault('request_timings', {})
+    timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timing(name):
+    if not _state['enabled'] or not has_request_context():
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_timing(name, time.perf_counter() - started_at)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info['query_started_at'].pop()
+    if has_request_context():
+        _add_timing('db', time.perf_counter() - started_at)
+        g.request_query_count = g.get('request_query_count', 0) + 1
+
+
+def _handle_error(exception_context):
+    started_at = exception_context.connection.info.get('query_started_at') \
+        if exception_context.connection is not None else None
+    if started_at:
+        started_at.pop()
+
+
+def _start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+
+def _finish_request_timer(response):
+    started_at = g.get('request_started_at')
+    if started_at is None:
+        return response
+
+    timings = g.get('request_timings', {})
+    query_count = g.get('request_query_count', 0)
+    total = time.perf_counter() - started_at
+
+    server_timing = [f'total;dur={total * 1000:.3f}']
+    for name, value in timings.items():
+        description = f';desc="{query_count} queries"' if name == 'db' else ''
+        server_timing.append(f'{SERVER_TIMING_NAMES.get(name, name)};dur={value * 1000:.3f}{description}')
+    response.headers['Server-Timing'] = ', '.join(server_timing)
+
+    route = f'{request.method} {request.url_rule.rule}' if request.url_rule is not None else 'unmatched'
+    route_timings.observe(route, 'total', total * 1000)
+    for name, value in timings.items():
+        route_timings.observe(route, name, value * 1000)
+    route_timings.observe(route, 'queries', query_count, QUERY_COUNT_BUCKETS)
+    return response
+
+
+def init_request_timing(app):
+    if not app.config['REQUEST_TIMING_ENABLED'] or _state['enabled']:
+        return
+    _state['enabled'] = True
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    app.before_request(_start_request_timer)
+    app.after_request(_finish_request_timer)
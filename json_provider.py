@@ -0,0 +1,98 @@
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:  # Flask < 2.2 configures JSON through app.json_encoder instead
+    from flask.json import JSONEncoder
+    DefaultJSONProvider = None
+
+try:
+    import orjson
+except ImportError:  # optional: without it every response goes through the stdlib encoder
+    orjson = None
+
+JSON_BACKENDS = ('auto', 'orjson', 'stdlib')
+
+# Both print a float as its shortest round-trip digits, and agree on the text wherever both use fixed notation: from
+# 1e-4 up to 1e16. Outside it the exponent formats differ (1e-05 and 1e+16 from the stdlib, 0.00001 and 1e16 or 1e+16
+# from orjson depending on its version), and NaN and Infinity, which the stdlib writes as bare NaN/Infinity, come out of
+# orjson as null. The floats are checked by value, since the text forms cannot be told apart from strings cheaply.
+FIXED_NOTATION_MIN = 1e-4
+FIXED_NOTATION_MAX = 1e16
+
+
+def has_stdlib_only_float(obj):
+    kind = type(obj)
+    if kind is float:
+        # NaN fails the range check like Infinity does, since every comparison with it is false.
+        return obj != 0 and not FIXED_NOTATION_MIN <= abs(obj) < FIXED_NOTATION_MAX
+    if kind is dict:
+        return any(map(has_stdlib_only_float, obj.values()))
+    if kind is list or kind is tuple:
+        return any(map(has_stdlib_only_float, obj))
+    return False
+
+
+def orjson_dumps(obj, sort_keys, default):
+    # Returns the same text json.dumps(obj, separators=(',', ':'), ensure_ascii=True, sort_keys=sort_keys,
+    # default=default) would, or None when only the stdlib can produce it: non-ASCII output (ensure_ascii escapes
+    # it), floats outside fixed notation, NaN and Infinity, integers beyond 64 bits, non-string keys or values the
+    # default cannot convert. Dates, dataclasses and str/int/dict/list subclasses are handed to `default` (Flask's
+    # HTTP-date conversion for dates) rather than serialized natively.
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    try:
+        data = orjson.dumps(obj, default=default, option=option)
+    except TypeError:
+        return None
+    if not data.isascii():
+        return None
+    if has_stdlib_only_float(obj):
+        return None
+    return data.decode('ascii')
+
+
+def is_compact(indent, separators, ensure_ascii):
+    return indent is None and tuple(separators or ()) == (',', ':') and ensure_ascii
+
+
+if DefaultJSONProvider is not None:
+    class FastJSONProvider(DefaultJSONProvider):
+        # Flask >= 2.2: jsonify encodes through app.json.
+        def dumps(self, obj, **kwargs):
+            if 'cls' not in kwargs and is_compact(kwargs.get('indent'), kwargs.get('separators'),
+                                                  kwargs.get('ensure_ascii', self.ensure_ascii)):
+                data = orjson_dumps(obj, kwargs.get('sort_keys', self.sort_keys), kwargs.get('default', self.default))
+                if data is not None:
+                    return data
+            return super().dumps(obj, **kwargs)
+else:
+    class FastJSONEncoder(JSONEncoder):
+        # Flask < 2.2: jsonify encodes through app.json_encoder.
+        def encode(self, o):
+            if is_compact(self.indent, (self.item_separator, self.key_separator), self.ensure_ascii):
+                data = orjson_dumps(o, self.sort_keys, self.default)
+                if data is not None:
+                    return data
+            return super().encode(o)
+
+
+def resolve_backend(backend):
+    if backend not in JSON_BACKENDS:
+        raise ValueError(f'JSON_BACKEND must be one of {", ".join(JSON_BACKENDS)}')
+    if backend == 'auto':
+        return 'orjson' if orjson is not None else 'stdlib'
+    if backend == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_BACKEND is orjson but orjson is not installed')
+    return backend
+
+
+def init_json(app):
+    # orjson only takes the payloads whose text it is known to produce the way the stdlib does and leaves the rest to
+    # it; benchmarks/json_encoding.py compares the two on real list pages.
+    backend = resolve_backend(app.config['JSON_BACKEND'])
+    app.config['JSON_BACKEND'] = backend
+    if DefaultJSONProvider is not None:
+        app.json_provider_class = FastJSONProvider if backend == 'orjson' else DefaultJSONProvider
+        app.json = app.json_provider_class(app)
+    else:
+        app.json_encoder = FastJSONEncoder if backend == 'orjson' else JSONEncoder
@@ -0,0 +1,129 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, request
+
+LATENCY_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class RequestMetrics:
+    # Label sets are (namespace, method, status); all updates for a request happen under one lock acquire.
+    def __init__(self, buckets=LATENCY_BUCKETS_SECONDS):
+        self.buckets = buckets
+        self.in_flight = 0
+        self._requests = {}
+        self._latencies = {}
+        self._collectors = []
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def namespace_of(self, rule):
+        namespace = self._namespaces.get(rule)
+        if namespace is None:
+            namespace = self._namespaces[rule] = rule.strip('/').split('/', 1)[0] or 'root'
+        return namespace
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finish(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def observe(self, namespace, method, status, seconds):
+        with self._lock:
+            key = (namespace, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+            latency_key = (namespace, method)
+            latency = self._latencies.get(latency_key)
+            if latency is None:
+                latency = self._latencies[latency_key] = [[0] * (len(self.buckets) + 1), 0.0]
+            latency[0][bisect_left(self.buckets, seconds)] += 1
+            latency[1] += seconds
+
+    def register_collector(self, collector):
+        # collector() returns an iterable of (name, type, help, [(labels, value), ...]) evaluated at scrape time.
+        self._collectors.append(collector)
+
+    def render(self):
+        with self._lock:
+            requests = sorted(self._requests.items())
+            latencies = sorted((key, (list(bucket_counts), total))
+                               for key, (bucket_counts, total) in self._latencies.items())
+            in_flight = self.in_flight
+
+        lines = [
+            '# HELP http_requests_total Total HTTP requests by namespace, method and status code.',
+            '# TYPE http_requests_total counter'
+        ]
+        for (namespace, method, status), count in requests:
+            labels = _format_labels((('namespace', namespace), ('method', method), ('status', status)))
+            lines.append(f'http_requests_total{{{labels}}} {count}')
+
+        lines.append('# HELP http_request_duration_seconds HTTP request latency by namespace and method.')
+        lines.append('# TYPE http_request_duration_seconds histogram')
+        for (namespace, method), (bucket_counts, total) in latencies:
+            labels = _format_labels((('namespace', namespace), ('method', method)))
+            cumulative_count = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), bucket_counts):
+                cumulative_count += bucket_count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative_count}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {total!r}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {cumulative_count}')
+
+        lines.append('# HELP http_requests_in_flight HTTP requests currently being served.')
+        lines.append('# TYPE http_requests_in_flight gauge')
+        lines.append(f'http_requests_in_flight {in_flight}')
+
+        for collector in self._collectors:
+            for name, metric_type, description, samples in collector():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    labels = f'{{{_format_labels(labels)}}}' if labels else ''
+                    lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
+
+
+def _start_request():
+    g.metrics_started_at = time.perf_counter()
+    request_metrics.start()
+
+
+def _record_request(response):
+    started_at = g.get('metrics_started_at')
+    if started_at is not None:
+        rule = request.url_rule
+        namespace = request_metrics.namespace_of(rule.rule) if rule is not None else 'unmatched'
+        request_metrics.observe(namespace, request.method, response.status_code, time.perf_counter() - started_at)
+    return response
+
+
+def _finish_request(exception):
+    if g.pop('metrics_started_at', None) is not None:
+        request_metrics.finish()
+
+
+def init_metrics(app):
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+    app.teardown_request(_finish_request)
+
+
+def render_metrics():
+    return Response(request_metrics.render(), content_type=CONTENT_TYPE)
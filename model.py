@@ -91,10 +91,25 @@ class Tour(db.Model):
     end_time = db.Column(db.Date, nullable=False)
     description = db.Column(db.String(64), nullable=False)
     recommended_pocket_money = db.Column(db.Integer)
+    # Seats taken by voucher customers, maintained by the voucher endpoints (api/occupancy.py).
+    booked_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     # voucher = db.relationship('voucher', secondary=vouchers)
     # t_attractions = db.relationship('t_attractions', secondary=tour_attractions)
     # t_hotels = db.relationship('t_hotels', secondary=tour_hotels)
     __table_args__ = tuple((UniqueConstraint('name')))
+    # Columns a ?fields= projection has to load for the properties below (api/projection.py).
+    property_columns = {'seats_left': ('person_count', 'booked_count')}
+
+    @property
+    def seats_left(self):
+        return self.person_count - self.booked_count
+
+
+# Keyset indexes for /tours/search, one per sort: the leading (sort_column, id) serves the ordering without a
+# filesort and seeks on that column's filter, and the trailing filter columns let the date window, price and
+# person count predicates be checked on the index entries (index condition pushdown) before any row is read.
+db.Index('ix_tours_search_start_time', Tour.start_time, Tour.id, Tour.end_time, Tour.price, Tour.person_count)
+db.Index('ix_tours_search_price', Tour.price, Tour.id, Tour.start_time, Tour.end_time, Tour.person_count)
 
 
 class TouristAttraction(db.Model):
@@ -175,3 +190,18 @@ class TourAttraction(db.Model):
 
     tours = db.relationship("Tour")
     tourist_attractions = db.relationship("TouristAttraction")
+
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CredentialRevocation(db.Model):
+    # One row per change of a customer's cached credentials (password, blocked flag, role or deletion), written in
+    # the same transaction; workers drop that customer's cached credentials when they see it.
+    __tablename__ = 'credential_revocations'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    customer_id = db.Column(db.Integer, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=False, index=True)
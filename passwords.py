@@ -0,0 +1,22 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+# bcrypt.gensalt()'s default work factor, which every password written through the API is hashed with.
+DEFAULT_ROUNDS = 12
+
+
+def hash_password(password, rounds=DEFAULT_ROUNDS):
+    return bcrypt.hashpw(password.encode('utf8'), bcrypt.gensalt(rounds)).decode('utf8')
+
+
+def hash_passwords(passwords, rounds=DEFAULT_ROUNDS, workers=None):
+    # bcrypt releases the GIL while it hashes, but salting and encoding each password is Python work that does not;
+    # processes run both in parallel, and the work factor dwarfs the cost of shipping strings to them.
+    if len(passwords) < 2:
+        return [hash_password(password, rounds) for password in passwords]
+    workers = min(workers or os.cpu_count() or 1, len(passwords))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(hash_password, passwords, [rounds] * len(passwords),
+                                 chunksize=max(1, len(passwords) // (4 * workers))))
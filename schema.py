@@ -1,9 +1,41 @@
 from flask_restx import fields
 
 from config import ma, api
-
-
-class RoleSchema(ma.Schema):
+from instrumentation import timing
+from serializers import compile_serializer, is_compilable
+
+
+class Schema(ma.Schema):
+    # Schemas made of Meta.fields only are compiled into a plain row -> dict function when instantiated, i.e. at
+    # import time for the module-level schemas below; marshmallow_dump keeps the generic path for comparison.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._serialize_row = compile_serializer(self) if is_compilable(self) else None
+        self._projections = {}
+
+    def project(self, fields):
+        # The schema restricted to `fields` (a ?fields= projection, see api/projection.py), compiled once per field
+        # set. Callers pass the names in Meta.fields order, which bounds the cache by the subsets of Meta.fields.
+        if fields is None:
+            return self
+        projected = self._projections.get(fields)
+        if projected is None:
+            projected = self._projections[fields] = self.__class__(only=fields, many=self.many)
+        return projected
+
+    def dump(self, obj, *, many=None):
+        with timing('serialize'):
+            if self._serialize_row is None:
+                return super().dump(obj, many=many)
+            if self.many if many is None else many:
+                return [self._serialize_row(row) for row in obj]
+            return self._serialize_row(obj)
+
+    def marshmallow_dump(self, obj, *, many=None):
+        return super().dump(obj, many=many)
+
+
+class RoleSchema(Schema):
     class Meta:
         fields = (
             'id',
@@ -22,7 +54,7 @@ role_schema = RoleSchema()
 roles_schema = RoleSchema(many=True)
 
 
-class CustomerSchema(ma.Schema):
+class CustomerSchema(Schema):
     class Meta:
         fields = (
             'id',
@@ -59,7 +91,7 @@ customer_schema = CustomerSchema()
 customers_schema = CustomerSchema(many=True)
 
 
-class PermissionSchema(ma.Schema):
+class PermissionSchema(Schema):
     class Meta:
         fields = (
             'id',
@@ -75,7 +107,7 @@ permission_schema = PermissionSchema()
 permissions_schema = PermissionSchema(many=True)
 
 
-class CountrySchema(ma.Schema):
+class CountrySchema(Schema):
     class Meta:
         fields = (
             'id',
@@ -97,7 +129,7 @@ country_schema = CountrySchema()
 countries_schema = CountrySchema(many=True)
 
 
-class TourSchema(ma.Schema):
+class TourSchema(Schema):
     class Meta:
         fields = (
             'id',
@@ -108,6 +140,8 @@ class TourSchema(ma.Schema):
             'end_time',
             'description',
             'recommended_pocket_money',
+            'booked_count',
+            'seats_left',
             'tourist_attraction_ids'
         )
 
@@ -127,7 +161,7 @@ tour_schema = TourSchema()
 tours_schema = TourSchema(many=True)
 
 
-class TouristAttractionSchema(ma.Schema):
+class TouristAttractionSchema(Schema):
     class Meta:
         fields = (
             'id',
@@ -150,7 +184,7 @@ tourist_attraction_schema = TouristAttractionSchema()
 tourist_attractions_schema = TouristAttractionSchema(many=True)
 
 
-class CitySchema(ma.Schema):
+class CitySchema(Schema):
     class Meta:
         fields = (
             'id',
@@ -174,7 +208,7 @@ city_schema = CitySchema()
 cities_schema = CitySchema(many=True)
 
 
-class TransportationSchema(ma.Schema):
+class TransportationSchema(Schema):
     class Meta:
         fields = (
             'id',
@@ -202,7 +236,7 @@ transportation_schema = TransportationSchema()
 transportations_schema = TransportationSchema(many=True)
 
 
-class CustomerAddressesSchema(ma.Schema):
+class CustomerAddressesSchema(Schema):
     class Meta:
         fields = (
             'id',
@@ -228,7 +262,7 @@ customer_addresses_schema = CustomerAddressesSchema()
 customer_addressess_schema = CustomerAddressesSchema(many=True)
 
 
-class HotelSchema(ma.Schema):
+class HotelSchema(Schema):
     class Meta:
         fields = (
             'id',
@@ -252,7 +286,7 @@ hotel_schema = HotelSchema()
 hotels_schema = HotelSchema(many=True)
 
 
-class VoucherSchema(ma.Schema):
+class VoucherSchema(Schema):
     class Meta:
         fields = (
             'id',
@@ -282,7 +316,7 @@ vouchers_schema = VoucherSchema(many=True)
 # tour_attraction_schema = TourAttractionSchema()
 # tour_attraction_s_schema = TourAttractionSchema(many=True)
 
-class CustomerSchemaGet(ma.Schema):
+class CustomerSchemaGet(Schema):
     class Meta:
         fields = (
             'id',
@@ -315,3 +349,11 @@ customer_model_get = api.model('Customer_Demo_Get', {
 
 customer_schema_get = CustomerSchemaGet()
 customers_schema_get = CustomerSchemaGet(many=True)
+
+
+batch_result_model = api.model('Batch_Item_Result', {
+    'index': fields.Integer(0),
+    'status': fields.Integer(201),
+    'id': fields.Integer(1),
+    'message': fields.String('There is no such father row!!')
+})
@@ -0,0 +1,69 @@
+import datetime as dt
+from functools import partial
+
+from marshmallow import missing
+
+# Values of these exact types come out of Marshmallow's inferred fields unchanged (int(x), float(x), str(x) or
+# the value itself), so they are copied without a conversion call.
+UNCHANGED_TYPES = {str, int, float, bool, list, tuple, set, type(None)}
+
+
+def _decode_utf8(value):
+    return value.decode('utf-8')
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def build_converters(schema):
+    # Meta.fields become Inferred fields, which pick a field class from the schema's TYPE_MAPPING by the exact
+    # type of each value. The same lookup is done here once per type; the common conversions are plain functions
+    # and the rest reuse Marshmallow's own field.
+    converters = {}
+    for value_type, field_class in schema.TYPE_MAPPING.items():
+        if value_type not in UNCHANGED_TYPES:
+            converters[value_type] = partial(field_class()._serialize, attr=None, obj=None)
+    converters.update({bytes: _decode_utf8, dt.date: _isoformat, dt.datetime: _isoformat, dt.time: _isoformat})
+    return converters
+
+
+def is_compilable(schema):
+    return bool(schema.opts.fields) and not schema.declared_fields and not schema._hooks \
+        and not schema.exclude and not schema.opts.additional
+
+
+def compile_serializer(schema):
+    # Generates `def serialize(obj)` with one unrolled block per field instead of a pass through Marshmallow's
+    # field machinery. Values already loaded on an ORM instance are read from its __dict__, skipping the
+    # attribute instrumentation; anything else (properties, expired or unloaded columns) goes through getattr.
+    # Missing attributes are left out and objects supporting item access are read like Marshmallow reads them,
+    # keeping the output identical.
+    names = [name for name in schema.opts.fields if schema.only is None or name in schema.only]
+    lines = [
+        'def serialize(obj):',
+        '    if hasattr(obj.__class__, "__getitem__"):',
+        '        get, loaded = get_attribute, no_attributes',
+        '    else:',
+        '        get, loaded = getattr, getattr(obj, "__dict__", no_attributes)',
+        '    result = {}'
+    ]
+    for name in names:
+        lines += [
+            f'    value = loaded.get({name!r}, missing)',
+            '    if value is missing:',
+            f'        value = get(obj, {name!r}, missing)',
+            '    if value is not missing:',
+            '        convert = converters.get(value.__class__)',
+            f'        result[{name!r}] = value if convert is None else convert(value)'
+        ]
+    lines.append('    return result')
+
+    namespace = {
+        'missing': missing,
+        'no_attributes': {},
+        'converters': build_converters(schema),
+        'get_attribute': schema.get_attribute
+    }
+    exec(compile('\n'.join(lines), f'<serializer {schema.__class__.__name__}>', 'exec'), namespace)
+    return namespace['serialize']
@@ -0,0 +1,295 @@
+import argparse
+import datetime
+import json
+import sys
+import time
+from array import array
+from operator import itemgetter
+from random import Random
+
+from passwords import hash_passwords
+
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_DISTINCT_PASSWORDS = 1000
+DEFAULT_PASSWORD_ROUNDS = 12
+
+LANGUAGES = ('English', 'Spanish', 'French', 'German', 'Italian', 'Ukrainian', 'Polish', 'Portuguese', 'Greek')
+ATTRACTION_TYPES = ('EXCURSION', 'MUSEUM', 'PARK', 'MONUMENT', 'BEACH', 'CASTLE', 'THEATRE')
+TRANSPORT_TYPES = ('BUS', 'TRAIN', 'PLANE', 'SHIP')
+FIRST_NAMES = ('Olena', 'Taras', 'Iryna', 'Andrii', 'Maria', 'Dmytro', 'Sofiia', 'Oleh', 'Anna', 'Yurii')
+LAST_NAMES = ('Shevchenko', 'Kovalenko', 'Bondarenko', 'Tkachenko', 'Kravchenko', 'Melnyk', 'Boiko', 'Zanevych')
+FIRST_DATE = datetime.date(2022, 1, 1)
+
+
+def scaled_counts(customers, tours):
+    countries = max(10, tours // 1000)
+    cities = countries * 20
+    return {
+        'countries': countries,
+        'cities': cities,
+        'hotels': cities * 5,
+        'tourist_attractions': cities * 5,
+        'tours': tours,
+        'customers': customers,
+        'customer_addresses': customers * 4 // 5,
+        'vouchers': customers // 2
+    }
+
+
+def table_rng(seed, table_name):
+    # One generator per table keeps every table reproducible even when another table's generator changes.
+    return Random(f'{seed}:{table_name}')
+
+
+def generate_countries(counts, seed):
+    rng = table_rng(seed, 'countries')
+    for country_id in range(1, counts['countries'] + 1):
+        yield {'id': country_id, 'country_name': f'Country {country_id}', 'official_language': rng.choice(LANGUAGES),
+               'population': str(rng.randint(10 ** 5, 10 ** 8)), 'details': rng.randint(0, 100)}
+
+
+def generate_cities(counts, seed):
+    rng = table_rng(seed, 'cities')
+    for city_id in range(1, counts['cities'] + 1):
+        yield {'id': city_id, 'city_name': f'City {city_id}', 'country_id': rng.randint(1, counts['countries']),
+               'city_latitude': round(rng.uniform(-60, 70), 6), 'city_longitude': round(rng.uniform(-180, 180), 6),
+               'details': ''}
+
+
+def generate_hotels(counts, seed):
+    rng = table_rng(seed, 'hotels')
+    for hotel_id in range(1, counts['hotels'] + 1):
+        hotel_class = rng.choices(range(1, 6), (1, 3, 5, 3, 1))[0]
+        yield {'id': hotel_id, 'name': f'Hotel {hotel_id}', 'hotel_class': f'{hotel_class}*',
+               'city_id': rng.randint(1, counts['cities']), 'is_animals_allowed': rng.random() < 0.3, 'details': ''}
+
+
+def generate_tourist_attractions(counts, seed):
+    rng = table_rng(seed, 'tourist_attractions')
+    for attraction_id in range(1, counts['tourist_attractions'] + 1):
+        yield {'id': attraction_id, 'name': f'Attraction {attraction_id}', 'type': rng.choice(ATTRACTION_TYPES),
+               'city_id': rng.randint(1, counts['cities']), 'details': ''}
+
+
+class TourSchedule:
+    # Dates and capacity of every tour, kept in compact arrays because transportation legs and vouchers need them
+    # long after the tour rows themselves have been inserted.
+    def __init__(self, counts, seed):
+        rng = table_rng(seed, 'tour_schedule')
+        self.start_days = array('i')
+        self.durations = array('i')
+        self.person_counts = array('i')
+        for _ in range(counts['tours']):
+            self.start_days.append(rng.randint(0, 4 * 365))
+            self.durations.append(rng.randint(3, 21))
+            self.person_counts.append(rng.randint(10, 60))
+
+    def dates(self, tour_id):
+        start_time = FIRST_DATE + datetime.timedelta(days=self.start_days[tour_id - 1])
+        return start_time, start_time + datetime.timedelta(days=self.durations[tour_id - 1])
+
+
+def generate_tours(counts, seed, schedule):
+    rng = table_rng(seed, 'tours')
+    booked_counts = array('i', [0]) * counts['tours']
+    for _, tour_id, customer_ids in iterate_vouchers(counts, seed, schedule):
+        booked_counts[tour_id - 1] += len(customer_ids)
+    for tour_id in range(1, counts['tours'] + 1):
+        start_time, end_time = schedule.dates(tour_id)
+        yield {'id': tour_id, 'name': f'Tour {tour_id}', 'price': int(rng.lognormvariate(7, 0.6)),
+               'person_count': schedule.person_counts[tour_id - 1], 'start_time': start_time, 'end_time': end_time,
+               'description': f'Tour {tour_id}', 'recommended_pocket_money': rng.choice((None, 100, 200, 500, 1000)),
+               'booked_count': booked_counts[tour_id - 1]}
+
+
+def generate_tour_attractions(counts, seed):
+    rng = table_rng(seed, 'tour_attractions')
+    for tour_id in range(1, counts['tours'] + 1):
+        for attraction_id in rng.sample(range(1, counts['tourist_attractions'] + 1), 3):
+            yield {'tour_id': tour_id, 'tourist_attractions_id': attraction_id}
+
+
+def generate_transportation(counts, seed, schedule):
+    # Every tour travels out, between two cities and back, with legs dated inside the tour window.
+    rng = table_rng(seed, 'transportation')
+    transportation_id = 0
+    for tour_id in range(1, counts['tours'] + 1):
+        start_time, end_time = schedule.dates(tour_id)
+        middle_time = start_time + (end_time - start_time) / 2
+        home_city_id, first_city_id, second_city_id = rng.sample(range(1, counts['cities'] + 1), 3)
+        for start_city_id, end_city_id, leg_time in ((home_city_id, first_city_id, start_time),
+                                                     (first_city_id, second_city_id, middle_time),
+                                                     (second_city_id, home_city_id, end_time)):
+            transportation_id += 1
+            yield {'id': transportation_id, 'tour_id': tour_id, 'transport_type': rng.choice(TRANSPORT_TYPES),
+                   'start_time': leg_time, 'end_time': leg_time, 'start_city_id': start_city_id,
+                   'end_city_id': end_city_id, 'details': ''}
+
+
+def iterate_vouchers(counts, seed, schedule):
+    # Yields (voucher_id, tour_id, customer_ids). Voucher sizes never exceed the seats left on their tour, so
+    # seeded occupancy stays consistent; this is replayed for booked_count and the link table instead of being held
+    # in memory.
+    rng = table_rng(seed, 'vouchers')
+    seats_left = array('i', schedule.person_counts)
+    for voucher_id in range(1, counts['vouchers'] + 1):
+        tour_index = rng.randrange(counts['tours'])
+        for _ in range(counts['tours']):
+            if seats_left[tour_index]:
+                break
+            tour_index = (tour_index + 1) % counts['tours']
+        else:
+            return
+        size = min(rng.randint(1, 4), seats_left[tour_index], counts['customers'])
+        seats_left[tour_index] -= size
+        yield voucher_id, tour_index + 1, rng.sample(range(1, counts['customers'] + 1), size)
+
+
+def generate_vouchers(counts, seed, schedule):
+    for voucher_id, tour_id, _ in iterate_vouchers(counts, seed, schedule):
+        yield {'id': voucher_id, 'tour_id': tour_id}
+
+
+def generate_voucher_customers(counts, seed, schedule):
+    for voucher_id, _, customer_ids in iterate_vouchers(counts, seed, schedule):
+        for customer_id in customer_ids:
+            yield {'voucher_id': voucher_id, 'customer_id': customer_id}
+
+
+def generate_customers(counts, seed, password_hashes, admin_username, admin_password_hash):
+    rng = table_rng(seed, 'customers')
+    for customer_id in range(1, counts['customers'] + 1):
+        is_admin = customer_id == 1
+        yield {'id': customer_id, 'username': admin_username if is_admin else f'customer{customer_id}',
+               'first_name': rng.choice(FIRST_NAMES), 'middle_name': rng.choice(FIRST_NAMES),
+               'last_name': rng.choice(LAST_NAMES), 'phone': f'380{rng.randint(10 ** 8, 10 ** 9 - 1)}',
+               'date_of_birthday': datetime.date(1950, 1, 1) + datetime.timedelta(days=rng.randint(0, 55 * 365)),
+               'gender': rng.choice(('F', 'M')), 'is_covid_vaccinated': rng.random() < 0.7, 'is_blocked': False,
+               'password_hash': admin_password_hash if is_admin else password_hashes[customer_id % len(password_hashes)],
+               'role_id': 1 if is_admin else 2}
+
+
+def generate_customer_addresses(counts, seed):
+    rng = table_rng(seed, 'customer_addresses')
+    for customer_id in range(1, counts['customer_addresses'] + 1):
+        yield {'id': customer_id, 'city_id': rng.randint(1, counts['cities']),
+               'zip_code': f'{rng.randint(10000, 99999)}', 'street': f'Street {rng.randint(1, 500)}',
+               'house_number': str(rng.randint(1, 200)), 'apartment_number': rng.choice((None, rng.randint(1, 300)))}
+
+
+def insert_rows(connection, table, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Rows go straight to the DBAPI cursor as tuples: SQLAlchemy's per-row parameter processing costs more than
+    # the insert itself at these volumes, and pymysql rewrites executemany into multi-row INSERTs on its own.
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if first_row is None:
+        return 0
+    columns = list(first_row)
+    placeholder = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+    statement = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        table.name, ', '.join(columns), ', '.join([placeholder] * len(columns)))
+    as_tuple = itemgetter(*columns)
+
+    cursor = connection.connection.cursor()
+    inserted = 0
+    chunk = [as_tuple(first_row)]
+    for row in rows:
+        chunk.append(as_tuple(row))
+        if len(chunk) == chunk_size:
+            cursor.executemany(statement, chunk)
+            inserted += len(chunk)
+            chunk = []
+    cursor.executemany(statement, chunk)
+    inserted += len(chunk)
+    cursor.close()
+    return inserted
+
+
+def seed_database(engine, counts, seed=1, admin_username='admin', admin_password='admin',
+                  distinct_passwords=DEFAULT_DISTINCT_PASSWORDS, password_rounds=DEFAULT_PASSWORD_ROUNDS,
+                  workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Ids are assigned here rather than by the database, so every foreign key is known up front and the whole
+    # dataset is a pure function of (counts, seed). Customer n logs in with password-{n % distinct_passwords};
+    # customer 1 is the admin account.
+    import app as application  # noqa: F401 - the admin is granted the permission method of every namespace
+    from api.auth import api_permissions
+    from model import City, Country, Customer, CustomerAddresses, Hotel, Permission, PermissionRoles, Role, \
+        Tour, TourAttraction, TouristAttraction, Transportation, VoucherCustomers, Vouchers
+
+    started_at = time.perf_counter()
+    passwords = [f'password-{index}' for index in range(min(distinct_passwords, counts['customers']) or 1)]
+    password_hashes = hash_passwords(passwords + [admin_password], password_rounds, workers)
+    admin_password_hash = password_hashes.pop()
+    stats = {'password_hashing': {'rows': len(passwords) + 1, 'seconds': time.perf_counter() - started_at}}
+
+    schedule = TourSchedule(counts, seed)
+    methods = sorted(api_permissions)
+    tables = [
+        (Role.__table__, [{'id': 1, 'name': 'admin'}, {'id': 2, 'name': 'user'}]),
+        (Permission.__table__, [{'id': index, 'method': method} for index, method in enumerate(methods, 1)]),
+        (PermissionRoles.__table__, [{'role_id': 1, 'permission_id': index} for index in range(1, len(methods) + 1)]),
+        (Country.__table__, generate_countries(counts, seed)),
+        (City.__table__, generate_cities(counts, seed)),
+        (Hotel.__table__, generate_hotels(counts, seed)),
+        (TouristAttraction.__table__, generate_tourist_attractions(counts, seed)),
+        (Tour.__table__, generate_tours(counts, seed, schedule)),
+        (TourAttraction.__table__, generate_tour_attractions(counts, seed)),
+        (Transportation.__table__, generate_transportation(counts, seed, schedule)),
+        (Customer.__table__, generate_customers(counts, seed, password_hashes, admin_username, admin_password_hash)),
+        (CustomerAddresses.__table__, generate_customer_addresses(counts, seed)),
+        (Vouchers.__table__, generate_vouchers(counts, seed, schedule)),
+        (VoucherCustomers.__table__, generate_voucher_customers(counts, seed, schedule))
+    ]
+
+    with engine.begin() as connection:
+        for table, rows in tables:
+            table_started_at = time.perf_counter()
+            inserted = insert_rows(connection, table, rows, chunk_size)
+            stats[table.name] = {'rows': inserted, 'seconds': time.perf_counter() - table_started_at}
+
+    total_rows = sum(table_stats['rows'] for name, table_stats in stats.items() if name != 'password_hashing')
+    total_seconds = time.perf_counter() - started_at
+    stats['total'] = {'rows': total_rows, 'seconds': total_seconds, 'rows_per_s': total_rows / total_seconds}
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seed a deterministic, referentially consistent dataset.')
+    parser.add_argument('--database-uri', help='defaults to the DATABASE_URI the app is configured with')
+    parser.add_argument('--customers', type=int, default=10000)
+    parser.add_argument('--tours', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--admin-username', default='admin')
+    parser.add_argument('--admin-password', default='admin')
+    parser.add_argument('--distinct-passwords', type=int, default=DEFAULT_DISTINCT_PASSWORDS)
+    parser.add_argument('--password-rounds', type=int, default=DEFAULT_PASSWORD_ROUNDS)
+    parser.add_argument('--workers', type=int, help='password hashing processes, defaults to the CPU count')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--reset', action='store_true', help='drop and recreate every table first')
+    args = parser.parse_args(argv)
+
+    from config import app, build_engine_options, db
+    if args.database_uri:
+        app.config['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(args.database_uri)
+    import app as application  # noqa: F401 - registers every namespace, and with it every permission method
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+        non_empty_tables = [table.name for table in db.metadata.sorted_tables
+                            if db.session.execute(table.select().limit(1)).first() is not None]
+        db.session.remove()
+        if non_empty_tables:
+            sys.exit(f'Refusing to seed non-empty tables {", ".join(non_empty_tables)}; use --reset.')
+
+        stats = seed_database(db.engine, scaled_counts(args.customers, args.tours), args.seed,
+                              args.admin_username, args.admin_password, args.distinct_passwords,
+                              args.password_rounds, args.workers, args.chunk_size)
+    json.dump(stats, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
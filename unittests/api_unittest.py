@@ -1,5 +1,8 @@
+import base64
+import json
 import unittest
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 from flask_testing import TestCase
 
@@ -25,6 +28,7 @@ HOTEL_API = '/hotels'
 VOUCHER_API = '/vouchers'
 ROLE_API = '/roles'
 PERMISSION_API = '/permissions'
+INTERNAL_API = '/internal'
 
 
 class BaseTestCase(TestCase):
@@ -113,6 +117,21 @@ class Test(BaseTestCase):
         self.assert_200(self.client.get(f'{CUSTOMER_API}/get',
                                         headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_get_customer_list__when_stream_requested__expect_ndjson(self):
+        response = self.client.get(f'{CUSTOMER_API}/get?stream=1',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.data.decode('utf8').splitlines()
+        assert all('username' in json.loads(line) for line in lines)
+
+    def test_get_voucher_list__when_ndjson_accepted__expect_ndjson(self):
+        response = self.client.get(f'{VOUCHER_API}/get',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER,
+                                            'Accept': 'application/x-ndjson'})
+        self.assert_200(response)
+        assert response.mimetype == 'application/x-ndjson'
+
     def test_update_customer__when_missed_authorization_header__expect_401(self):
         self.assert_401(self.client.put(f'{CUSTOMER_API}/1/update'))
 
@@ -159,6 +178,12 @@ class Test(BaseTestCase):
         self.assert_403(self.client.delete(f'{CUSTOMER_API}/1/delete',
                                            headers={AUTHORIZATION_HEADER: NON_ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_post_customer_batch__when_above_customer_batch_max_size__expect_400(self):
+        items = [{"username": uuid.uuid4().hex, "password_hash": "password"}] * (app.config['CUSTOMER_BATCH_MAX_SIZE'] + 1)
+        self.assert_400(self.client.post(f'{CUSTOMER_API}/batch',
+                                         headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                         json=items))
+
     def test_crud_customer(self):
         customer_creating_payload = {
             "username": uuid.uuid4().hex,
@@ -241,6 +266,42 @@ class Test(BaseTestCase):
                                             }),
                            409)
 
+    def test_update_customer__when_password_changed__expect_new_password_authenticates(self):
+        customer_payload = {
+            "username": uuid.uuid4().hex,
+            "first_name": "Julia",
+            "middle_name": "Bogdanivna",
+            "last_name": "Zanevych",
+            "phone": "0731213007",
+            "date_of_birthday": "2002-07-14",
+            "gender": "FEMALE",
+            "is_covid_vaccinated": True,
+            "is_blocked": False,
+            "password_hash": uuid.uuid4().hex,
+            "role_id": 1
+        }
+
+        create_response = self.client.post(f'{CUSTOMER_API}/post',
+                                           headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                           json=customer_payload)
+        self.assertStatus(create_response, 201)
+        customer_id = create_response.json['id']
+
+        customer_payload['password_hash'] = uuid.uuid4().hex
+        self.assert_200(self.client.put(f'{CUSTOMER_API}/{customer_id}/update',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                        json=customer_payload))
+
+        credentials = f"{customer_payload['username']}:{customer_payload['password_hash']}"
+        customer_authorization_header = 'Basic ' + base64.b64encode(credentials.encode('utf8')).decode('ascii')
+        response = self.client.get(f'{CUSTOMER_API}/{customer_id}/get',
+                                   headers={AUTHORIZATION_HEADER: customer_authorization_header})
+        assert response.status_code != 401
+
+        self.assertStatus(self.client.delete(f'{CUSTOMER_API}/{customer_id}/delete',
+                                             headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}),
+                          204)
+
     '''
     Unit tests for Countries
     '''
@@ -314,6 +375,53 @@ class Test(BaseTestCase):
         self.assert_200(self.client.get(f'{COUNTRY_API}/get',
                                         headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_get_country_list__when_invalid_limit__expect_400(self):
+        self.assert_400(self.client.get(f'{COUNTRY_API}/get?limit=0',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_country_list__when_non_integer_cursor__expect_400(self):
+        self.assert_400(self.client.get(f'{COUNTRY_API}/get?after=abc',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_country_list__when_paged__expect_pages_not_overlapping(self):
+        first_page_response = self.client.get(f'{COUNTRY_API}/get?limit=1',
+                                              headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(first_page_response)
+
+        first_page = first_page_response.json
+        assert len(first_page['items']) <= 1
+        if first_page['next_cursor'] is None:
+            return
+
+        second_page_response = self.client.get(f'{COUNTRY_API}/get?limit=1&after={first_page["next_cursor"]}',
+                                               headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(second_page_response)
+        assert second_page_response.json['items'][0]['id'] > first_page['items'][0]['id']
+
+    def test_get_country_list__when_etag_matches__expect_304(self):
+        response = self.client.get(f'{COUNTRY_API}/get', headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+
+        not_modified_response = self.client.get(f'{COUNTRY_API}/get', headers={
+            AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER, 'If-None-Match': response.headers['ETag']})
+        self.assertStatus(not_modified_response, 304)
+        assert not_modified_response.headers['ETag'] == response.headers['ETag']
+
+    def test_get_country_list__when_etag_matches_without_authorization__expect_401(self):
+        response = self.client.get(f'{COUNTRY_API}/get', headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_401(self.client.get(f'{COUNTRY_API}/get', headers={'If-None-Match': response.headers['ETag']}))
+
+    def test_get_country_list__when_country_created__expect_new_etag(self):
+        response = self.client.get(f'{COUNTRY_API}/get', headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assertStatus(self.client.post(f'{COUNTRY_API}/post', json={
+            'country_name': f'Country {uuid.uuid4().hex[:8]}', 'official_language': 'uk', 'population': '1',
+            'details': 1}, headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}), 201)
+
+        modified_response = self.client.get(f'{COUNTRY_API}/get', headers={
+            AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER, 'If-None-Match': response.headers['ETag']})
+        self.assert_200(modified_response)
+        assert modified_response.headers['ETag'] != response.headers['ETag']
+
     def test_update_country__when_missed_authorization_header__expect_401(self):
         self.assert_401(self.client.put(f'{COUNTRY_API}/1/update'))
 
@@ -413,6 +521,44 @@ class Test(BaseTestCase):
         self.assert_404(self.client.delete(f'{COUNTRY_API}/{country_id}/delete',
                                            headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_post_country_batch__when_missed_authorization_header__expect_401(self):
+        self.assert_401(self.client.post(f'{COUNTRY_API}/batch', json=[]))
+
+    def test_post_country_batch__when_non_admin_user__expect_403(self):
+        self.assert_403(self.client.post(f'{COUNTRY_API}/batch',
+                                         headers={AUTHORIZATION_HEADER: NON_ADMIN_AUTHORIZATION_HEADER},
+                                         json=[]))
+
+    def test_post_country_batch__when_not_array__expect_400(self):
+        self.assert_400(self.client.post(f'{COUNTRY_API}/batch',
+                                         headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                         json={"country_name": uuid.uuid4().hex}))
+
+    def test_post_country_batch__when_mixed_items__expect_per_item_results(self):
+        country_name = uuid.uuid4().hex
+        country_payload = {
+            "country_name": country_name,
+            "official_language": "Ukrainian",
+            "population": 45000000,
+            "details": 1
+        }
+
+        batch_response = self.client.post(f'{COUNTRY_API}/batch',
+                                          headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                          json=[country_payload, country_payload, {"country_name": uuid.uuid4().hex}])
+        self.assert_200(batch_response)
+
+        created, duplicated, invalid = batch_response.json
+        self.assertEqual(created['status'], 201)
+        self.assertEqual(duplicated['status'], 409)
+        self.assertEqual(invalid['status'], 400)
+
+        self.assert_200(self.client.get(f'{COUNTRY_API}/{created["id"]}/get',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+        self.assertStatus(self.client.delete(f'{COUNTRY_API}/{created["id"]}/delete',
+                                             headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}),
+                          204)
+
     def test_post_country__when_duplicated_country_name__expect_409(self):
         self.assert_status(self.client.post(f'{COUNTRY_API}/post',
                                             headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
@@ -497,6 +643,74 @@ class Test(BaseTestCase):
         self.assert_200(self.client.get(f'{TOUR_API}/get',
                                         headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_get_tour_list__when_admin_user__expect_tourist_attraction_ids(self):
+        response = self.client.get(f'{TOUR_API}/get',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        assert all(isinstance(item['tourist_attraction_ids'], list) for item in response.json['items'])
+
+    def test_search_tours__when_missed_authorization_header__expect_401(self):
+        self.assert_401(self.client.get(f'{TOUR_API}/search'))
+
+    def test_search_tours__when_invalid_sort__expect_400(self):
+        self.assert_400(self.client.get(f'{TOUR_API}/search?sort=name',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_search_tours__when_invalid_date__expect_400(self):
+        self.assert_400(self.client.get(f'{TOUR_API}/search?start_time=19-09-2021',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_search_tours__when_invalid_cursor__expect_400(self):
+        self.assert_400(self.client.get(f'{TOUR_API}/search?after=abc',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_search_tours__when_cursor_value_not_scalar__expect_400(self):
+        for value in ([1], {'price': 1}, True, '100'):
+            cursor = base64.urlsafe_b64encode(json.dumps([value, 1]).encode('utf8')).decode('ascii')
+            self.assert_400(self.client.get(f'{TOUR_API}/search?sort=price&after={cursor}',
+                                            headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_search_tours__when_filtered__expect_matching_tours_in_order(self):
+        response = self.client.get(f'{TOUR_API}/search?min_price=100&max_price=5000&min_person_count=1&sort=-price',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        prices = [item['price'] for item in response.json['items']]
+        assert all(100 <= price <= 5000 for price in prices)
+        assert all(item['person_count'] >= 1 for item in response.json['items'])
+        assert prices == sorted(prices, reverse=True)
+
+    def test_search_tours__when_paged__expect_pages_not_overlapping(self):
+        first_page_response = self.client.get(f'{TOUR_API}/search?sort=start_time&limit=1',
+                                              headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(first_page_response)
+
+        first_page = first_page_response.json
+        if first_page['next_cursor'] is None:
+            return
+
+        second_page_response = self.client.get(
+            f'{TOUR_API}/search?sort=start_time&limit=1&after={first_page["next_cursor"]}',
+            headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(second_page_response)
+        first_tour, second_tour = first_page['items'][0], second_page_response.json['items'][0]
+        assert (second_tour['start_time'], second_tour['id']) > (first_tour['start_time'], first_tour['id'])
+
+    def test_get_tours__when_fields_requested__expect_only_these_fields(self):
+        response = self.client.get(f'{TOUR_API}/get?fields=name,price,seats_left',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        assert all(set(item) == {'id', 'name', 'price', 'seats_left'} for item in response.json['items'])
+
+    def test_get_tours__when_unknown_field_requested__expect_400(self):
+        self.assert_400(self.client.get(f'{TOUR_API}/get?fields=name,password_hash',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_customer__when_fields_requested__expect_only_these_fields(self):
+        response = self.client.get(f'{CUSTOMER_API}/1/get?fields=username',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        assert set(response.json) == {'id', 'username'}
+
     def test_update_tour__when_missed_authorization_header__expect_401(self):
         self.assert_401(self.client.put(f'{TOUR_API}/1/update'))
 
@@ -612,6 +826,43 @@ class Test(BaseTestCase):
         self.assert_404(self.client.delete(f'{TOUR_API}/{tour_id}/delete',
                                            headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_update_tour__when_tourist_attraction_ids_missed__expect_links_kept(self):
+        tour_payload = {
+            "name": uuid.uuid4().hex,
+            "price": 300,
+            "person_count": 3,
+            "start_time": "2021-09-19",
+            "end_time": "2021-09-25",
+            "description": "Cool tour on Egypt",
+            "recommended_pocket_money": 150,
+            "tourist_attraction_ids": [
+                1,
+                2
+            ]
+        }
+
+        create_response = self.client.post(f'{TOUR_API}/post',
+                                           headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                           json=tour_payload)
+        self.assertStatus(create_response, 201)
+        tour_id = create_response.json['id']
+
+        del tour_payload['tourist_attraction_ids']
+        tour_payload['price'] = 590
+        self.assert_200(self.client.put(f'{TOUR_API}/{tour_id}/update',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                        json=tour_payload))
+
+        get_response = self.client.get(f'{TOUR_API}/{tour_id}/get',
+                                       headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(get_response)
+        assert get_response.json['price'] == 590
+        assert sorted(get_response.json['tourist_attraction_ids']) == [1, 2]
+
+        self.assertStatus(self.client.delete(f'{TOUR_API}/{tour_id}/delete',
+                                             headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}),
+                          204)
+
     def test_post_tour__when_duplicated_name__expect_409(self):
         self.assert_status(self.client.post(f'{TOUR_API}/post',
                                             headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
@@ -804,6 +1055,36 @@ class Test(BaseTestCase):
         self.assert_404(self.client.delete(f'{TOURISR_ATTRACTION_API}/{tourist_attraction_id}/delete',
                                            headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_update_tourist_attraction__when_city_id_changed__expect_city_id_stored(self):
+        create_response = self.client.post(f'{TOURISR_ATTRACTION_API}/post',
+                                           headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                           json={
+                                               "name": uuid.uuid4().hex[:32],
+                                               "type": "EXCURSION",
+                                               "city_id": 1,
+                                               "details": "Curious tour of the underground city"
+                                           })
+        self.assertStatus(create_response, 201)
+        tourist_attraction_id = create_response.json['id']
+
+        self.assert_200(self.client.put(f'{TOURISR_ATTRACTION_API}/{tourist_attraction_id}/update',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                        json={
+                                            "name": uuid.uuid4().hex[:32],
+                                            "type": "EXCURSION",
+                                            "city_id": 2,
+                                            "details": "Curious tour of the underground city"
+                                        }))
+
+        get_response = self.client.get(f'{TOURISR_ATTRACTION_API}/{tourist_attraction_id}/get',
+                                       headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(get_response)
+        assert get_response.json['city_id'] == 2
+
+        self.assertStatus(self.client.delete(f'{TOURISR_ATTRACTION_API}/{tourist_attraction_id}/delete',
+                                             headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}),
+                          204)
+
     '''
     Unit tests for Cities
     '''
@@ -877,6 +1158,45 @@ class Test(BaseTestCase):
         self.assert_200(self.client.get(f'{CITY_API}/get',
                                         headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_get_nearby_cities__when_missed_authorization_header__expect_401(self):
+        self.assert_401(self.client.get(f'{CITY_API}/nearby?lat=49.84&lon=24.03&radius_km=100'))
+
+    def test_get_nearby_cities__when_missed_radius__expect_400(self):
+        self.assert_400(self.client.get(f'{CITY_API}/nearby?lat=49.84&lon=24.03',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_nearby_cities__when_invalid_latitude__expect_400(self):
+        self.assert_400(self.client.get(f'{CITY_API}/nearby?lat=91&lon=24.03&radius_km=100',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_nearby_cities__when_admin_user__expect_cities_within_radius_nearest_first(self):
+        response = self.client.get(f'{CITY_API}/nearby?lat=49.84&lon=24.03&radius_km=500',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        distances = [item['distance_km'] for item in response.json['items']]
+        assert all(distance <= 500 for distance in distances)
+        assert distances == sorted(distances)
+
+    def test_get_nearby_cities__when_limit_out_of_range__expect_400(self):
+        self.assert_400(self.client.get(f'{CITY_API}/nearby?lat=49.84&lon=24.03&radius_km=500&limit=0',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_nearby_cities__when_limit_given__expect_at_most_limit_cities_nearest_first(self):
+        response = self.client.get(f'{CITY_API}/nearby?lat=49.84&lon=24.03&radius_km=20000&limit=2',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        distances = [item['distance_km'] for item in response.json['items']]
+        assert len(distances) <= 2
+        assert distances == sorted(distances)
+
+    def test_get_nearest_cities__when_admin_user__expect_at_most_k_cities_nearest_first(self):
+        response = self.client.get(f'{CITY_API}/nearest?lat=49.84&lon=24.03&k=3',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        distances = [item['distance_km'] for item in response.json['items']]
+        assert len(distances) <= 3
+        assert distances == sorted(distances)
+
     def test_update_city__when_missed_authorization_header__expect_401(self):
         self.assert_401(self.client.put(f'{CITY_API}/1/update'))
 
@@ -978,6 +1298,38 @@ class Test(BaseTestCase):
         self.assert_404(self.client.delete(f'{CITY_API}/{city_id}/delete',
                                            headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_update_city__when_country_id_changed__expect_country_id_stored(self):
+        create_response = self.client.post(f'{CITY_API}/post',
+                                           headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                           json={
+                                               "city_name": "Lviv",
+                                               "country_id": 1,
+                                               "city_latitude": 18,
+                                               "city_longitude": 23,
+                                               "details": "One of the most beautiful cities of Ukraine"
+                                           })
+        self.assertStatus(create_response, 201)
+        city_id = create_response.json['id']
+
+        self.assert_200(self.client.put(f'{CITY_API}/{city_id}/update',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                        json={
+                                            "city_name": "Lviv",
+                                            "country_id": 2,
+                                            "city_latitude": 18,
+                                            "city_longitude": 23,
+                                            "details": "One of the most beautiful cities of Ukraine"
+                                        }))
+
+        get_response = self.client.get(f'{CITY_API}/{city_id}/get',
+                                       headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(get_response)
+        assert get_response.json['country_id'] == 2
+
+        self.assertStatus(self.client.delete(f'{CITY_API}/{city_id}/delete',
+                                             headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}),
+                          204)
+
     '''
     Unit tests for Transportations
     '''
@@ -1051,6 +1403,52 @@ class Test(BaseTestCase):
         self.assert_200(self.client.get(f'{TRANSPORTATION_API}/get',
                                         headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_get_transportation_routes__when_missed_authorization_header__expect_401(self):
+        self.assert_401(self.client.get(f'{TRANSPORTATION_API}/routes?from=1&to=2'))
+
+    def test_get_transportation_routes__when_missed_destination__expect_400(self):
+        self.assert_400(self.client.get(f'{TRANSPORTATION_API}/routes?from=1',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_transportation_routes__when_invalid_depart_after__expect_400(self):
+        self.assert_400(self.client.get(f'{TRANSPORTATION_API}/routes?from=1&to=2&depart_after=tomorrow',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_transportation_routes__when_new_leg_created__expect_it_in_itineraries(self):
+        transportation_creating_payload = {
+            "tour_id": 1,
+            "transport_type": "PLANE",
+            "start_time": "2099-09-19",
+            "end_time": "2099-09-20",
+            "start_city_id": 1,
+            "end_city_id": 2,
+            "details": "Plane is power!!!"
+        }
+
+        create_response = self.client.post(f'{TRANSPORTATION_API}/post',
+                                           headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                           json=transportation_creating_payload)
+        self.assertStatus(create_response, 201)
+        transportation_id = create_response.json['id']
+
+        response = self.client.get(f'{TRANSPORTATION_API}/routes?from=1&to=2&depart_after=2099-09-19',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        itineraries = response.json['itineraries']
+        assert [leg['id'] for leg in itineraries[0]['legs']] == [transportation_id]
+        assert [itinerary['leg_count'] for itinerary in itineraries] == sorted(
+            itinerary['leg_count'] for itinerary in itineraries)
+
+        self.assertStatus(self.client.delete(f'{TRANSPORTATION_API}/{transportation_id}/delete',
+                                             headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}),
+                          204)
+
+        response = self.client.get(f'{TRANSPORTATION_API}/routes?from=1&to=2&depart_after=2099-09-19',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        assert transportation_id not in [leg['id'] for itinerary in response.json['itineraries']
+                                         for leg in itinerary['legs']]
+
     def test_update_transportation__when_missed_authorization_header__expect_401(self):
         self.assert_401(self.client.put(f'{TRANSPORTATION_API}/1/update'))
 
@@ -1424,6 +1822,18 @@ class Test(BaseTestCase):
         self.assert_200(self.client.get(f'{HOTEL_API}/get',
                                         headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_get_nearest_hotels__when_invalid_k__expect_400(self):
+        self.assert_400(self.client.get(f'{HOTEL_API}/nearest?lat=49.84&lon=24.03&k=0',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_nearest_hotels__when_admin_user__expect_at_most_k_hotels_nearest_first(self):
+        response = self.client.get(f'{HOTEL_API}/nearest?lat=49.84&lon=24.03&k=3',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        distances = [item['distance_km'] for item in response.json['items']]
+        assert len(distances) <= 3
+        assert distances == sorted(distances)
+
     def test_update_hotel__when_missed_authorization_header__expect_401(self):
         self.assert_401(self.client.put(f'{HOTEL_API}/1/update'))
 
@@ -1598,6 +2008,12 @@ class Test(BaseTestCase):
         self.assert_200(self.client.get(f'{VOUCHER_API}/get',
                                         headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_get_voucher_list__when_admin_user__expect_customer_ids(self):
+        response = self.client.get(f'{VOUCHER_API}/get',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        assert all(isinstance(item['customer_ids'], list) for item in response.json['items'])
+
     def test_update_voucher__when_missed_authorization_header__expect_401(self):
         self.assert_401(self.client.put(f'{VOUCHER_API}/1/update'))
 
@@ -1703,6 +2119,100 @@ class Test(BaseTestCase):
         self.assert_404(self.client.delete(f'{VOUCHER_API}/{voucher_id}/delete',
                                            headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_voucher_seats__when_tour_is_full__expect_409_and_booked_count_on_tour(self):
+        tour_payload = {
+            "name": uuid.uuid4().hex,
+            "price": 300,
+            "person_count": 2,
+            "start_time": "2021-09-19",
+            "end_time": "2021-09-25",
+            "description": "Cool tour on Egypt",
+            "recommended_pocket_money": 150
+        }
+
+        tour_id = self.client.post(f'{TOUR_API}/post',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                   json=tour_payload).json['id']
+
+        self.assertStatus(self.client.post(f'{VOUCHER_API}/post',
+                                           headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                           json={"tour_id": tour_id, "customer_ids": [1, 2, 3]}),
+                          409)
+
+        create_response = self.client.post(f'{VOUCHER_API}/post',
+                                           headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                           json={"tour_id": tour_id, "customer_ids": [1, 2]})
+        self.assertStatus(create_response, 201)
+        voucher_id = create_response.json['id']
+
+        get_response = self.client.get(f'{TOUR_API}/{tour_id}/get',
+                                       headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        assert get_response.json['booked_count'] == 2
+        assert get_response.json['seats_left'] == 0
+
+        self.assertStatus(self.client.put(f'{TOUR_API}/{tour_id}/update',
+                                          headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                          json={**tour_payload, "person_count": 1}),
+                          409)
+
+        self.assertStatus(self.client.delete(f'{VOUCHER_API}/{voucher_id}/delete',
+                                             headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}),
+                          204)
+
+        get_response = self.client.get(f'{TOUR_API}/{tour_id}/get',
+                                       headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        assert get_response.json['booked_count'] == 0
+
+        self.assertStatus(self.client.delete(f'{TOUR_API}/{tour_id}/delete',
+                                             headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}),
+                          204)
+
+    def test_voucher_seats__when_booked_concurrently__expect_no_overbooking(self):
+        tour_id = self.client.post(f'{TOUR_API}/post',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                   json={
+                                       "name": uuid.uuid4().hex,
+                                       "price": 300,
+                                       "person_count": 3,
+                                       "start_time": "2021-09-19",
+                                       "end_time": "2021-09-25",
+                                       "description": "Cool tour on Egypt",
+                                       "recommended_pocket_money": 150
+                                   }).json['id']
+
+        def book(customer_id):
+            return app.test_client().post(f'{VOUCHER_API}/post',
+                                          headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                          json={"tour_id": tour_id, "customer_ids": [customer_id]})
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(book, range(1, 9)))
+
+        assert sorted(response.status_code for response in responses) == [201] * 3 + [409] * 5
+
+        get_response = self.client.get(f'{TOUR_API}/{tour_id}/get',
+                                       headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        assert get_response.json['booked_count'] == 3
+
+        for response in responses:
+            if response.status_code == 201:
+                self.assertStatus(self.client.delete(f'{VOUCHER_API}/{response.json["id"]}/delete',
+                                                     headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}),
+                                  204)
+
+    def test_voucher_seats__when_tour_does_not_exist__expect_409_no_such_father_row(self):
+        create_response = self.client.post(f'{VOUCHER_API}/post',
+                                           headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                           json={"tour_id": 2147483647, "customer_ids": [1]})
+        self.assertStatus(create_response, 409)
+        assert create_response.json['message'] == 'There is no such father row!!'
+
+        batch_response = self.client.post(f'{VOUCHER_API}/batch',
+                                          headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                          json=[{"tour_id": 2147483647, "customer_ids": [1]}])
+        self.assertStatus(batch_response, 200)
+        assert batch_response.json[0]['message'] == 'There is no such father row!!'
+
     '''
     Unit tests for Permissions
     '''
@@ -1942,6 +2452,12 @@ class Test(BaseTestCase):
         self.assert_200(self.client.get(f'{ROLE_API}/get',
                                         headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    def test_get_role_list__when_admin_user__expect_permission_ids(self):
+        response = self.client.get(f'{ROLE_API}/get',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        assert all(isinstance(item['permission_ids'], list) for item in response.json['items'])
+
     def test_update_role__when_missed_authorization_header__expect_401(self):
         self.assert_401(self.client.put(f'{ROLE_API}/1/update'))
 
@@ -2072,6 +2588,236 @@ class Test(BaseTestCase):
         self.assert_404(self.client.delete(f'{ROLE_API}/{role_id}/delete',
                                            headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
 
+    '''
+    Unit tests for Internal statistics
+    '''
+
+    def test_get_auth_cache_stats__when_missed_authorization_header__expect_401(self):
+        self.assert_401(self.client.get(f'{INTERNAL_API}/auth-cache'))
+
+    def test_get_auth_cache_stats__when_invalid_payload_authorization_header__expect_401(self):
+        self.assert_401(self.client.get(f'{INTERNAL_API}/auth-cache',
+                                        headers={AUTHORIZATION_HEADER: INVALID_PAYLOAD_AUTHORIZATION_HEADER}))
+
+    def test_get_auth_cache_stats__when_non_admin_user__expect_403(self):
+        self.assert_403(self.client.get(f'{INTERNAL_API}/auth-cache',
+                                        headers={AUTHORIZATION_HEADER: NON_ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_auth_cache_stats__when_repeated_admin_calls__expect_cache_hits(self):
+        first_response = self.client.get(f'{INTERNAL_API}/auth-cache',
+                                         headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(first_response)
+
+        second_response = self.client.get(f'{INTERNAL_API}/auth-cache',
+                                          headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(second_response)
+        assert second_response.json['hits'] > first_response.json['hits']
+
+    def test_credential_cache__when_customer_revoked__expect_only_their_entries_dropped(self):
+        from api.auth import CredentialCache, revoke_credentials
+        from config import db
+
+        cache = CredentialCache(10, 300, 60)
+        version = cache.sync_revocations()
+        cache.put('revoked', 1, 1, version)
+        cache.put('kept', 2, 1, version)
+        revoke_credentials(1)
+        db.session.commit()
+
+        cache.sync_revocations()
+        assert cache.get('revoked') is None
+        assert cache.get('kept') == (2, 1)
+
+    def test_update_customer__when_password_missing__expect_400(self):
+        self.assert_400(self.client.put(f'{CUSTOMER_API}/1/update',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER},
+                                        json={"username": uuid.uuid4().hex, "role_id": 1}))
+
+    def test_get_db_pool_stats__when_missed_authorization_header__expect_401(self):
+        self.assert_401(self.client.get(f'{INTERNAL_API}/db-pool'))
+
+    def test_get_db_pool_stats__when_non_admin_user__expect_403(self):
+        self.assert_403(self.client.get(f'{INTERNAL_API}/db-pool',
+                                        headers={AUTHORIZATION_HEADER: NON_ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_db_pool_stats__when_admin_user__expect_pool_usage(self):
+        response = self.client.get(f'{INTERNAL_API}/db-pool',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        assert response.json['checked_out'] >= 0
+        assert response.json['wait_max_ms'] >= 0
+
+    def test_get_route_timings__when_missed_authorization_header__expect_401(self):
+        self.assert_401(self.client.get(f'{INTERNAL_API}/timings'))
+
+    def test_get_route_timings__when_non_admin_user__expect_403(self):
+        self.assert_403(self.client.get(f'{INTERNAL_API}/timings',
+                                        headers={AUTHORIZATION_HEADER: NON_ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_route_timings__when_admin_user__expect_200(self):
+        self.assert_200(self.client.get(f'{INTERNAL_API}/timings',
+                                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_metrics__when_missed_authorization_header__expect_401(self):
+        self.assert_401(self.client.get('/metrics'))
+
+    def test_get_metrics__when_non_admin_user__expect_403(self):
+        self.assert_403(self.client.get('/metrics', headers={AUTHORIZATION_HEADER: NON_ADMIN_AUTHORIZATION_HEADER}))
+
+    def test_get_metrics__when_requests_served__expect_prometheus_counters(self):
+        self.client.get(f'{COUNTRY_API}/get', headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+
+        response = self.client.get('/metrics', headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(response)
+        body = response.data.decode()
+        assert 'http_requests_total{namespace="countries",method="GET",status="200"}' in body
+        assert 'http_request_duration_seconds_bucket{namespace="countries",method="GET",le="+Inf"}' in body
+        assert 'http_requests_in_flight' in body
+        assert 'auth_cache_hit_ratio' in body
+
+    '''
+    Unit tests for compiled serializers
+    '''
+
+    def test_compiled_serializers__when_dumping_stored_rows__expect_marshmallow_output(self):
+        from model import Customer, Tour, Transportation
+        from schema import customers_schema_get, tours_schema, transportations_schema
+
+        for model, schema in ((Customer, customers_schema_get), (Tour, tours_schema),
+                              (Transportation, transportations_schema)):
+            rows = model.query.limit(50).all()
+            assert json.dumps(schema.dump(rows), sort_keys=True) == \
+                json.dumps(schema.marshmallow_dump(rows), sort_keys=True)
+
+    '''
+    Unit tests for JSON backends
+    '''
+
+    def test_json_backend__when_encoding_list_page__expect_stdlib_bytes(self):
+        from flask import jsonify
+        from model import Tour
+        from schema import tours_schema
+
+        payload = {'items': tours_schema.dump(Tour.query.limit(50).all()), 'next_cursor': None,
+                   'edge_cases': [1e-05, 1.5e-06, 4.5e16, 1e22, float('nan'), float('inf'), 2 ** 70, 'Київ',
+                                  {'nested': [0.1, -0.0, 9999999999999998.0]}]}
+        expected = json.dumps(payload, separators=(',', ':'), sort_keys=True) + '\n'
+        assert app.config['JSON_BACKEND'] in ('orjson', 'stdlib')
+        assert jsonify(payload).get_data(as_text=True) == expected
+
+    '''
+    Unit tests for reference data caches
+    '''
+
+    def test_reference_cache__when_limits_exceeded__expect_least_recently_used_evicted(self):
+        from cache import ReadThroughCache
+
+        cache = ReadThroughCache('test', lambda key: {'id': key, 'name': 'x' * 10}, lambda: 1, 3, 100)
+        for key in range(4):
+            cache.get(key)
+        assert cache.stats()['size'] == 3
+        assert cache.stats()['evictions'] == 1
+
+        cache.get(100)
+        cache.get(101)
+        assert cache.stats()['bytes'] <= 100
+
+    def test_reference_cache__when_version_bumped__expect_reload(self):
+        from cache import ReadThroughCache
+
+        version = [1]
+        cache = ReadThroughCache('test', lambda key: {'id': key, 'version': version[0]}, lambda: version[0], 10, 1000)
+        assert cache.get(1)['version'] == 1
+        assert cache.get(1)['version'] == 1
+        version[0] = 2
+        assert cache.get(1)['version'] == 2
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 2
+
+    def test_get_country_by_id__when_requested_twice__expect_cache_hit(self):
+        response = self.client.get(f'{COUNTRY_API}/get', headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        country_id = response.json['items'][0]['id']
+
+        first = self.client.get(f'{COUNTRY_API}/{country_id}/get',
+                                headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        stats = self.client.get(f'{INTERNAL_API}/reference-caches',
+                                headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        second = self.client.get(f'{COUNTRY_API}/{country_id}/get',
+                                 headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        second_stats = self.client.get(f'{INTERNAL_API}/reference-caches',
+                                       headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(second)
+        assert first.json == second.json
+        hits = {cache['name']: cache['hits'] for cache in stats.json}
+        second_hits = {cache['name']: cache['hits'] for cache in second_stats.json}
+        assert second_hits['countries'] == hits['countries'] + 1
+
+    def test_get_reference_cache_stats__when_non_admin_user__expect_403(self):
+        self.assert_403(self.client.get(f'{INTERNAL_API}/reference-caches',
+                                        headers={AUTHORIZATION_HEADER: NON_ADMIN_AUTHORIZATION_HEADER}))
+
+    '''
+    Unit tests for response cache
+    '''
+
+    def test_get_countries__when_requested_twice__expect_cached_body(self):
+        first = self.client.get(f'{COUNTRY_API}/get?limit=5', headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        stats = self.client.get(f'{INTERNAL_API}/response-cache',
+                                headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        second = self.client.get(f'{COUNTRY_API}/get?limit=5', headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        second_stats = self.client.get(f'{INTERNAL_API}/response-cache',
+                                       headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.assert_200(second)
+        assert first.data == second.data
+        assert first.headers['ETag'] == second.headers['ETag']
+        assert second_stats.json['hits'] == stats.json['hits'] + 1
+
+    def test_get_countries__when_country_updated__expect_fresh_body(self):
+        response = self.client.get(f'{COUNTRY_API}/get?limit=1', headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        country = response.json['items'][0]
+        details = 1 if country['details'] != 1 else 2
+
+        self.client.put(f'{COUNTRY_API}/{country["id"]}/update', json={**country, 'details': details},
+                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        updated = self.client.get(f'{COUNTRY_API}/get?limit=1', headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        self.client.put(f'{COUNTRY_API}/{country["id"]}/update', json=country,
+                        headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+
+        assert updated.json['items'][0]['details'] == details
+        assert updated.headers['ETag'] != response.headers['ETag']
+
+    '''
+    Unit tests for response compression
+    '''
+
+    def test_get_tours__when_gzip_accepted__expect_compressed_body(self):
+        import gzip
+
+        plain = self.client.get(f'{TOUR_API}/get', headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER})
+        app.config['COMPRESSION_MIN_SIZE'] = 0
+        try:
+            response = self.client.get(f'{TOUR_API}/get', headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER,
+                                                                   'Accept-Encoding': 'gzip'})
+        finally:
+            app.config['COMPRESSION_MIN_SIZE'] = 1024
+        self.assert_200(response)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert gzip.decompress(response.data) == plain.data
+
+    def test_get_tours__when_body_below_min_size__expect_uncompressed(self):
+        response = self.client.get(f'{TOUR_API}/get?limit=1&fields=id',
+                                   headers={AUTHORIZATION_HEADER: ADMIN_AUTHORIZATION_HEADER, 'Accept-Encoding': 'gzip'})
+        self.assert_200(response)
+        assert 'Content-Encoding' not in response.headers
+
+    def test_compress__when_deflate__expect_zlib_round_trip(self):
+        import zlib
+        from compression import compress
+
+        body = json.dumps([{'id': id, 'name': 'tour'} for id in range(1000)]).encode()
+        assert zlib.decompress(compress(body, 'deflate')) == body
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,198 @@
+import threading
+import time
+
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from config import app, db
+from model import TableVersion
+
+
+def get_version(name):
+    version = db.session.query(TableVersion.version).filter_by(name=name).scalar()
+    return version or 0
+
+
+def get_versions():
+    return dict(db.session.query(TableVersion.name, TableVersion.version))
+
+
+def mark_written(name):
+    # For a counter the transaction does not write a table of the same name for; it is bumped with the written
+    # tables once the transaction commits.
+    db.session.info.setdefault('written_tables', set()).add(name)
+
+
+def committed_version(name):
+    # What the last commit of this session bumped the counter to, or None when that commit did not write it or was
+    # rolled back.
+    return db.session.info.get('committed_versions', {}).get(name)
+
+
+class TableVersions:
+    # name -> version of every counter, as this worker last saw it. Commits in this worker update it right away;
+    # writes from other workers show up after at most check_interval_seconds, when one query reloads all counters.
+    def __init__(self, check_interval_seconds):
+        self.check_interval_seconds = check_interval_seconds
+        self._versions = {}
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        versions = get_versions()
+        with self._lock:
+            for name, version in versions.items():
+                if version > self._versions.get(name, 0):
+                    self._versions[name] = version
+            self._checked_at = time.monotonic()
+
+    def update(self, versions):
+        with self._lock:
+            for name, version in versions.items():
+                if version > self._versions.get(name, 0):
+                    self._versions[name] = version
+
+    def get(self, names):
+        if self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval_seconds:
+            self.load()
+        versions = self._versions
+        return tuple(versions.get(name, 0) for name in names)
+
+
+table_versions = TableVersions(app.config['TABLE_VERSION_CHECK_INTERVAL_SECONDS'])
+
+
+def _increment(connection, name):
+    table = TableVersion.__table__
+    if not connection.execute(table.update().where(table.c.name == name).values(version=table.c.version + 1)).rowcount:
+        return None
+    return connection.execute(select(table.c.version).where(table.c.name == name)).scalar()
+
+
+def bump_versions(names):
+    # Runs after the writes it tracks have committed, in its own short transaction taking the counter row locks in
+    # name order, so writers of the same table only queue for these few statements and never deadlock on them.
+    # A reader between the commit and the bump caches new rows under the old version, which the bump then retires.
+    table = TableVersion.__table__
+    names = sorted(names)
+    with db.engine.begin() as connection:
+        versions = {name: _increment(connection, name) for name in names}
+    for name in [name for name in names if versions[name] is None]:
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(table.insert().values(name=name, version=1))
+            versions[name] = 1
+        except IntegrityError:  # another worker created the counter first
+            with db.engine.begin() as connection:
+                versions[name] = _increment(connection, name)
+    table_versions.update(versions)
+    return versions
+
+
+def _record_table_write(conn, cursor, statement, parameters, context, executemany):
+    # Every INSERT, UPDATE and DELETE compiled by SQLAlchemy (ORM flushes, query.update/delete, bulk and Core
+    # inserts alike) marks its table as written on the connection running the transaction.
+    if context is None or context.compiled is None:
+        return
+    if not (context.isinsert or context.isupdate or context.isdelete):
+        return
+    name = context.compiled.statement.table.name
+    if name != TableVersion.__tablename__:
+        conn.info.setdefault('written_tables', set()).add(name)
+
+
+def _forget_table_writes(conn):
+    conn.info.pop('written_tables', None)
+
+
+def _track_session_writes(session, transaction, connection):
+    # after_begin: writes on the session's connection land in the session's own set, which mark_written adds to.
+    connection.info['written_tables'] = session.info.setdefault('written_tables', set())
+
+
+def _clear_committed_versions(session):
+    session.info['committed_versions'] = {}
+
+
+def _hold_committed_writes(session):
+    session.info['committed_tables'] = session.info.pop('written_tables', set())
+
+
+def _bump_committed_writes(session, transaction):
+    # after_transaction_end fires once the session has handed its connection back, so the bump never holds two.
+    if transaction.parent is not None:
+        return
+    committed_tables = session.info.pop('committed_tables', None)
+    if not committed_tables:
+        return
+    try:
+        session.info['committed_versions'] = bump_versions(committed_tables)
+    except SQLAlchemyError:
+        # The write itself is committed; other workers catch up at the next bump of these tables.
+        app.logger.exception('Failed to bump table versions of %s', ', '.join(sorted(committed_tables)))
+
+
+def _discard_writes(session):
+    session.info.pop('written_tables', None)
+    session.info['committed_versions'] = {}
+
+
+event.listen(Engine, 'after_cursor_execute', _record_table_write)
+event.listen(Engine, 'commit', _forget_table_writes)
+event.listen(Engine, 'rollback', _forget_table_writes)
+event.listen(db.session, 'after_begin', _track_session_writes)
+event.listen(db.session, 'before_commit', _clear_committed_versions)
+event.listen(db.session, 'after_commit', _hold_committed_writes)
+event.listen(db.session, 'after_transaction_end', _bump_committed_writes)
+event.listen(db.session, 'after_rollback', _discard_writes)
+
+
+class VersionedIndex:
+    # In-process read model of a table kept in sync with its TableVersion counter: writers bump the version in their
+    # transaction and call refresh() after commit to patch this worker's copy; other workers notice the new version
+    # on their next periodic check and reload. Subclasses implement _rebuild() and _apply(ids), both run under lock.
+    def __init__(self, version_name, check_interval_seconds):
+        self.version_name = version_name
+        self.check_interval_seconds = check_interval_seconds
+        self.version = None
+        self.is_loaded = False
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def _rebuild(self):
+        raise NotImplementedError
+
+    def _apply(self, ids):
+        raise NotImplementedError
+
+    def load(self):
+        with self._lock:
+            version = get_version(self.version_name)
+            self._rebuild()
+            self.version = version
+            self.is_loaded = True
+            self._checked_at = time.monotonic()
+
+    def ensure_fresh(self):
+        if not self.is_loaded:
+            self.load()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval_seconds:
+            return
+        self._checked_at = now
+        if get_version(self.version_name) != self.version:
+            self.load()
+
+    def refresh(self, ids, version):
+        # `version` is what the committed write bumped the counter to; anything but the next consecutive version
+        # means another worker wrote in between, so a full reload is required. None means nothing was committed.
+        if version is None:
+            return
+        if not self.is_loaded or version != self.version + 1:
+            self.load()
+            return
+        with self._lock:
+            self._apply(ids)
+            self.version = version